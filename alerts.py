@@ -0,0 +1,535 @@
+import os
+import json
+import math
+import time
+import hashlib
+import uuid
+import logging
+import operator
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+__all__ = ["DEFAULT_RULES", "RuleEngine", "compile_rule", "load_rules"]
+
+logger = logging.getLogger(__name__)
+
+# Declarative rules; ALERT_RULES (JSON list) overrides by id, "enabled": false drops one.
+#   threshold: field op value, cleared once the condition no longer holds for `clear`
+#   rate:      d(field)/dt (per second, over at least `window` s) op value, same hysteresis
+#   geofence:  polygon [[lat, lon], ...]; "mode": "outside" alerts when leaving a
+#              keep-in area, "inside" when entering a no-fly zone
+DEFAULT_RULES: List[Dict[str, Any]] = [
+    {"id": "battery_low", "type": "threshold", "field": "battery_percent", "op": "<", "value": 20, "clear": 25,
+     "level": "warning", "message": "Battery low: {value:.0f}%"},
+    {"id": "battery_critical", "type": "threshold", "field": "battery_percent", "op": "<", "value": 10, "clear": 12,
+     "level": "critical", "message": "Battery critical: {value:.0f}%"},
+    {"id": "altitude_max", "type": "threshold", "field": "altitude", "op": ">", "value": 120, "clear": 115,
+     "level": "warning", "message": "Altitude {value:.1f} m above the {threshold} m limit"},
+    {"id": "descent_rate", "type": "rate", "field": "altitude", "op": "<", "value": -5, "clear": -3, "window": 1.0,
+     "level": "warning", "message": "Descending at {value:.1f} m/s"},
+]
+
+_OPS: Dict[str, Callable[[Any, Any], bool]] = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+LEVELS = ("info", "warning", "error", "critical")
+
+
+class _Template(dict):
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+
+def _format(template: str, values: Dict[str, Any]) -> str:
+    try:
+        return template.format_map(_Template(values))
+    except (ValueError, TypeError):
+        # numeric format spec applied to a non-number: fall back to plain values
+        return template.format_map(_Template({k: str(v) for k, v in values.items()}))
+
+
+# --------------------------------------------------
+# COMPILED RULES
+# --------------------------------------------------
+class _Rule:
+    """Common fields; subclasses implement condition(vehicle, values, ts, memory)."""
+
+    kind = ""
+    fields: Tuple[str, ...] = ()
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.id = str(spec["id"])
+        self.level = str(spec.get("level", "warning")).lower()
+        if self.level not in LEVELS:
+            raise ValueError(f"Rule {self.id}: unknown level {self.level!r}")
+        self.message = str(spec.get("message", "{rule} on {vehicle}"))
+        vehicles = spec.get("vehicles")
+        self.vehicles: Optional[Set[str]] = set(vehicles) if vehicles else None
+        self.spec = spec
+
+    def describe(self) -> Dict[str, Any]:
+        return {**self.spec, "fields": list(self.fields)}
+
+
+class _Comparison(_Rule):
+    def __init__(self, spec: Dict[str, Any]):
+        super().__init__(spec)
+        self.field = str(spec["field"])
+        self.fields = (self.field,)
+        op = spec.get("op", ">")
+        if op not in _OPS:
+            raise ValueError(f"Rule {self.id}: unknown operator {op!r}")
+        self.op = _OPS[op]
+        self.threshold = spec["value"]
+        self.clear = spec.get("clear", self.threshold)
+
+    def _check(self, value: Any, active: bool) -> Optional[bool]:
+        try:
+            # hysteresis: an active alert stays on until the clear threshold is passed
+            return bool(self.op(value, self.clear if active else self.threshold))
+        except TypeError:
+            return None
+
+
+class ThresholdRule(_Comparison):
+    kind = "threshold"
+
+    def condition(self, vehicle: str, values: Dict[str, Any], ts: float, memory: Dict[str, Any]):
+        value = values.get(self.field)
+        if value is None:
+            return None, None
+        return self._check(value, memory.get("active", False)), value
+
+
+class RateRule(_Comparison):
+    kind = "rate"
+
+    def __init__(self, spec: Dict[str, Any]):
+        super().__init__(spec)
+        self.window = max(0.0, float(spec.get("window", 1.0)))
+
+    def condition(self, vehicle: str, values: Dict[str, Any], ts: float, memory: Dict[str, Any]):
+        try:
+            value = float(values.get(self.field))
+        except (TypeError, ValueError):
+            return None, None
+        last = memory.get("sample")
+        if last is None:
+            memory["sample"] = (value, ts)
+            return None, None
+        dt = ts - last[1]
+        if dt < self.window or dt <= 0:
+            return None, None
+        memory["sample"] = (value, ts)
+        rate = (value - last[0]) / dt
+        return self._check(rate, memory.get("active", False)), rate
+
+
+class GeofenceRule(_Rule):
+    kind = "geofence"
+    fields = ("gps_lat", "gps_lon")
+
+    def __init__(self, spec: Dict[str, Any]):
+        super().__init__(spec)
+        polygon = spec.get("polygon") or []
+        if len(polygon) < 3:
+            raise ValueError(f"Rule {self.id}: a geofence needs at least 3 points")
+        self.polygon = [(float(lat), float(lon)) for lat, lon in polygon]
+        self.mode = spec.get("mode", "outside")
+        if self.mode not in ("inside", "outside"):
+            raise ValueError(f"Rule {self.id}: mode must be 'inside' or 'outside'")
+        lats = [p[0] for p in self.polygon]
+        lons = [p[1] for p in self.polygon]
+        self.bbox = (min(lats), min(lons), max(lats), max(lons))
+
+    def contains(self, lat: float, lon: float) -> bool:
+        """Ray casting in lat/lon (fine for fences a few km across)."""
+        if not (self.bbox[0] <= lat <= self.bbox[2] and self.bbox[1] <= lon <= self.bbox[3]):
+            return False
+        inside = False
+        points = self.polygon
+        j = len(points) - 1
+        for i in range(len(points)):
+            yi, xi = points[i]
+            yj, xj = points[j]
+            if (yi > lat) != (yj > lat) and lon < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+                inside = not inside
+            j = i
+        return inside
+
+    def alerting(self, inside: bool) -> bool:
+        return inside if self.mode == "inside" else not inside
+
+
+_RULE_TYPES = {"threshold": ThresholdRule, "rate": RateRule, "geofence": GeofenceRule}
+
+
+def compile_rule(spec: Dict[str, Any]) -> _Rule:
+    """Validate a rule spec once; raises ValueError with the rule id."""
+    if not isinstance(spec, dict) or "id" not in spec:
+        raise ValueError("Every rule needs an id")
+    kind = spec.get("type", "threshold")
+    cls = _RULE_TYPES.get(kind)
+    if cls is None:
+        raise ValueError(f"Rule {spec['id']}: unknown type {kind!r}")
+    try:
+        return cls(spec)
+    except KeyError as exc:
+        raise ValueError(f"Rule {spec['id']}: missing {exc.args[0]!r}")
+
+
+def load_rules(path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """DEFAULT_RULES with ALERT_RULES entries merged over them by id."""
+    rules = {rule["id"]: dict(rule) for rule in DEFAULT_RULES}
+    path = path or os.getenv("ALERT_RULES")
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+        for rule in overrides:
+            if rule.get("enabled", True) is False:
+                rules.pop(rule.get("id"), None)
+            else:
+                rules[rule["id"]] = {**rules.get(rule["id"], {}), **rule}
+    return list(rules.values())
+
+
+# --------------------------------------------------
+# GEOFENCE INDEX
+# --------------------------------------------------
+class _GeofenceIndex:
+    """Grid of fence bounding boxes, so a position is tested only against nearby fences."""
+
+    def __init__(self, fences: Sequence[GeofenceRule], cell_deg: float = 0.01):
+        self.cell = cell_deg
+        self.fences = list(fences)
+        self._grid: Dict[Tuple[int, int], List[GeofenceRule]] = {}
+        self._large: List[GeofenceRule] = []
+        for fence in self.fences:
+            lat0, lon0, lat1, lon1 = fence.bbox
+            x0, y0, x1, y1 = self._key(lat0, lon0) + self._key(lat1, lon1)
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > 4096:
+                # country-sized fences would fill the grid; test them on every position
+                self._large.append(fence)
+                continue
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    self._grid.setdefault((x, y), []).append(fence)
+
+    def _key(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell)), int(math.floor(lon / self.cell))
+
+    def containing(self, lat: float, lon: float) -> Set[str]:
+        """Ids of fences containing the position."""
+        candidates = self._grid.get(self._key(lat, lon), ())
+        return {fence.id for fence in list(candidates) + self._large if fence.contains(lat, lon)}
+
+
+# --------------------------------------------------
+# ENGINE
+# --------------------------------------------------
+class RuleEngine:
+    """Evaluates compiled rules against status updates.
+
+    Rules are indexed by input field and a vehicle's update only reaches rules
+    whose fields actually changed value; geofences are looked up in a spatial
+    grid and only fences whose inside/outside state flipped are evaluated, so
+    per-update cost depends on what changed rather than on the rule count.
+    Alerts fire on the transition into the alerting state and report
+    "cleared" on the way out.
+
+    With share(), several workers use one engine state: the owner evaluates
+    and publishes its alerts to a JSON file, the others answer reads from it
+    and hand rule changes to the owner through it.
+    """
+
+    def __init__(self, rules: Iterable[Dict[str, Any]], on_event: Optional[Callable[[Dict[str, Any]], None]] = None, history: int = 200):
+        self.on_event = on_event
+        self._lock = threading.Lock()
+        self._history: deque = deque(maxlen=history)
+        self.counters = {"updates": 0, "evaluations": 0, "fired": 0, "cleared": 0}
+        self._shared_path: Optional[str] = None
+        self._is_owner: Callable[[], bool] = lambda: True
+        self._owner = True
+        self._shared: Dict[str, Any] = {}
+        self._shared_stamp: Optional[Tuple[int, int, int]] = None
+        self._published = 0.0
+        self.load(rules)
+
+    def load(self, specs: Iterable[Dict[str, Any]], tag: Optional[str] = None) -> None:
+        """Compile and install a rule set (all or nothing)."""
+        specs = [dict(spec) if isinstance(spec, dict) else spec for spec in specs]
+        rules = [compile_rule(spec) for spec in specs]
+        ids = [rule.id for rule in rules]
+        if len(ids) != len(set(ids)):
+            raise ValueError("Rule ids must be unique")
+        by_field: Dict[str, List[_Rule]] = {}
+        fences = []
+        for rule in rules:
+            if isinstance(rule, GeofenceRule):
+                fences.append(rule)
+                continue
+            for field in rule.fields:
+                by_field.setdefault(field, []).append(rule)
+        with self._lock:
+            self._specs = specs
+            self._rules_tag = tag or uuid.uuid4().hex
+            self.rules = {rule.id: rule for rule in rules}
+            self._by_field = by_field
+            self._fences = _GeofenceIndex(fences) if fences else None
+            # vehicle -> last seen values / (rule id -> memory) / fence ids containing it
+            self._values: Dict[str, Dict[str, Any]] = {}
+            self._memory: Dict[str, Dict[str, Dict[str, Any]]] = {}
+            self._inside: Dict[str, Set[str]] = {}
+        if tag is None and self._shared_path is not None:
+            if self._owner:
+                self._publish()
+            else:
+                # the owner installs it on its next sync(); alert state starts over
+                self._write_shared({
+                    **self._read_shared(),
+                    "base": self._base,
+                    "rules": specs,
+                    "rules_tag": self._rules_tag,
+                    "active": [],
+                })
+
+    # --------------------------------------------------
+    # SHARED STATE (multi-worker deployments)
+    # --------------------------------------------------
+    def share(self, path: str, is_owner: Callable[[], bool]) -> None:
+        """Keep the alert state in path; is_owner() tells whether this worker evaluates."""
+        self._shared_path = path
+        self._is_owner = is_owner
+        self._owner = False
+        # rules stored under another configuration (ALERT_RULES changed since) are not adopted
+        self._base = hashlib.sha1(json.dumps(self._specs, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _file_stamp(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self._shared_path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _read_shared(self) -> Dict[str, Any]:
+        """The shared document, re-read only when the file changed."""
+        stamp = self._file_stamp()
+        if stamp != self._shared_stamp:
+            try:
+                with open(self._shared_path, "r", encoding="utf-8") as f:
+                    self._shared = json.load(f)
+            except FileNotFoundError:
+                self._shared = {}
+            except (OSError, ValueError) as exc:
+                logger.error(f"[ALERTS] shared state unreadable: {exc}")
+                return self._shared
+            self._shared_stamp = stamp
+        return self._shared
+
+    def _write_shared(self, doc: Dict[str, Any]) -> None:
+        directory = os.path.dirname(self._shared_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self._shared_path}.tmp-{os.getpid()}"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(doc, f, default=str)
+            os.replace(tmp, self._shared_path)
+        except OSError as exc:
+            logger.error(f"[ALERTS] could not write shared state: {exc}")
+            return
+        self._shared = doc
+        self._shared_stamp = self._file_stamp()
+
+    def _publish(self) -> None:
+        with self._lock:
+            doc = {
+                "base": self._base,
+                "rules_tag": self._rules_tag,
+                "rules": self._specs,
+                "active": self._active_unlocked(),
+                "history": list(self._history),
+                "counters": dict(self.counters),
+            }
+        self._published = time.monotonic()
+        self._write_shared(doc)
+
+    def sync(self) -> None:
+        """Pick up rule changes made on other workers; on becoming owner, adopt the published alerts."""
+        if self._shared_path is None:
+            return
+        doc = self._read_shared()
+        owner = self._is_owner()
+        if doc.get("base") == self._base and doc.get("rules_tag") not in (None, self._rules_tag):
+            try:
+                self.load(doc.get("rules", []), tag=doc["rules_tag"])
+            except (ValueError, TypeError, KeyError) as exc:
+                logger.error(f"[ALERTS] ignoring shared rules: {exc}")
+            else:
+                if owner:
+                    self._publish()
+        if owner and not self._owner:
+            with self._lock:
+                for alert in doc.get("active", ()):
+                    if alert.get("rule") in self.rules:
+                        memory = self._memory.setdefault(alert["vehicle"], {})
+                        memory[alert["rule"]] = {"active": True, "since": alert.get("since")}
+                self._history.extend(doc.get("history", ()))
+                self.counters.update(doc.get("counters", {}))
+        self._owner = owner
+
+    def _following(self) -> bool:
+        if self._shared_path is None:
+            return False
+        self.sync()
+        return not self._owner
+
+    # --------------------------------------------------
+    # EVALUATION
+    # --------------------------------------------------
+    def on_state_change(self, vehicle: str, kind: str, data: Any) -> None:
+        """state.subscribe_fleet listener."""
+        if kind == "status" and data:
+            self.evaluate(vehicle, data)
+
+    def evaluate(self, vehicle: str, updates: Dict[str, Any], ts: Optional[float] = None) -> List[Dict[str, Any]]:
+        ts = time.time() if ts is None else ts
+        if self._shared_path is not None:
+            # rules changed on another worker apply from this update on
+            self.sync()
+        events: List[Dict[str, Any]] = []
+        with self._lock:
+            self.counters["updates"] += 1
+            values = self._values.setdefault(vehicle, {})
+            memory = self._memory.setdefault(vehicle, {})
+            changed = [f for f, v in updates.items() if values.get(f, _MISSING) != v]
+            if not changed:
+                return events
+            for field in changed:
+                values[field] = updates[field]
+
+            due: Dict[str, _Rule] = {}
+            for field in changed:
+                for rule in self._by_field.get(field, ()):
+                    due[rule.id] = rule
+            for rule in due.values():
+                if rule.vehicles is not None and vehicle not in rule.vehicles:
+                    continue
+                self.counters["evaluations"] += 1
+                state = memory.setdefault(rule.id, {})
+                result, value = rule.condition(vehicle, values, ts, state)
+                self._transition(rule, vehicle, state, result, value, ts, events)
+
+            if self._fences is not None and ("gps_lat" in changed or "gps_lon" in changed):
+                self._evaluate_fences(vehicle, values, memory, ts, events)
+
+        # followers see counters at most a second old
+        if self._shared_path is not None and (events or time.monotonic() - self._published >= 1.0):
+            self._publish()
+        for event in events:
+            if self.on_event is not None:
+                try:
+                    self.on_event(event)
+                except Exception as exc:
+                    logger.error(f"[ALERTS] handler failed for {event['rule']}: {exc}")
+        return events
+
+    def _evaluate_fences(self, vehicle, values, memory, ts, events) -> None:
+        try:
+            lat, lon = float(values["gps_lat"]), float(values["gps_lon"])
+        except (KeyError, TypeError, ValueError):
+            return
+        if lat == 0.0 and lon == 0.0:
+            return
+        inside = self._fences.containing(lat, lon)
+        previous = self._inside.get(vehicle)
+        self._inside[vehicle] = inside
+        # first fix: every fence once; afterwards only those crossed
+        fences = self._fences.fences if previous is None else [self.rules[i] for i in inside ^ previous]
+        for fence in fences:
+            if fence.vehicles is not None and vehicle not in fence.vehicles:
+                continue
+            self.counters["evaluations"] += 1
+            state = memory.setdefault(fence.id, {})
+            self._transition(fence, vehicle, state, fence.alerting(fence.id in inside), f"{lat},{lon}", ts, events)
+
+    def _transition(self, rule, vehicle, state, result, value, ts, events) -> None:
+        if result is None or result == state.get("active", False):
+            return
+        state["active"] = result
+        event = {
+            "rule": rule.id,
+            "type": rule.kind,
+            "vehicle": vehicle,
+            "state": "firing" if result else "cleared",
+            "level": rule.level if result else "info",
+            "value": value,
+            "timestamp": ts,
+        }
+        template_values = {"rule": rule.id, "vehicle": vehicle, "value": value,
+                           "threshold": getattr(rule, "threshold", None), "field": ",".join(rule.fields)}
+        message = _format(rule.message, template_values)
+        event["message"] = message if result else f"Cleared: {message}"
+        if result:
+            state["since"] = ts
+            self.counters["fired"] += 1
+        else:
+            state.pop("since", None)
+            self.counters["cleared"] += 1
+        self._history.append(event)
+        events.append(event)
+
+    # --------------------------------------------------
+    # INSPECTION
+    # --------------------------------------------------
+    def _active_unlocked(self) -> List[Dict[str, Any]]:
+        return [
+            {"rule": rule_id, "vehicle": vehicle, "level": self.rules[rule_id].level, "since": state.get("since")}
+            for vehicle, rules in self._memory.items()
+            for rule_id, state in rules.items()
+            if state.get("active") and rule_id in self.rules
+        ]
+
+    def active(self) -> List[Dict[str, Any]]:
+        if self._following():
+            return list(self._shared.get("active", []))
+        with self._lock:
+            return self._active_unlocked()
+
+    def history(self, limit: int = 100) -> List[Dict[str, Any]]:
+        if self._following():
+            return self._shared.get("history", [])[-limit:]
+        with self._lock:
+            return list(self._history)[-limit:]
+
+    def events_since(self, total: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Transitions after the first `total` ones (fired + cleared) and the new total."""
+        if self._following():
+            counters, history = self._shared.get("counters", {}), self._shared.get("history", [])
+        else:
+            with self._lock:
+                counters, history = dict(self.counters), list(self._history)
+        current = counters.get("fired", 0) + counters.get("cleared", 0)
+        if current <= total:
+            return [], current
+        return history[-min(current - total, len(history)):], current
+
+    def describe(self) -> List[Dict[str, Any]]:
+        self._following()
+        with self._lock:
+            return [rule.describe() for rule in self.rules.values()]
+
+    def stats(self) -> Dict[str, Any]:
+        counters = self._shared.get("counters", {}) if self._following() else None
+        with self._lock:
+            return {**(counters or self.counters), "rules": len(self.rules), "fields_indexed": len(self._by_field)}
+
+
+_MISSING = object()
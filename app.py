@@ -1,25 +1,59 @@
+# First, so the startup breakdown covers every import below
+from startup import lazy_import, timer as startup_timer
+
 import os
 import sys
+import atexit
+import time
 import logging
 from datetime import datetime, UTC
-from flask import Flask
+from functools import partial
+from flask import Flask, request
 from werkzeug.middleware.proxy_fix import ProxyFix
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
 import paho.mqtt.client as mqtt
 import ssl
-import json
 import base64
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
+
+from alerts import RuleEngine, load_rules
+from broadcaster import DEFAULT_ROOM, TelemetryBroadcaster, vehicle_room
+from camera import CameraService, create_source
+from history import telemetry_history
+from image_store import ImageStore
+from ingest import IngestPipeline, IngestStage
+import metrics
+from journal import Journal
+from mission import MissionStore
+from normalizer import Decoded, TelemetryNormalizer, encoding_for_content_type, load_schema, split_encoding
+from replay import ReplayManager
+from retention import RetentionEngine
+from shared_state import IngestLeader
+from stream import EventStream
+from thumbnails import DerivativeCache
+from track import track_store
+from transcode import ImageTranscoder
 
 # Create Flask app and basic configuration
 app = Flask(__name__)
 
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading")
+# Optional cross-worker message queue (e.g. redis://...) so emits from the
+# ingest worker reach clients connected to every gunicorn worker.
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE", "").strip() or None
+
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    async_mode="threading",
+    message_queue=SOCKETIO_MESSAGE_QUEUE,
+)
 
 # Proxy Fix for Render / reverse proxies
 if os.getenv("TRUST_PROXY", "1").lower() in ("1", "true", "yes"):
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
 
+startup_timer.mark("imports")
+
 
 # ------------------------------------------------------
 # SECRET KEY HANDLING
@@ -67,6 +101,7 @@ app.config.update(
     SESSION_COOKIE_SECURE=_is_prod,
     REMEMBER_COOKIE_SECURE=_is_prod,
     PREFERRED_URL_SCHEME=_preferred_scheme,
+    METRICS_TOKEN=os.getenv("METRICS_TOKEN", "").strip() or None,
 )
 
 # ------------------------------------------------------
@@ -86,6 +121,58 @@ login_manager.user_loader(models.load_user)
 os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 os.makedirs(os.path.dirname(app.config["LOG_FILE"]), exist_ok=True)
 
+image_store = ImageStore(
+    app.config["UPLOAD_FOLDER"],
+    workers=int(os.getenv("IMAGE_WRITER_WORKERS", "2")),
+)
+app.extensions["image_store"] = image_store
+
+thumbnails = DerivativeCache(
+    image_store,
+    max_bytes=int(os.getenv("THUMBNAIL_CACHE_BYTES", str(32 * 1024 * 1024))),
+    workers=int(os.getenv("THUMBNAIL_WORKERS", "2")),
+)
+# New images get their derivatives built eagerly; older ones on first request
+image_store.add_listener(thumbnails.prefetch)
+app.extensions["thumbnails"] = thumbnails
+
+# Disk quota / max age per flight for the upload folder; deletes run off the request path
+retention = RetentionEngine(
+    image_store,
+    thumbnails,
+    quota_bytes=int(os.getenv("IMAGE_QUOTA_BYTES", "0")),
+    max_age_s=float(os.getenv("IMAGE_MAX_AGE", "0")),
+    batch_size=int(os.getenv("IMAGE_RETENTION_BATCH", "200")),
+    interval=float(os.getenv("IMAGE_RETENTION_INTERVAL", "60")),
+    archive_edge=int(os.getenv("IMAGE_ARCHIVE_EDGE", "0")),
+    archive_quality=int(os.getenv("IMAGE_ARCHIVE_QUALITY", "60")),
+    archive_quota_bytes=int(os.getenv("IMAGE_ARCHIVE_QUOTA_BYTES", "0")),
+)
+# started with ingest below: in shared mode only the elected worker sweeps and archives
+app.extensions["retention"] = retention
+
+camera = CameraService(
+    partial(
+        create_source,
+        os.getenv("CAMERA_SOURCE", "0"),
+        int(os.getenv("CAMERA_WIDTH", "0")),
+        int(os.getenv("CAMERA_HEIGHT", "0")),
+    ),
+    fps=float(os.getenv("CAMERA_FPS", "15")),
+    quality=int(os.getenv("CAMERA_QUALITY", "80")),
+    idle_timeout=float(os.getenv("CAMERA_IDLE_TIMEOUT", "10")),
+)
+app.extensions["camera"] = camera
+
+image_transcoder = ImageTranscoder(
+    policy=os.getenv("IMAGE_TRANSCODE_POLICY", "passthrough"),
+    quality=int(os.getenv("IMAGE_TRANSCODE_QUALITY", "85")),
+    max_dimension=int(os.getenv("IMAGE_MAX_DIMENSION", "0")),
+    workers=int(os.getenv("IMAGE_TRANSCODE_WORKERS", "2")),
+)
+app.extensions["transcoder"] = image_transcoder
+startup_timer.mark("storage")
+
 logging.basicConfig(
     filename=app.config["LOG_FILE"],
     level=logging.INFO,
@@ -97,8 +184,10 @@ from auth import bp as auth_bp
 from routes import bp as routes_bp
 app.register_blueprint(auth_bp)
 app.register_blueprint(routes_bp)
+metrics.instrument_app(app, ("routes", "auth"))
 
 import state
+startup_timer.mark("blueprints")
 
 # ------------------------------------------------------
 # MQTT CONFIG
@@ -111,6 +200,15 @@ MQTT_HOST = os.getenv("MQTT_HOST", "").strip()
 MQTT_PORT = int(os.getenv("MQTT_PORT", "8883"))
 MQTT_USERNAME = os.getenv("MQTT_USERNAME", "")
 MQTT_PASSWORD = os.getenv("MQTT_PASSWORD", "")
+# "5" enables MQTT v5 (Content-Type / user properties select the payload encoding)
+MQTT_PROTOCOL = os.getenv("MQTT_PROTOCOL", "3.1.1").strip()
+# Backoff bounds (seconds) for the client's background reconnect loop
+MQTT_RECONNECT_MIN = int(os.getenv("MQTT_RECONNECT_MIN", "1"))
+MQTT_RECONNECT_MAX = int(os.getenv("MQTT_RECONNECT_MAX", "60"))
+
+# "fast": the MQTT bridge connects in the background after the worker boots and
+# Pillow/OpenCV load on first use; "eager": connect and preload during import
+STARTUP_MODE = os.getenv("STARTUP_MODE", "fast").strip().lower()
 
 MQTT_TOPICS = [
     t.strip()
@@ -123,110 +221,279 @@ MQTT_TOPICS = [
 
 mqtt_client: Optional[mqtt.Client] = None
 
+# Fleet: "<prefix>/<vehicle>/<topic>" (e.g. fleet/d2/drone/status) or a
+# vehicle id key in the payload selects the vehicle's state partition
+FLEET_TOPIC_PREFIX = os.getenv("FLEET_TOPIC_PREFIX", "fleet").strip().strip("/")
+# Only this explicit key routes a payload; free-form fields such as "vehicle"
+# often carry a display name ("DJI Mavic 3"), not an id.
+FLEET_PAYLOAD_KEY = "vehicle_id"
+
+# Socket.IO telemetry flush rate (status deltas per second)
+TELEMETRY_BROADCAST_HZ = float(os.getenv("TELEMETRY_BROADCAST_HZ", "10"))
+
+# Ingestion pipeline: queue sizes and backpressure per topic class
+INGEST_TELEMETRY_QUEUE = int(os.getenv("INGEST_TELEMETRY_QUEUE", "1000"))
+INGEST_TELEMETRY_POLICY = os.getenv("INGEST_TELEMETRY_POLICY", "drop_oldest")
+INGEST_IMAGE_QUEUE = int(os.getenv("INGEST_IMAGE_QUEUE", "16"))
+INGEST_IMAGE_POLICY = os.getenv("INGEST_IMAGE_POLICY", "spill")
+INGEST_IMAGE_WORKERS = int(os.getenv("INGEST_IMAGE_WORKERS", "1"))
+INGEST_BLOCK_TIMEOUT = float(os.getenv("INGEST_BLOCK_TIMEOUT", "1.0"))
+INGEST_SPILL_DIR = os.getenv("INGEST_SPILL_DIR", os.path.join("data", "spool"))
+INGEST_SPILL_MAX_BYTES = int(os.getenv("INGEST_SPILL_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# With STATE_BACKEND=shared only the worker holding this lock runs the MQTT bridge
+INGEST_LOCK_PATH = os.getenv("INGEST_LOCK_PATH", os.path.join("data", "ingest.lock"))
+
+# Append-only journal of MQTT messages and state changes
+JOURNAL_ENABLED = _env_flag("JOURNAL_ENABLED", "1")
+JOURNAL_RESTORE = _env_flag("JOURNAL_RESTORE", "1")
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", os.path.join("data", "journal"))
+JOURNAL_SEGMENT_BYTES = int(os.getenv("JOURNAL_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+JOURNAL_MAX_SEGMENTS = int(os.getenv("JOURNAL_MAX_SEGMENTS", "32"))
+JOURNAL_FSYNC_INTERVAL = float(os.getenv("JOURNAL_FSYNC_INTERVAL", "1.0"))
+
+broadcaster = TelemetryBroadcaster(socketio, interval=1.0 / max(TELEMETRY_BROADCAST_HZ, 0.1))
+app.extensions["broadcaster"] = broadcaster
+
+# SSE / long-poll clients get the same payloads, serialized once per event
+event_stream = EventStream(
+    buffer=int(os.getenv("STREAM_BUFFER", "2048")),
+    keepalive=float(os.getenv("STREAM_KEEPALIVE", "15")),
+)
+broadcaster.add_sink(event_stream.publish)
+app.extensions["stream"] = event_stream
+broadcaster.start()
+
 
 # ------------------------------------------------------
 # TELEMETRY FIELD NORMALIZATION
+# Per-topic schema (TELEMETRY_SCHEMA JSON overrides) compiled once
 # ------------------------------------------------------
-def _extract_status_updates(topic: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-    updates: Dict[str, Any] = {}
-    alias_map = {
-        "altitude": ("altitude", "alt"),
-        "speed": ("speed", "velocity"),
-        "battery_percent": ("battery_percent", "battery", "percent"),
-        "battery_voltage": ("battery_voltage", "voltage"),
-        "gps_relative": ("gps_relative",),
-        "flight_mode": ("flight_mode", "mode"),
-        "mission_time": ("mission_time",),
-    }
+telemetry_normalizer = TelemetryNormalizer(load_schema())
+app.extensions["normalizer"] = telemetry_normalizer
+
+
+# ------------------------------------------------------
+# GPS TRACKS
+# Every position change, for any vehicle, extends that vehicle's current flight
+# (with shared state every worker feeds its store from the relay instead, so
+# positions written by any worker reach all of them)
+# ------------------------------------------------------
+if state.backend.name != "shared":
+    state.subscribe_fleet(track_store.on_state_change)
+app.extensions["track"] = track_store
+
+
+# ------------------------------------------------------
+# TELEMETRY HISTORY
+# Recorded in one place per mode, keyed by vehicle: a fleet listener for
+# process-local state, else the shared state relay (on every worker, so a
+# change posted to any worker is recorded once in each of them)
+# ------------------------------------------------------
+def _record_history(vehicle_id: str, kind: str, data: Any) -> None:
+    if kind == "status":
+        telemetry_history.record(data, vehicle=None if vehicle_id == state.fleet.default_id else vehicle_id)
+
+
+if state.backend.name != "shared":
+    state.subscribe_fleet(_record_history)
+app.extensions["history"] = telemetry_history
+
+# Optional "lat,lon[,alt]" file loaded as a past flight of the default vehicle
+TRACK_IMPORT = os.getenv("TRACK_IMPORT", "").strip()
+if TRACK_IMPORT:
+    try:
+        track_store.import_file(TRACK_IMPORT, state.fleet.default_id)
+    except OSError as exc:
+        app.logger.warning(f"Track import failed: {exc}")
 
-    for target, aliases in alias_map.items():
-        for alias in aliases:
-            if alias in payload and payload[alias] is not None:
-                updates[target] = payload[alias]
-                break
 
-    lat = payload.get("lat") or payload.get("latitude")
-    lon = payload.get("lon") or payload.get("longitude")
-    if lat is not None and lon is not None:
-        updates["gps_global"] = f"{lat},{lon}"
+# ------------------------------------------------------
+# MISSIONS
+# Stored waypoint plans shared by all workers through MISSION_FILE; the active
+# plan's progress is computed from the vehicle's current position on read
+# ------------------------------------------------------
+mission_store = MissionStore(
+    os.getenv("MISSION_FILE", os.path.join("data", "missions.json")),
+    cruise_speed=float(os.getenv("MISSION_CRUISE_SPEED", "10")),
+    climb_rate=float(os.getenv("MISSION_CLIMB_RATE", "3")),
+    endurance_s=float(os.getenv("MISSION_ENDURANCE_S", "1200")),
+    reserve_percent=float(os.getenv("MISSION_BATTERY_RESERVE", "20")),
+)
+app.extensions["missions"] = mission_store
 
-    if topic.endswith("battery"):
-        if "percent" in payload:
-            updates["battery_percent"] = payload["percent"]
-        if "voltage" in payload:
-            updates["battery_voltage"] = payload["voltage"]
 
-    return updates
+# ------------------------------------------------------
+# ALERTS
+# Declarative rules (ALERT_RULES JSON merged over the defaults) evaluated on
+# every normalized status update; transitions go to the mission log and to a
+# dedicated "alert" Socket.IO event in the vehicle's room
+# ------------------------------------------------------
+def _on_alert(event: Dict[str, Any]) -> None:
+    vehicle = None if event["vehicle"] == state.fleet.default_id else event["vehicle"]
+    entry = state.log_message(app, event["level"], f"[alert:{event['rule']}] {event['message']}", vehicle)
+    payload = {"log": entry}
+    if vehicle is not None:
+        payload["vehicle"] = vehicle
+    broadcaster.emit_now(payload, vehicle=vehicle)
+    socketio.emit("alert", event, to=vehicle_room(vehicle))
+
+
+alert_engine = RuleEngine(load_rules(), on_event=_on_alert)
+if state.backend.name == "shared":
+    # the ingest leader evaluates (fed by the relay); the other workers read its alerts
+    alert_engine.share(
+        os.getenv("ALERT_STATE_PATH", state.backend.path + ".alerts"),
+        lambda: ingest_leader is not None and ingest_leader.is_leader,
+    )
+else:
+    state.subscribe_fleet(alert_engine.on_state_change)
+app.extensions["alerts"] = alert_engine
+startup_timer.mark("telemetry")
 
 
 # ------------------------------------------------------
 # SNAPSHOT FOR INITIAL SOCKET CONNECTION
 # ------------------------------------------------------
-def _latest_snapshot() -> Dict[str, Any]:
-    return {
-        "status": state.drone_status,
-        "image": state.latest_image,
-        "logs": state.mission_log[-100:],
+def _latest_snapshot(vehicle: Optional[str] = None) -> Dict[str, Any]:
+    snapshot = {
+        "status": state.get_status(vehicle),
+        "image": state.get_latest_image(vehicle),
+        "logs": state.get_mission_log(100, vehicle),
     }
+    if vehicle is not None:
+        snapshot["vehicle"] = vehicle
+    return snapshot
 
 
 # ------------------------------------------------------
-# NORMALIZE ROS2 MESSAGE PAYLOAD
+# IMAGE PERSISTENCE (after pass-through / transcoding)
 # ------------------------------------------------------
-def _normalize_payload(structured: Any) -> Any:
-    if isinstance(structured, dict):
-        inner = structured.get("data")
-        if isinstance(inner, str):
-            try:
-                decoded = json.loads(inner)
-                if isinstance(decoded, dict):
-                    return decoded
-            except Exception:
-                pass
-    return structured
+def _store_mqtt_image(
+    future,
+    topic: str,
+    original_name: str,
+    vehicle: Optional[str] = None,
+    unjournaled: bool = False,
+) -> None:
+    try:
+        data, ext = future.result()
+        extra = {
+            "gps": state.get_status(vehicle).get("gps_global"),
+            "flight": track_store.flight_key(vehicle or state.fleet.default_id),
+        }
+        if vehicle is not None:
+            extra["vehicle"] = vehicle
+        meta = image_store.save(
+            data,
+            ext=ext,
+            source="mqtt",
+            original_name=original_name,
+            extra=extra,
+        )
+    except Exception as e:
+        app.logger.error(f"Failed to decode or save image: {e}")
+        return
+
+    image = {
+        "filename": meta["filename"],
+        "timestamp": datetime.now(UTC).isoformat(),
+        "size": meta["size"],
+    }
+    if unjournaled and journal is not None:
+        # submitted by a replay: the transcoder thread inherits its suppression
+        with journal.suppressed():
+            state.set_latest_image(image, vehicle)
+    else:
+        state.set_latest_image(image, vehicle)
+    payload = {"topic": topic, "image": image}
+    if vehicle is not None:
+        payload["vehicle"] = vehicle
+    broadcaster.emit_now(payload, vehicle=vehicle)
+
+
+# ------------------------------------------------------
+# FLEET ROUTING
+# Vehicle from the topic prefix, else from the payload; None is the default
+# vehicle. The prefix is stripped so schemas and caches stay per logical topic.
+# ------------------------------------------------------
+def _split_vehicle(topic: str) -> Tuple[Optional[str], str]:
+    """'fleet/d2/drone/status' -> ('d2', 'drone/status')."""
+    if FLEET_TOPIC_PREFIX and topic.startswith(FLEET_TOPIC_PREFIX + "/"):
+        vehicle, _, rest = topic[len(FLEET_TOPIC_PREFIX) + 1:].partition("/")
+        if vehicle:
+            return vehicle, rest or topic
+    return None, topic
+
+
+def _message_vehicle(topic: str, structured: Any) -> Tuple[Optional[str], str]:
+    vehicle, topic = _split_vehicle(topic)
+    if vehicle is None and isinstance(structured, dict):
+        value = structured.get(FLEET_PAYLOAD_KEY)
+        if value is not None and value != "":
+            value = str(value)
+            if state.VEHICLE_ID_RE.match(value):
+                vehicle = value
+            else:
+                # keep the telemetry: an unusable id falls back to the default vehicle
+                app.logger.debug(f"Ignoring invalid {FLEET_PAYLOAD_KEY} {value!r} on {topic}")
+    if vehicle == state.fleet.default_id:
+        vehicle = None
+    return vehicle, topic
 
 
 # ------------------------------------------------------
 # MQTT MESSAGE HANDLER (MAIN LOGIC)
 # ------------------------------------------------------
-def _handle_mqtt_payload(topic: str, payload: Any) -> None:
-    original_payload = payload
-    structured = _normalize_payload(payload)
+@metrics.timed(
+    "dron_mqtt_handle_seconds",
+    "_handle_mqtt_payload time per topic class",
+    label=lambda topic, message: _classify_topic(topic),
+)
+def _handle_mqtt_payload(topic: str, message: Decoded) -> None:
+    # the encoding suffix ("drone/pose/struct") only selected the decoder
+    topic, _ = split_encoding(topic)
+    original_payload, structured = message
+    vehicle, topic = _message_vehicle(topic, structured)
+    if vehicle is not None:
+        try:
+            state.fleet.partition(vehicle, create=True)
+        except (ValueError, LookupError) as exc:
+            app.logger.warning(f"Dropping message on {topic}: {exc}")
+            return
+    state.fleet.touch(vehicle)
 
     # TELEMETRY UPDATE
     if isinstance(structured, dict):
-        updates = _extract_status_updates(topic, structured)
+        updates = telemetry_normalizer.extract(topic, structured)
     else:
         updates = {}
 
     if updates:
-        state.drone_status.update(updates)
-        state.drone_status["last_update"] = datetime.now(UTC).isoformat()
+        updates["last_update"] = datetime.now(UTC).isoformat()
+        state.update_status(updates, vehicle)
 
     # ------------------------------------------------------
     # IMAGE HANDLING
     # topic: "drone/image"
     # ------------------------------------------------------
-    if topic.endswith("image") and isinstance(structured, dict):
-        b64_data = structured.get("data")
-        filename = structured.get("filename", "latest.jpg")
+    if topic.endswith("image") and isinstance(structured, (dict, bytes)):
+        if isinstance(structured, bytes):
+            # raw frame ("drone/image/raw"): no JSON or base64 layer at all
+            b64_data, filename = structured, "latest.jpg"
+        else:
+            b64_data = structured.get("data")
+            filename = structured.get("filename", "latest.jpg")
 
         if b64_data:
             try:
-                raw = base64.b64decode(b64_data)
-
-                save_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-                with open(save_path, "wb") as f:
-                    f.write(raw)
-
-                state.latest_image = {
-                    "filename": filename,
-                    "timestamp": datetime.now(UTC).isoformat(),
-                    "size": len(raw),
-                }
-
-                socketio.emit("telemetry", {"image": state.latest_image})
-
+                # binary encodings (msgpack/CBOR) carry the image as bytes already
+                raw = b64_data if isinstance(b64_data, bytes) else base64.b64decode(b64_data)
+                # Sniffed format decides the extension; the client filename is kept as metadata
+                unjournaled = journal is not None and journal.is_suppressed()
+                image_transcoder.submit(raw).add_done_callback(
+                    lambda future: _store_mqtt_image(future, topic, filename, vehicle, unjournaled)
+                )
             except Exception as e:
                 app.logger.error(f"Failed to decode or save image: {e}")
 
@@ -238,60 +505,135 @@ def _handle_mqtt_payload(topic: str, payload: Any) -> None:
         log_message = original_payload.get("log") or original_payload.get("message")
         if log_message:
             level = original_payload.get("level", "info")
-            state.log_message(app, level, f"{topic}: {log_message}")
-            log_entry = state.mission_log[-1]
-    elif original_payload:
-        state.log_message(app, "info", f"{topic}: {original_payload}")
-        log_entry = state.mission_log[-1]
+            log_entry = state.log_message(app, level, f"{topic}: {log_message}", vehicle)
+    elif original_payload and not isinstance(original_payload, bytes):
+        log_entry = state.log_message(app, "info", f"{topic}: {original_payload}", vehicle)
 
-    emit_payload = {"topic": topic, "payload": original_payload}
-    if updates:
-        emit_payload["status"] = state.drone_status
+    # Status changes are coalesced into the next broadcaster tick;
+    # log entries go out immediately. Both reach only the vehicle's room.
+    broadcaster.publish_status(updates, topic, vehicle)
     if log_entry:
-        emit_payload["log"] = log_entry
-
-    socketio.emit("telemetry", emit_payload)
+        payload = {"topic": topic, "log": log_entry}
+        if vehicle is not None:
+            payload["vehicle"] = vehicle
+        broadcaster.emit_now(payload, vehicle=vehicle)
 
 
 # ------------------------------------------------------
-# MQTT CALLBACKS
+# INGESTION PIPELINE
+# paho thread only enqueues; decoding and persistence run on stage workers
 # ------------------------------------------------------
-def _on_mqtt_message(client, userdata, msg):
-    raw = msg.payload
-    decoded: Any = raw
+def _classify_topic(topic: str) -> str:
+    return "image" if split_encoding(topic)[0].endswith("image") else "telemetry"
+
+
+def _decode_mqtt_payload(topic: str, raw: bytes) -> Decoded:
+    logical, encoding = split_encoding(topic)
+    return telemetry_normalizer.decode(raw, encoding, logical)
+
+
+def _process_mqtt_message(topic: str, raw: bytes, recv_ts: float) -> None:
+    decoded = _decode_mqtt_payload(topic, raw)
+    if journal is not None:
+        journal.record_mqtt(topic, raw, recv_ts)
+    _handle_mqtt_payload(topic, decoded)
+
+
+def replay_stages():
+    """Live ingest path split into timed stages for replay (raw MQTT is not re-journaled)."""
+    return [
+        ("decode", lambda topic, raw, ts: _decode_mqtt_payload(topic, raw)),
+        ("handle", _handle_mqtt_payload),
+    ]
+
+
+def _build_ingest_pipeline() -> IngestPipeline:
+    pipeline = IngestPipeline(_classify_topic)
+    pipeline.add_stage(IngestStage(
+        "telemetry",
+        _process_mqtt_message,
+        maxsize=INGEST_TELEMETRY_QUEUE,
+        policy=INGEST_TELEMETRY_POLICY,
+        block_timeout=INGEST_BLOCK_TIMEOUT,
+        spill_dir=os.path.join(INGEST_SPILL_DIR, "telemetry"),
+        spill_max_bytes=INGEST_SPILL_MAX_BYTES,
+    ))
+    pipeline.add_stage(IngestStage(
+        "image",
+        _process_mqtt_message,
+        maxsize=INGEST_IMAGE_QUEUE,
+        policy=INGEST_IMAGE_POLICY,
+        workers=INGEST_IMAGE_WORKERS,
+        block_timeout=INGEST_BLOCK_TIMEOUT,
+        spill_dir=os.path.join(INGEST_SPILL_DIR, "image"),
+        spill_max_bytes=INGEST_SPILL_MAX_BYTES,
+    ))
+    return pipeline
+
+
+ingest_pipeline = _build_ingest_pipeline()
+app.extensions["ingest"] = ingest_pipeline
 
-    try:
-        decoded = raw.decode("utf-8")
-    except Exception:
-        pass
 
-    if isinstance(decoded, str):
-        try:
-            decoded = json.loads(decoded)
-        except Exception:
-            pass
+# ------------------------------------------------------
+# MQTT CALLBACKS
+# ------------------------------------------------------
+def _content_type(msg) -> Optional[str]:
+    """MQTT v5 Content-Type, or a "content-type" user property."""
+    props = getattr(msg, "properties", None)
+    if props is None:
+        return None
+    content_type = getattr(props, "ContentType", None)
+    if content_type:
+        return content_type
+    for key, value in getattr(props, "UserProperty", None) or ():
+        if key.lower() == "content-type":
+            return value
+    return None
 
-    if not isinstance(decoded, (dict, list)) and isinstance(decoded, bytes):
-        decoded = decoded.decode(errors="ignore")
 
-    _handle_mqtt_payload(msg.topic, decoded)
+_MQTT_MESSAGES = metrics.counter("dron_mqtt_messages_total", "MQTT messages received per topic class", ("kind",))
+_MQTT_BYTES = metrics.counter("dron_mqtt_bytes_total", "MQTT payload bytes received per topic class", ("kind",))
+_MQTT_CONNECTS = metrics.counter("dron_mqtt_connects_total", "MQTT broker connections by result", ("result",))
 
 
-def _on_mqtt_connect(client, userdata, flags, rc):
+def _on_mqtt_message(client, userdata, msg):
+    topic = msg.topic
+    kind = _classify_topic(topic)
+    _MQTT_MESSAGES.inc(1, kind)
+    _MQTT_BYTES.inc(len(msg.payload), kind)
+    encoding = encoding_for_content_type(_content_type(msg))
+    if encoding and split_encoding(topic)[1] == "json":
+        # fold the negotiated encoding into the topic so the journal and replay keep it
+        topic = f"{topic}/{encoding}"
+    ingest_pipeline.submit(topic, msg.payload, time.time())
+
+
+def _on_mqtt_connect(client, userdata, flags, rc, properties=None):
     app.logger.info(f"[MQTT] Connected with code {rc}")
     if rc != 0:
+        _MQTT_CONNECTS.inc(1, "refused")
         return
+    _MQTT_CONNECTS.inc(1, "ok")
+    startup_timer.event("mqtt_connected")
+    # runs again after every reconnect, so subscriptions survive broker restarts
     for topic in MQTT_TOPICS:
         client.subscribe(topic)
         app.logger.info(f"[MQTT] Subscribed to {topic}")
 
 
+def _on_mqtt_disconnect(client, userdata, rc, properties=None):
+    if rc != 0:
+        _MQTT_CONNECTS.inc(1, "lost")
+        app.logger.warning(f"[MQTT] Disconnected with code {rc}; reconnecting in the background")
+
+
 # ------------------------------------------------------
 # START MQTT BRIDGE
+# In fast startup mode TLS setup and the broker connection run on a background
+# task, so the worker serves /healthz while a slow broker is still answering.
 # ------------------------------------------------------
 def _start_mqtt_bridge() -> None:
-    global mqtt_client
-
     if not MQTT_ENABLED:
         app.logger.info("MQTT_DISABLED")
         return
@@ -299,28 +641,231 @@ def _start_mqtt_bridge() -> None:
         app.logger.warning("MQTT_HOST empty → MQTT disabled")
         return
 
-    mqtt_client = mqtt.Client()
+    ingest_pipeline.start()
+
+    if STARTUP_MODE == "eager":
+        _connect_mqtt(blocking=True)
+    else:
+        socketio.start_background_task(_connect_mqtt)
+
+
+def _connect_mqtt(blocking: bool = False) -> None:
+    global mqtt_client
+
+    started = time.perf_counter()
+    client = mqtt.Client(protocol=mqtt.MQTTv5 if MQTT_PROTOCOL == "5" else mqtt.MQTTv311)
 
     try:
-        mqtt_client.tls_set(tls_version=ssl.PROTOCOL_TLS)
+        client.tls_set(tls_version=ssl.PROTOCOL_TLS)
     except Exception as exc:
         app.logger.warning(f"MQTT TLS configuration failed: {exc}")
 
     if MQTT_USERNAME:
-        mqtt_client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+        client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
 
-    mqtt_client.on_connect = _on_mqtt_connect
-    mqtt_client.on_message = _on_mqtt_message
+    client.on_connect = _on_mqtt_connect
+    client.on_disconnect = _on_mqtt_disconnect
+    client.on_message = _on_mqtt_message
+    # the network loop retries a failed or dropped connection with this backoff
+    client.reconnect_delay_set(MQTT_RECONNECT_MIN, MQTT_RECONNECT_MAX)
+    mqtt_client = client
 
     try:
-        mqtt_client.connect(MQTT_HOST, MQTT_PORT)
-        mqtt_client.loop_start()
-        app.logger.info("MQTT bridge running...")
+        if blocking:
+            client.connect(MQTT_HOST, MQTT_PORT)
+        else:
+            client.connect_async(MQTT_HOST, MQTT_PORT)
     except Exception as exc:
-        app.logger.error(f"Failed to start MQTT client: {exc}")
+        # the loop below keeps retrying, so a broker that is down at boot is picked up later
+        app.logger.error(f"Failed to connect MQTT client: {exc}")
+    client.loop_start()
+    startup_timer.event("mqtt_bridge_started", (time.perf_counter() - started) * 1000)
+    app.logger.info("MQTT bridge running...")
+
+
+# ------------------------------------------------------
+# JOURNAL
+# Durable record of every MQTT message and state change; the ingest worker
+# owns it and restores state from it on startup.
+# ------------------------------------------------------
+journal: Optional[Journal] = None
+
+
+def _journal_checkpoint():
+    return state.get_status(), state.get_latest_image(), state.get_mission_log(100), state.backend.log_seq()
+
+
+def _start_journal() -> None:
+    global journal
+
+    if not JOURNAL_ENABLED:
+        return
+    try:
+        journal = Journal(
+            JOURNAL_DIR,
+            segment_bytes=JOURNAL_SEGMENT_BYTES,
+            max_segments=JOURNAL_MAX_SEGMENTS,
+            fsync_interval=JOURNAL_FSYNC_INTERVAL,
+            checkpoint_provider=_journal_checkpoint,
+        )
+    except OSError as exc:
+        app.logger.error(f"Journal disabled: {exc}")
+        return
+
+    # Only restore into untouched state (a surviving shared segment is newer)
+    if JOURNAL_RESTORE and state.backend.log_seq() == 0 and state.backend.version() <= 1:
+        restored = journal.restore(log_limit=100)
+        if restored:
+            state.backend.update_status(restored["status"])
+            state.backend.set_latest_image(restored["image"])
+            for entry in restored["logs"]:
+                state.backend.append_log(dict(entry))
+            app.logger.info(
+                f"Restored state from journal: {restored['records']} records in {restored['seconds']}s"
+            )
+
+    state.subscribe(journal.record_state)
+    journal.start()
+    atexit.register(journal.close)
+    app.extensions["journal"] = journal
+
+
+def _start_ingest() -> None:
+    _start_journal()
+    _start_mqtt_bridge()
+    # workers share the upload folder: concurrent sweeps would evict twice and
+    # append to the same archive ZIP
+    retention.start()
+
+
+app.extensions["replay"] = ReplayManager(lambda: journal, replay_stages())
+
+
+# ------------------------------------------------------
+# METRICS GAUGES (read from components at scrape time)
+# ------------------------------------------------------
+def _metrics_gauges():
+    ingest = ingest_pipeline.stats()
+    images = image_store.stats()
+    return (
+        metrics.gauge_lines(
+            "dron_ingest_queue_depth",
+            "Messages waiting per ingest stage",
+            {(name,): st["depth"] for name, st in ingest.items()},
+            ("stage",),
+        )
+        + metrics.gauge_lines(
+            "dron_ingest_dropped",
+            "Messages dropped per ingest stage since start",
+            {(name,): st["dropped"] for name, st in ingest.items()},
+            ("stage",),
+        )
+        + metrics.gauge_lines("dron_images_pending_writes", "Images queued for the writer pool", {(): images["pending"]})
+        + metrics.gauge_lines("dron_images_bytes", "Bytes of stored images", {(): images["bytes"]})
+        + metrics.gauge_lines("dron_stream_subscribers", "Connected SSE clients", {(): event_stream.stats()["subscribers"]})
+        + metrics.gauge_lines("dron_video_viewers", "Connected /video_feed clients", {(): camera.viewers})
+        + metrics.gauge_lines(
+            "dron_startup_phase_seconds",
+            "Worker startup time per phase",
+            {(p["phase"],): p["ms"] / 1000 for p in startup_timer.report()["phases"]},
+            ("phase",),
+        )
+    )
+
+
+metrics.registry.add_collector(_metrics_gauges)
+
+
+# ------------------------------------------------------
+# SHARED STATE RELAY
+# Every worker polls the shared partitions of all vehicles and feeds its GPS
+# tracks and telemetry history from them; the ingest leader also evaluates the
+# alert rules on them.
+# Workers that do not run the MQTT bridge forward the changes written by the
+# ingest leader (or by HTTP clients of other workers) and its alerts to their
+# own Socket.IO clients.
+# ------------------------------------------------------
+RELAY_TOPIC = "state/relay"
+
+
+def _relay_vehicle(vehicle_id: str, partition, seen: Dict[str, Any], relay: bool) -> None:
+    vehicle = None if vehicle_id == state.fleet.default_id else vehicle_id
+    version = partition.version()
+    if version != seen["version"]:
+        seen["version"] = version
+        status = partition.get_status()
+        diff = {k: v for k, v in status.items() if seen["status"].get(k) != v}
+        if diff:
+            seen["status"] = dict(status)
+            # the whole status: a move along one axis leaves the other out of the diff
+            track_store.on_state_change(vehicle_id, "status", status)
+            _record_history(vehicle_id, "status", diff)
+            if ingest_leader.is_leader:
+                alert_engine.on_state_change(vehicle_id, "status", diff)
+            if relay:
+                broadcaster.publish_status(diff, RELAY_TOPIC, vehicle)
+        image = partition.get_latest_image()
+        if image != seen["image"]:
+            seen["image"] = image
+            if relay:
+                broadcaster.emit_now({"image": image, **({"vehicle": vehicle} if vehicle else {})}, vehicle=vehicle)
+
+    entries, seen["log_seq"], _ = partition.log_since(seen["log_seq"], None, state.MISSION_LOG_LIMIT)
+    if relay:
+        for entry in entries:
+            broadcaster.emit_now({"log": entry, **({"vehicle": vehicle} if vehicle else {})}, vehicle=vehicle)
+
+
+def _relay_shared_state() -> None:
+    # vehicle -> what this worker has already seen of its partition; the first
+    # pass picks up the full status, but not images and logs from before startup
+    followed: Dict[str, Dict[str, Any]] = {}
+    started = False
+    _, alert_total = alert_engine.events_since(0)
+
+    while True:
+        socketio.sleep(broadcaster.interval)
+        # the leader's clients get its own ingest events; a message queue fans them out to all
+        relay = not ingest_leader.is_leader and not SOCKETIO_MESSAGE_QUEUE
+        alert_engine.sync()
+        events, alert_total = alert_engine.events_since(alert_total)
+        if relay:
+            for event in events:
+                vehicle = None if event["vehicle"] == state.fleet.default_id else event["vehicle"]
+                socketio.emit("alert", event, to=vehicle_room(vehicle))
+        for vehicle in state.fleet.vehicles():
+            partition = state.fleet.partition(vehicle)
+            seen = followed.get(vehicle)
+            if seen is None:
+                seen = followed[vehicle] = {
+                    "version": -1,
+                    "status": {},
+                    "image": partition.get_latest_image() if not started else None,
+                    "log_seq": partition.log_seq() if not started else 0,
+                }
+            try:
+                _relay_vehicle(vehicle, partition, seen, relay)
+            except Exception as exc:
+                app.logger.error(f"Shared state relay failed for {vehicle}: {exc}")
+        started = True
+
+
+ingest_leader: Optional[IngestLeader] = None
+
+if state.backend.name == "shared":
+    ingest_leader = IngestLeader(INGEST_LOCK_PATH)
+    ingest_leader.run_when_elected(_start_ingest)
+    socketio.start_background_task(_relay_shared_state)
+else:
+    _start_ingest()
+startup_timer.mark("ingest")
 
+if STARTUP_MODE == "eager":
+    lazy_import("PIL.Image")
+    startup_timer.mark("preload")
 
-_start_mqtt_bridge()
+app.extensions["startup"] = startup_timer
+app.logger.info(f"Startup ready in {startup_timer.ready():.0f} ms ({startup_timer.summary()})")
 
 
 # ------------------------------------------------------
@@ -328,7 +873,46 @@ _start_mqtt_bridge()
 # ------------------------------------------------------
 @socketio.on("connect")
 def handle_socket_connect():
-    emit("telemetry", _latest_snapshot())
+    # ?vehicle=<id> follows one vehicle; otherwise the default one (dashboard)
+    _join_vehicle(_vehicle_arg({"vehicle": request.args.get("vehicle")}))
+
+
+def _join_vehicle(vehicle: Optional[str]) -> str:
+    vehicle = None if vehicle == state.fleet.default_id else vehicle
+    room = vehicle_room(vehicle)
+    join_room(room)
+    # vehicles not seen yet get their state with the first message
+    if vehicle is None or state.fleet.partition(vehicle) is not None:
+        emit("telemetry", _latest_snapshot(vehicle))
+    return room
+
+
+def _vehicle_arg(data) -> Optional[str]:
+    vehicle = data.get("vehicle") if isinstance(data, dict) else None
+    return str(vehicle) if vehicle and state.VEHICLE_ID_RE.match(str(vehicle)) else None
+
+
+@socketio.on("subscribe")
+def handle_socket_subscribe(data):
+    """{"vehicle": id} switches to that vehicle; "exclusive": false keeps the current rooms."""
+    vehicle = _vehicle_arg(data)
+    if vehicle is None:
+        return {"success": False, "error": "Invalid vehicle id"}
+    if data.get("exclusive", True):
+        # every vehicle room this client is in, not just the one it connected to
+        for room in rooms():
+            if room == DEFAULT_ROOM or room.startswith(vehicle_room("")):
+                leave_room(room)
+    return {"success": True, "room": _join_vehicle(vehicle)}
+
+
+@socketio.on("unsubscribe")
+def handle_socket_unsubscribe(data):
+    vehicle = _vehicle_arg(data)
+    if vehicle is None:
+        return {"success": False, "error": "Invalid vehicle id"}
+    leave_room(vehicle_room(None if vehicle == state.fleet.default_id else vehicle))
+    return {"success": True}
 
 
 # ------------------------------------------------------
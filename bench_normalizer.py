@@ -0,0 +1,123 @@
+"""Per-message cost of MQTT payload decoding + status field extraction.
+
+Compares the previous implementation (alias dict rebuilt per message, nested
+"data" parsed in a second pass) with the compiled TelemetryNormalizer:
+
+    python bench_normalizer.py --iterations 200000
+"""
+import sys
+import json
+import time
+import argparse
+from typing import Any, Dict
+
+from normalizer import TelemetryNormalizer
+
+SAMPLES = [
+    ("drone/telemetry", {"altitude": 12.5, "speed": 3.1, "mode": "AUTO", "lat": 52.2297, "lon": 21.0122}),
+    ("drone/battery", {"percent": 87, "voltage": 15.9}),
+    ("ros/status", {"data": json.dumps({"alt": 40.2, "velocity": 7.5, "latitude": 52.1, "longitude": 21.1})}),
+    ("drone/log", {"message": "waypoint reached", "level": "info"}),
+]
+
+
+# --- previous implementation, kept verbatim for comparison ---
+def _legacy_decode(raw: bytes) -> Any:
+    decoded: Any = raw
+    try:
+        decoded = raw.decode("utf-8")
+    except Exception:
+        pass
+    if isinstance(decoded, str):
+        try:
+            decoded = json.loads(decoded)
+        except Exception:
+            pass
+    if not isinstance(decoded, (dict, list)) and isinstance(decoded, bytes):
+        decoded = decoded.decode(errors="ignore")
+    return decoded
+
+
+def _legacy_normalize(structured: Any) -> Any:
+    if isinstance(structured, dict):
+        inner = structured.get("data")
+        if isinstance(inner, str):
+            try:
+                decoded = json.loads(inner)
+                if isinstance(decoded, dict):
+                    return decoded
+            except Exception:
+                pass
+    return structured
+
+
+def _legacy_extract(topic: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    updates: Dict[str, Any] = {}
+    alias_map = {
+        "altitude": ("altitude", "alt"),
+        "speed": ("speed", "velocity"),
+        "battery_percent": ("battery_percent", "battery", "percent"),
+        "battery_voltage": ("battery_voltage", "voltage"),
+        "gps_relative": ("gps_relative",),
+        "flight_mode": ("flight_mode", "mode"),
+        "mission_time": ("mission_time",),
+    }
+    for target, aliases in alias_map.items():
+        for alias in aliases:
+            if alias in payload and payload[alias] is not None:
+                updates[target] = payload[alias]
+                break
+    lat = payload.get("lat") or payload.get("latitude")
+    lon = payload.get("lon") or payload.get("longitude")
+    if lat is not None and lon is not None:
+        updates["gps_global"] = f"{lat},{lon}"
+    if topic.endswith("battery"):
+        if "percent" in payload:
+            updates["battery_percent"] = payload["percent"]
+        if "voltage" in payload:
+            updates["battery_voltage"] = payload["voltage"]
+    return updates
+
+
+def legacy(topic: str, raw: bytes) -> Dict[str, Any]:
+    structured = _legacy_normalize(_legacy_decode(raw))
+    return _legacy_extract(topic, structured) if isinstance(structured, dict) else {}
+
+
+def compiled(normalizer: TelemetryNormalizer, topic: str, raw: bytes) -> Dict[str, Any]:
+    structured = normalizer.decode(raw).structured
+    return normalizer.extract(topic, structured) if isinstance(structured, dict) else {}
+
+
+def _time(fn, messages, iterations: int) -> float:
+    started = time.perf_counter()
+    for i in range(iterations):
+        topic, raw = messages[i % len(messages)]
+        fn(topic, raw)
+    return (time.perf_counter() - started) / iterations
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    messages = [(topic, json.dumps(payload).encode("utf-8")) for topic, payload in SAMPLES]
+    normalizer = TelemetryNormalizer()
+    results = {
+        "legacy_us": _time(legacy, messages, args.iterations) * 1e6,
+        "compiled_us": _time(lambda t, r: compiled(normalizer, t, r), messages, args.iterations) * 1e6,
+    }
+    results["speedup"] = results["legacy_us"] / results["compiled_us"]
+
+    # field mapping alone, on already-decoded payloads (JSON parsing dominates above)
+    decoded = [(topic, normalizer.decode(raw).structured) for topic, raw in messages]
+    results["legacy_extract_us"] = _time(_legacy_extract, decoded, args.iterations) * 1e6
+    results["compiled_extract_us"] = _time(normalizer.extract, decoded, args.iterations) * 1e6
+    results["extract_speedup"] = results["legacy_extract_us"] / results["compiled_extract_us"]
+    print(json.dumps({k: round(v, 3) for k, v in results.items()}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
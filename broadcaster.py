@@ -0,0 +1,194 @@
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+
+__all__ = ["TelemetryBroadcaster", "vehicle_room", "DEFAULT_ROOM"]
+
+logger = logging.getLogger(__name__)
+
+# Socket.IO room of clients following the default vehicle (the dashboard)
+DEFAULT_ROOM = "vehicle"
+
+
+def vehicle_room(vehicle: Optional[str]) -> str:
+    return DEFAULT_ROOM if vehicle is None else f"vehicle:{vehicle}"
+
+
+_EMIT_SECONDS = metrics.histogram(
+    "dron_socketio_emit_seconds",
+    "Time spent in socketio.emit (fan-out to connected clients) plus stream sinks",
+    ("kind",),
+)
+
+
+class _Pending:
+    """Coalescing state for one vehicle."""
+
+    __slots__ = ("dirty", "topics", "last_sent")
+
+    def __init__(self):
+        self.dirty: Dict[str, Any] = {}
+        self.topics = set()
+        self.last_sent: Dict[str, Any] = {}
+
+
+class TelemetryBroadcaster:
+    """Coalesces status updates and pushes them to Socket.IO clients at a fixed tick.
+
+    Status fields are merged into a dirty set and flushed as a delta holding only
+    values that changed since the previous flush. Logs and image events bypass
+    the tick via ``emit_now``.
+
+    Each vehicle coalesces separately and its deltas go only to its room
+    (``vehicle_room``); the default vehicle (None) also feeds the sinks. A tick
+    visits only vehicles that changed since the previous one.
+    """
+
+    def __init__(self, socketio, interval: float = 0.1, event: str = "telemetry"):
+        self.socketio = socketio
+        self.interval = max(0.01, float(interval))
+        self.event = event
+
+        self._lock = threading.Lock()
+        self._pending: Dict[Optional[str], _Pending] = {None: _Pending()}
+        self._dirty_vehicles = set()
+        self._running = False
+        self._sinks: List[Callable[[Dict[str, Any]], None]] = []
+
+        self.counters = {
+            "received": 0,
+            "status_updates": 0,
+            "emitted": 0,
+            "emitted_immediate": 0,
+            "emitted_delta": 0,
+            "fields_sent": 0,
+        }
+
+    def add_sink(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        """Also hand every broadcast payload to callback (e.g. the SSE stream)."""
+        self._sinks.append(callback)
+
+    def _deliver(self, payload: Dict[str, Any]) -> None:
+        for callback in self._sinks:
+            try:
+                callback(payload)
+            except Exception as exc:
+                logger.error(f"[BROADCAST] telemetry sink failed: {exc}")
+
+    # --------------------------------------------------
+    # PRODUCERS
+    # --------------------------------------------------
+    def publish_status(self, changes: Dict[str, Any], topic: Optional[str] = None, vehicle: Optional[str] = None) -> None:
+        """Merge status changes into the vehicle's next delta."""
+        with self._lock:
+            self.counters["received"] += 1
+            pending = self._pending.get(vehicle)
+            if pending is None:
+                pending = self._pending[vehicle] = _Pending()
+            if changes:
+                self.counters["status_updates"] += 1
+                pending.dirty.update(changes)
+            if topic:
+                pending.topics.add(topic)
+            if changes or topic:
+                self._dirty_vehicles.add(vehicle)
+
+    def note_received(self, topic: Optional[str] = None, vehicle: Optional[str] = None) -> None:
+        """Count a message that carried no status fields (keeps MQTT liveness flowing)."""
+        self.publish_status({}, topic, vehicle)
+
+    def emit_now(self, payload: Dict[str, Any], to: Optional[str] = None, vehicle: Optional[str] = None) -> None:
+        """Deliver an event immediately, outside the coalescing tick.
+
+        Without `to` the event goes to the vehicle's room; only default-vehicle
+        events reach the sinks.
+        """
+        with self._lock:
+            self.counters["emitted"] += 1
+            self.counters["emitted_immediate"] += 1
+        started = time.perf_counter()
+        if to is None:
+            self.socketio.emit(self.event, payload, to=vehicle_room(vehicle))
+            if vehicle is None:
+                self._deliver(payload)
+        else:
+            self.socketio.emit(self.event, payload, to=to)
+        _EMIT_SECONDS.observe(time.perf_counter() - started, "immediate")
+
+    # --------------------------------------------------
+    # FLUSH LOOP
+    # --------------------------------------------------
+    def _take_deltas(self):
+        """[(vehicle, delta, topics)] for every vehicle changed since the last tick."""
+        with self._lock:
+            vehicles = self._dirty_vehicles
+            self._dirty_vehicles = set()
+            out = []
+            for vehicle in vehicles:
+                pending = self._pending[vehicle]
+                delta = {
+                    key: value
+                    for key, value in pending.dirty.items()
+                    if key not in pending.last_sent or pending.last_sent[key] != value
+                }
+                pending.last_sent.update(delta)
+                out.append((vehicle, delta, sorted(pending.topics)))
+                pending.dirty.clear()
+                pending.topics.clear()
+            return out
+
+    def flush(self) -> bool:
+        """Emit pending changes; returns True when something was sent."""
+        sent = False
+        for vehicle, delta, topics in self._take_deltas():
+            if not delta and not topics:
+                continue
+            payload: Dict[str, Any] = {"topics": topics}
+            if delta:
+                payload["status"] = delta
+            if vehicle is not None:
+                payload["vehicle"] = vehicle
+            started = time.perf_counter()
+            self.socketio.emit(self.event, payload, to=vehicle_room(vehicle))
+            if vehicle is None:
+                self._deliver(payload)
+            _EMIT_SECONDS.observe(time.perf_counter() - started, "delta")
+            with self._lock:
+                self.counters["emitted"] += 1
+                self.counters["emitted_delta"] += 1
+                self.counters["fields_sent"] += len(delta)
+            sent = True
+        return sent
+
+    def _run(self) -> None:
+        while self._running:
+            self.socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as exc:  # keep the loop alive on emit errors
+                logger.error(f"[BROADCAST] telemetry broadcast failed: {exc}")
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self.socketio.start_background_task(self._run)
+
+    def stop(self) -> None:
+        self._running = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            received = self.counters["received"]
+            emitted = self.counters["emitted"]
+            return {
+                **self.counters,
+                "pending_fields": sum(len(p.dirty) for p in self._pending.values()),
+                "vehicles": len(self._pending),
+                "interval": self.interval,
+                "emit_ratio": round(emitted / received, 4) if received else 0.0,
+            }
+
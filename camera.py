@@ -0,0 +1,354 @@
+import time
+import itertools
+import threading
+from datetime import datetime, UTC
+from io import BytesIO
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from startup import lazy_import
+
+__all__ = ["CameraService", "OpenCVSource", "SyntheticSource", "create_source", "TIERS"]
+
+# Stream tiers, best first: name -> (scale, JPEG quality). The top tier's
+# quality is replaced by CameraService.quality.
+TIERS: Dict[str, Tuple[float, int]] = {
+    "high": (1.0, 80),
+    "medium": (0.5, 65),
+    "low": (0.25, 50),
+}
+
+
+class OpenCVSource:
+    """Local camera device read through OpenCV."""
+
+    def __init__(self, device: int = 0, width: int = 0, height: int = 0):
+        # OpenCV is imported on the first /video_feed, not at app startup
+        try:
+            self.cv2 = cv2 = lazy_import("cv2")
+        except Exception:
+            raise RuntimeError("OpenCV is not available in the environment")
+        self.capture = cv2.VideoCapture(device)
+        if not self.capture.isOpened():
+            raise RuntimeError("Camera access unavailable")
+        if width and height:
+            self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+    def read(self):
+        success, frame = self.capture.read()
+        return frame if success else None
+
+    def encode(self, frame, scale: float, quality: int) -> Optional[bytes]:
+        cv2 = self.cv2
+        if scale != 1.0:
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        return buffer.tobytes() if ok else None
+
+    def close(self) -> None:
+        self.capture.release()
+
+
+class SyntheticSource:
+    """Generated test pattern (moving bar + clock) for hosts without a camera."""
+
+    def __init__(self, width: int = 640, height: int = 480):
+        self._image_mod = lazy_import("PIL.Image")
+        self._draw_mod = lazy_import("PIL.ImageDraw")
+        self.width = width or 640
+        self.height = height or 480
+        self._frame = 0
+
+    def read(self):
+        img = self._image_mod.new("RGB", (self.width, self.height), (20, 24, 32))
+        draw = self._draw_mod.Draw(img)
+        x = (self._frame * 8) % self.width
+        draw.rectangle((x, 0, x + self.width // 16, self.height), fill=(40, 160, 90))
+        draw.text((10, 10), f"SYNTHETIC {datetime.now(UTC).strftime('%H:%M:%S.%f')[:-3]}", fill=(255, 255, 255))
+        self._frame += 1
+        return img
+
+    def encode(self, frame, scale: float, quality: int) -> Optional[bytes]:
+        if scale != 1.0:
+            frame = frame.resize((max(1, int(self.width * scale)), max(1, int(self.height * scale))))
+        out = BytesIO()
+        frame.save(out, "JPEG", quality=quality)
+        return out.getvalue()
+
+    def close(self) -> None:
+        pass
+
+
+def create_source(spec: str, width: int = 0, height: int = 0):
+    """CAMERA_SOURCE value -> frame source ("synthetic" or a device index)."""
+    if spec == "synthetic":
+        return SyntheticSource(width, height)
+    return OpenCVSource(int(spec), width, height)
+
+
+class _Viewer:
+    """Per-client delivery state and adaptation.
+
+    The time a generator spends suspended after a yield is the time the server
+    needed to write that part to the socket, so it measures the client's
+    throughput and backpressure directly.
+    """
+
+    # fraction of the frame interval spent writing that triggers a step down / up
+    DOWNGRADE_AT = 0.8
+    UPGRADE_AT = 0.25
+    # consecutive frames needed before changing tier
+    PATIENCE = 5
+
+    def __init__(self, viewer_id: int, tier: str, fps: float, adaptive: bool, remote: Optional[str]):
+        self.id = viewer_id
+        self.tier = tier
+        self.max_fps = fps
+        self.fps = fps
+        self.adaptive = adaptive
+        self.remote = remote
+        self.connected_at = time.monotonic()
+        self.frames = 0
+        self.bytes = 0
+        self.dropped = 0
+        self.write_s = 0.0
+        self.write_ewma = 0.0
+        self.tier_changes = 0
+        self._slow = 0
+        self._fast = 0
+
+    def record_write(self, size: int, seconds: float) -> None:
+        self.frames += 1
+        self.bytes += size
+        self.write_s += seconds
+        self.write_ewma = seconds if self.frames == 1 else 0.8 * self.write_ewma + 0.2 * seconds
+
+    def adapt(self, tiers: List[str]) -> None:
+        if not self.adaptive:
+            return
+        budget = 1.0 / self.fps
+        if self.write_ewma > self.DOWNGRADE_AT * budget:
+            self._slow += 1
+            self._fast = 0
+        elif self.write_ewma < self.UPGRADE_AT * budget:
+            self._fast += 1
+            self._slow = 0
+        else:
+            self._slow = self._fast = 0
+
+        index = tiers.index(self.tier)
+        if self._slow >= self.PATIENCE:
+            self._slow = 0
+            if index + 1 < len(tiers):
+                self.tier = tiers[index + 1]
+                self.tier_changes += 1
+            else:
+                # already on the smallest frames: send fewer of them
+                self.fps = max(1.0, self.fps / 2)
+        elif self._fast >= self.PATIENCE * 4:
+            self._fast = 0
+            if self.fps < self.max_fps:
+                self.fps = min(self.max_fps, self.fps * 2)
+            elif index > 0:
+                self.tier = tiers[index - 1]
+                self.tier_changes += 1
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = max(time.monotonic() - self.connected_at, 1e-6)
+        return {
+            "id": self.id,
+            "remote": self.remote,
+            "tier": self.tier,
+            "adaptive": self.adaptive,
+            "target_fps": round(self.fps, 2),
+            "fps_delivered": round(self.frames / elapsed, 2),
+            "bytes_per_s": round(self.bytes / elapsed),
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "write_ms_avg": round(self.write_s / self.frames * 1000, 3) if self.frames else 0.0,
+            "tier_changes": self.tier_changes,
+            "connected_s": round(elapsed, 1),
+        }
+
+
+class CameraService:
+    """One capture thread per process; every viewer shares the encoded frames.
+
+    Each frame is encoded once per tier that currently has viewers and wrapped
+    into a multipart part once; viewers receive the same bytes objects. A
+    viewer that falls behind skips to the newest frame instead of queueing old
+    ones, and adaptive viewers move between tiers and frame rates based on how
+    long their writes take. The device is released after `idle_timeout`
+    seconds without viewers.
+    """
+
+    def __init__(
+        self,
+        source_factory: Callable[[], Any],
+        fps: float = 15.0,
+        quality: int = 80,
+        idle_timeout: float = 10.0,
+        tiers: Optional[Dict[str, Tuple[float, int]]] = None,
+    ):
+        self.source_factory = source_factory
+        self.fps = max(0.1, float(fps))
+        self.quality = quality
+        self.idle_timeout = idle_timeout
+        self.tiers = dict(tiers or TIERS)
+        first = next(iter(self.tiers))
+        self.tiers[first] = (self.tiers[first][0], quality)
+        self._tier_names = list(self.tiers)
+
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._source = None
+        self._seq = 0
+        self._parts: Dict[str, bytes] = {}
+        self._last_viewer = time.monotonic()
+        self._viewers: Dict[int, _Viewer] = {}
+        self._ids = itertools.count(1)
+        self.counters = {"frames": 0, "read_errors": 0, "encode_ms": 0.0, "encodes": 0, "frames_sent": 0, "frames_dropped": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def viewers(self) -> int:
+        return len(self._viewers)
+
+    def ensure_started(self) -> None:
+        """Open the source and start capturing (raises if the source is unavailable)."""
+        with self._cond:
+            if self.running:
+                return
+            self._source = self.source_factory()
+            self._last_viewer = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name="camera-capture", daemon=True)
+            self._thread.start()
+
+    def _wanted_tiers(self) -> List[str]:
+        """Tiers some viewer currently needs (caller holds the lock)."""
+        wanted = {viewer.tier for viewer in self._viewers.values()}
+        return [name for name in self._tier_names if name in wanted] or self._tier_names[:1]
+
+    def _run(self) -> None:
+        interval = 1.0 / self.fps
+        source = self._source
+        failures = 0
+        try:
+            while True:
+                started = time.perf_counter()
+                with self._cond:
+                    if not self._viewers and time.monotonic() - self._last_viewer > self.idle_timeout:
+                        return
+                    wanted = self._wanted_tiers()
+                frame = source.read()
+                if frame is None:
+                    failures += 1
+                    with self._cond:
+                        self.counters["read_errors"] += 1
+                    if failures >= 50:
+                        return
+                    time.sleep(interval)
+                    continue
+                failures = 0
+
+                encode_started = time.perf_counter()
+                parts = {}
+                for name in wanted:
+                    scale, quality = self.tiers[name]
+                    jpeg = source.encode(frame, scale, quality)
+                    if jpeg is not None:
+                        parts[name] = (
+                            b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: "
+                            + str(len(jpeg)).encode("ascii") + b"\r\n\r\n" + jpeg + b"\r\n"
+                        )
+                encode_ms = (time.perf_counter() - encode_started) * 1000
+
+                with self._cond:
+                    self._seq += 1
+                    self._parts = parts
+                    self.counters["frames"] += 1
+                    self.counters["encodes"] += len(parts)
+                    self.counters["encode_ms"] += encode_ms
+                    self._cond.notify_all()
+                time.sleep(max(0.0, interval - (time.perf_counter() - started)))
+        finally:
+            source.close()
+            with self._cond:
+                self._parts = {}
+                self._cond.notify_all()
+
+    def frames(
+        self,
+        tier: Optional[str] = None,
+        fps: Optional[float] = None,
+        remote: Optional[str] = None,
+    ) -> Iterator[bytes]:
+        """multipart/x-mixed-replace parts for one viewer.
+
+        A fixed tier disables adaptation; fps caps the viewer's frame rate.
+        """
+        adaptive = tier not in self.tiers
+        start_tier = tier if not adaptive else self._tier_names[0]
+        max_fps = min(self.fps, fps) if fps else self.fps
+        with self._cond:
+            viewer = _Viewer(next(self._ids), start_tier, max_fps, adaptive, remote)
+            self._viewers[viewer.id] = viewer
+        last = 0
+        next_due = 0.0
+        try:
+            while True:
+                # lowered frame rate: skip frames until this viewer's next slot
+                wait = next_due - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                with self._cond:
+                    self._cond.wait_for(lambda: self._seq > last or not self.running, timeout=5.0)
+                    if self._seq <= last:
+                        if not self.running:
+                            return
+                        continue
+                    part = self._parts.get(viewer.tier)
+                    if part is None:
+                        # tier not encoded yet for this frame; fall back to any available
+                        part = next(iter(self._parts.values()), None)
+                    if last:
+                        viewer.dropped += self._seq - last - 1
+                        self.counters["frames_dropped"] += self._seq - last - 1
+                    last = self._seq
+                    self.counters["frames_sent"] += 1
+                if part is None:
+                    return
+                next_due = time.monotonic() + 1.0 / viewer.fps
+                written = time.perf_counter()
+                yield part
+                viewer.record_write(len(part), time.perf_counter() - written)
+                viewer.adapt(self._tier_names)
+        finally:
+            with self._cond:
+                self._viewers.pop(viewer.id, None)
+                self._last_viewer = time.monotonic()
+
+    def viewer_stats(self) -> List[Dict[str, Any]]:
+        with self._cond:
+            viewers = list(self._viewers.values())
+        return [viewer.stats() for viewer in viewers]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            frames = self.counters["frames"]
+            tiers = {name: 0 for name in self._tier_names}
+            for viewer in self._viewers.values():
+                tiers[viewer.tier] += 1
+            return {
+                **self.counters,
+                "encode_ms": round(self.counters["encode_ms"], 3),
+                "avg_encode_ms": round(self.counters["encode_ms"] / frames, 3) if frames else 0.0,
+                "running": self.running,
+                "viewers": len(self._viewers),
+                "viewers_per_tier": tiers,
+                "fps": self.fps,
+                "quality": self.quality,
+            }
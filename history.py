@@ -0,0 +1,227 @@
+import os
+import math
+import time
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+__all__ = ["DOWNSAMPLE_METHODS", "RingBuffer", "TelemetryHistory", "telemetry_history"]
+
+# buckets: min/max/avg per bucket (shows the envelope, e.g. battery sag)
+# lttb:    Largest-Triangle-Three-Buckets, one real sample per bucket (line plots)
+DOWNSAMPLE_METHODS = ("buckets", "lttb")
+
+
+class RingBuffer:
+    """Fixed-capacity (timestamp, value) series stored in two float64 arrays.
+
+    The arrays grow to capacity on demand, so a vehicle that reports a few
+    samples does not pay for the full buffer.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, int(capacity))
+        self._ts = array("d")
+        self._values = array("d")
+        self._start = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, ts: float, value: float) -> None:
+        # Keep timestamps monotonic so range lookups can bisect
+        if self._size and ts < self.last_ts:
+            ts = self.last_ts
+        if self._size < self.capacity:
+            # not wrapped yet: _start is 0 and the arrays hold exactly _size samples
+            self._ts.append(ts)
+            self._values.append(value)
+            self._size += 1
+            return
+        idx = self._start
+        self._start = (self._start + 1) % self.capacity
+        self._ts[idx] = ts
+        self._values[idx] = value
+
+    @property
+    def last_ts(self) -> float:
+        return self._ts[(self._start + self._size - 1) % self.capacity]
+
+    def __getitem__(self, i: int) -> float:
+        # Logical (chronological) timestamp access, used by bisect
+        return self._ts[(self._start + i) % self.capacity]
+
+    def _slice(self, buf: array, lo: int, hi: int) -> array:
+        """Copy logical range [lo, hi) in chronological order (at most two slice copies)."""
+        a = (self._start + lo) % self.capacity
+        b = a + (hi - lo)
+        if b <= self.capacity:
+            return buf[a:b]
+        return buf[a:] + buf[:b - self.capacity]
+
+    def range(self, start: Optional[float] = None, end: Optional[float] = None) -> Tuple[array, array]:
+        """Samples with start <= ts <= end, located by binary search."""
+        lo = 0 if start is None else bisect_left(self, start, 0, self._size)
+        hi = self._size if end is None else bisect_right(self, end, 0, self._size)
+        if hi <= lo:
+            return array("d"), array("d")
+        return self._slice(self._ts, lo, hi), self._slice(self._values, lo, hi)
+
+
+def _downsample(ts: array, values: array, max_points: int) -> Dict[str, List[float]]:
+    """Bucket the series into at most max_points min/max/avg triples."""
+    n = len(ts)
+    if n <= max_points:
+        series = values.tolist()
+        return {"t": ts.tolist(), "min": series, "max": series, "avg": series}
+
+    out_t: List[float] = []
+    out_min: List[float] = []
+    out_max: List[float] = []
+    out_avg: List[float] = []
+    step = n / max_points
+    for b in range(max_points):
+        lo = int(b * step)
+        hi = int((b + 1) * step) if b < max_points - 1 else n
+        if hi <= lo:
+            continue
+        chunk = values[lo:hi]
+        out_t.append(ts[(lo + hi - 1) // 2])
+        out_min.append(min(chunk))
+        out_max.append(max(chunk))
+        out_avg.append(sum(chunk) / len(chunk))
+    return {"t": out_t, "min": out_min, "max": out_max, "avg": out_avg}
+
+
+def _lttb(ts: array, values: array, max_points: int) -> Dict[str, List[float]]:
+    """Largest-Triangle-Three-Buckets: keep the sample of each bucket that spans the
+    largest triangle with the previous pick and the next bucket's average."""
+    n = len(ts)
+    if n <= max_points:
+        return {"t": ts.tolist(), "value": values.tolist()}
+    if max_points < 3:
+        # no room for inner buckets: the endpoints only
+        picks = [0, n - 1][:max_points]
+        return {"t": [ts[i] for i in picks], "value": [values[i] for i in picks]}
+
+    out_t = [ts[0]]
+    out_v = [values[0]]
+    step = (n - 2) / (max_points - 2)
+    a = 0
+    for b in range(max_points - 2):
+        lo = int(b * step) + 1
+        hi = int((b + 1) * step) + 1
+        nxt_lo = hi
+        nxt_hi = min(int((b + 2) * step) + 1, n)
+        if nxt_hi <= nxt_lo:
+            nxt_lo, nxt_hi = n - 1, n
+        avg_t = sum(ts[nxt_lo:nxt_hi]) / (nxt_hi - nxt_lo)
+        avg_v = sum(values[nxt_lo:nxt_hi]) / (nxt_hi - nxt_lo)
+        at, av = ts[a], values[a]
+        best, best_area = lo, -1.0
+        for i in range(lo, hi):
+            area = abs((at - avg_t) * (values[i] - av) - (at - ts[i]) * (avg_v - av))
+            if area > best_area:
+                best, best_area = i, area
+        out_t.append(ts[best])
+        out_v.append(values[best])
+        a = best
+    out_t.append(ts[n - 1])
+    out_v.append(values[n - 1])
+    return {"t": out_t, "value": out_v}
+
+
+class TelemetryHistory:
+    """Per-vehicle, per-field ring buffers for numeric telemetry.
+
+    vehicle None is the default vehicle; other vehicles get their buffers on
+    their first sample.
+    """
+
+    def __init__(self, fields: Iterable[str], capacity: int = 100_000):
+        self.capacity = capacity
+        self._fields = list(fields)
+        self._lock = threading.Lock()
+        self._vehicles: Dict[Optional[str], Dict[str, RingBuffer]] = {None: self._new_series()}
+
+    def _new_series(self) -> Dict[str, RingBuffer]:
+        return {f: RingBuffer(self.capacity) for f in self._fields}
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self._fields)
+
+    def vehicles(self) -> List[Optional[str]]:
+        with self._lock:
+            return list(self._vehicles)
+
+    def record(self, updates: Dict[str, Any], ts: Optional[float] = None, vehicle: Optional[str] = None) -> int:
+        """Append every tracked numeric field present in updates; returns samples added.
+
+        Non-finite values (NaN, inf) are skipped: they cannot be serialised as JSON.
+        """
+        if not updates:
+            return 0
+        ts = time.time() if ts is None else ts
+        added = 0
+        with self._lock:
+            series_by_field = self._vehicles.get(vehicle)
+            for field, value in updates.items():
+                if field not in self._fields or isinstance(value, bool):
+                    continue
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    continue
+                if not math.isfinite(value):
+                    continue
+                if series_by_field is None:
+                    series_by_field = self._vehicles[vehicle] = self._new_series()
+                series_by_field[field].append(ts, value)
+                added += 1
+        return added
+
+    def query(
+        self,
+        field: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        max_points: int = 500,
+        method: str = "buckets",
+        vehicle: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Samples of field in [start, end], reduced to at most max_points.
+
+        "buckets" returns t/min/max/avg series, "lttb" returns t/value picked
+        from the raw samples. Raises KeyError for an untracked field and
+        ValueError for an unknown method; a vehicle without samples yields an
+        empty series.
+        """
+        if method not in DOWNSAMPLE_METHODS:
+            raise ValueError(f"Unknown downsampling method: {method}")
+        if field not in self._fields:
+            raise KeyError(field)
+        with self._lock:
+            series = self._vehicles.get(vehicle, {}).get(field)
+            ts, values = series.range(start, end) if series is not None else (array("d"), array("d"))
+
+        reduce = _lttb if method == "lttb" else _downsample
+        result = reduce(ts, values, max(1, int(max_points)))
+        result.update({"field": field, "method": method, "count": len(ts), "points": len(result["t"])})
+        return result
+
+    def stats(self, vehicle: Optional[str] = None) -> Dict[str, int]:
+        with self._lock:
+            series = self._vehicles.get(vehicle, {})
+            return {field: len(series[field]) if field in series else 0 for field in self._fields}
+
+HISTORY_FIELDS = [
+    f.strip()
+    for f in os.getenv("HISTORY_FIELDS", "altitude,speed,battery_percent,battery_voltage").split(",")
+    if f.strip()
+]
+HISTORY_CAPACITY = int(os.getenv("HISTORY_CAPACITY", "100000"))
+
+telemetry_history = TelemetryHistory(HISTORY_FIELDS, HISTORY_CAPACITY)
@@ -0,0 +1,60 @@
+import threading
+from typing import Any, Dict
+
+__all__ = ["ConditionalStats", "conditional_stats"]
+
+
+class ConditionalStats:
+    """Counts full vs 304 responses per endpoint and estimates what the 304s saved.
+
+    Bytes saved uses the size of the last full response for that endpoint;
+    CPU saved uses the average time spent building a full response.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, Dict[str, float]] = {}
+
+    def _entry(self, endpoint: str) -> Dict[str, float]:
+        return self._endpoints.setdefault(endpoint, {
+            "full": 0,
+            "not_modified": 0,
+            "bytes_sent": 0,
+            "bytes_saved": 0,
+            "render_ms": 0.0,
+            "render_ms_saved": 0.0,
+            "last_size": 0,
+        })
+
+    def record_full(self, endpoint: str, size: int, seconds: float = 0.0) -> None:
+        with self._lock:
+            entry = self._entry(endpoint)
+            entry["full"] += 1
+            entry["bytes_sent"] += size
+            entry["render_ms"] += seconds * 1000
+            entry["last_size"] = size
+
+    def record_not_modified(self, endpoint: str, size: int = 0) -> None:
+        """size: body length the 304 replaced, when known (else the last full size)."""
+        with self._lock:
+            entry = self._entry(endpoint)
+            entry["not_modified"] += 1
+            entry["bytes_saved"] += size or entry["last_size"]
+            if entry["full"]:
+                entry["render_ms_saved"] += entry["render_ms"] / entry["full"]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {}
+            for endpoint, entry in self._endpoints.items():
+                total = entry["full"] + entry["not_modified"]
+                out[endpoint] = {
+                    **{k: v for k, v in entry.items() if k != "last_size"},
+                    "render_ms": round(entry["render_ms"], 3),
+                    "render_ms_saved": round(entry["render_ms_saved"], 3),
+                    "hit_ratio": round(entry["not_modified"] / total, 4) if total else 0.0,
+                }
+            return out
+
+
+conditional_stats = ConditionalStats()
@@ -0,0 +1,481 @@
+import os
+import re
+import json
+import uuid
+import bisect
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, UTC
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import metrics
+from startup import lazy_import
+
+__all__ = ["ImageStore", "INDEX_NAME"]
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = ".index.jsonl"
+_SAFE_EXT = re.compile(r"\.[a-z0-9]{1,5}")
+
+ImageMeta = Dict[str, Any]
+
+
+def _sort_key(meta: ImageMeta) -> Tuple[str, str]:
+    return meta.get("timestamp") or "", meta["filename"]
+
+
+def _dimensions(data: bytes) -> Optional[Tuple[int, int]]:
+    """Width/height from the image header (Pillow does not decode pixels here)."""
+    try:
+        with lazy_import("PIL.Image").open(BytesIO(data)) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def _make_cursor(key: Tuple[str, str]) -> str:
+    return f"{key[0]}|{key[1]}"
+
+
+def _parse_cursor(value: str, default_name: str = "") -> Tuple[str, str]:
+    """'timestamp|filename' from a previous page, or a bare ISO timestamp."""
+    timestamp, _, name = value.partition("|")
+    return timestamp, name or default_name
+
+
+class ImageStore:
+    """Content-addressed image persistence with a background writer pool.
+
+    Files are named after the SHA-256 of their bytes, so a repeated frame maps
+    to an existing file and costs no I/O. Writes go to a temp file in the same
+    directory and are renamed into place, so readers never see partial data.
+    Metadata is appended to a JSONL index that other workers tail, and kept in
+    memory with an index sorted by capture time for paginated listing.
+    """
+
+    def __init__(self, folder: str, workers: int = 2):
+        self.folder = folder
+        self.index_path = os.path.join(folder, INDEX_NAME)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="image-writer")
+        self._lock = threading.Lock()
+        self._by_name: Dict[str, ImageMeta] = {}
+        self._by_hash: Dict[str, str] = {}
+        self._pending: Dict[str, bytes] = {}
+        # bumped by clear(); writes queued before it must not re-index their image
+        self._generation = 0
+        self._order: List[Tuple[str, str]] = []
+        self._index_offset = 0
+        self._index_ino = 0
+        self._index_tag = "0"
+        self._bytes = 0
+        self._tombstones = 0
+        self._deleted: Set[str] = set()
+        self._listeners: List[Callable[[ImageMeta], None]] = []
+        self._catalog_listeners: List[Callable[[ImageMeta], None]] = []
+
+        self.counters = {"saved": 0, "deduplicated": 0, "bytes_written": 0, "write_errors": 0}
+
+        os.makedirs(folder, exist_ok=True)
+        self._load_index()
+        self._adopt_unindexed_files()
+
+    # --------------------------------------------------
+    # INDEX
+    # --------------------------------------------------
+    def _add(self, meta: ImageMeta) -> None:
+        existing = self._by_name.get(meta["filename"])
+        if existing is not None:
+            # our own save() already indexed it; the index line may carry more fields
+            if existing is not meta:
+                existing.update(meta)
+            return
+        self._by_name[meta["filename"]] = meta
+        self._bytes += meta.get("size") or 0
+        if meta.get("sha256"):
+            self._by_hash[meta["sha256"]] = meta["filename"]
+        key = _sort_key(meta)
+        if not self._order or key >= self._order[-1]:
+            self._order.append(key)
+        else:
+            bisect.insort(self._order, key)
+        for callback in self._catalog_listeners:
+            callback(meta)
+
+    def _discard(self, meta: ImageMeta) -> None:
+        if self._by_name.pop(meta["filename"], None) is None:
+            return
+        self._bytes -= meta.get("size") or 0
+        self._by_hash.pop(meta.get("sha256"), None)
+        key = _sort_key(meta)
+        i = bisect.bisect_left(self._order, key)
+        if i < len(self._order) and self._order[i] == key:
+            del self._order[i]
+
+    def _reset(self) -> None:
+        self._by_name.clear()
+        self._by_hash.clear()
+        self._order.clear()
+        self._index_offset = 0
+        self._bytes = 0
+        self._tombstones = 0
+        self._deleted.clear()
+
+    def _load_index(self) -> None:
+        """Read index lines appended since the last call (by this or another worker)."""
+        try:
+            stat = os.stat(self.index_path)
+        except OSError:
+            if self._index_offset:
+                # removed by another worker's clear()
+                self._reset()
+                self._index_tag = "0"
+            return
+        size = stat.st_size
+        if size < self._index_offset or (self._index_offset and stat.st_ino != self._index_ino):
+            # index was rewritten (gallery cleared or compacted)
+            self._reset()
+        self._index_ino = stat.st_ino
+        # identical in every worker that has read the same index
+        self._index_tag = f"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{size:x}"
+        if size == self._index_offset:
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_offset)
+            data = f.read(size - self._index_offset)
+        complete = data.rfind(b"\n") + 1
+        for line in data[:complete].splitlines():
+            try:
+                meta = json.loads(line)
+            except ValueError:
+                continue
+            if meta.get("deleted"):
+                # tombstone written by remove()
+                existing = self._by_name.get(meta["filename"])
+                if existing is not None:
+                    self._discard(existing)
+                self._tombstones += 1
+                self._deleted.add(meta["filename"])
+                continue
+            self._add(meta)
+        self._index_offset += complete
+
+    def _append_index(self, *records: Dict[str, Any]) -> None:
+        lines = b"".join(json.dumps(r, separators=(",", ":")).encode("utf-8") + b"\n" for r in records)
+        fd = os.open(self.index_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, lines)
+        finally:
+            os.close(fd)
+
+    def compact_index(self) -> int:
+        """Rewrite the index without tombstones and superseded lines; returns lines dropped.
+
+        Other workers notice the new inode and re-read the index from the start.
+        """
+        with self._lock:
+            self._load_index()
+            dropped = self._tombstones
+            if not dropped:
+                return 0
+            tmp = os.path.join(self.folder, f".tmp-{uuid.uuid4().hex}")
+            live = [self._by_name[name] for _, name in self._order if name not in self._pending]
+            with open(tmp, "wb") as f:
+                for meta in live:
+                    f.write(json.dumps(meta, separators=(",", ":")).encode("utf-8") + b"\n")
+            os.replace(tmp, self.index_path)
+            stat = os.stat(self.index_path)
+            self._index_offset = stat.st_size
+            self._index_ino = stat.st_ino
+            self._index_tag = f"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}"
+            self._tombstones = 0
+            self._deleted.clear()
+        return dropped
+
+    def _adopt_unindexed_files(self) -> None:
+        """Index files written before the store existed (legacy names, mtime as timestamp)."""
+        for name in os.listdir(self.folder):
+            if name.startswith(".") or name in self._by_name:
+                continue
+            path = os.path.join(self.folder, name)
+            if not os.path.isfile(path):
+                continue
+            if name in self._deleted:
+                # removed from the catalog but the process stopped before unlinking
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            stat = os.stat(path)
+            meta = {
+                "filename": name,
+                "sha256": None,
+                "size": stat.st_size,
+                "timestamp": datetime.fromtimestamp(stat.st_mtime, UTC).isoformat(),
+                "source": "legacy",
+            }
+            self._add(meta)
+            self._append_index(meta)
+        self._index_offset = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+
+    def refresh(self) -> None:
+        with self._lock:
+            self._load_index()
+
+    # --------------------------------------------------
+    # WRITES
+    # --------------------------------------------------
+    @metrics.timed("dron_image_write_seconds", "Image persistence time on the writer pool (file, rename, index)")
+    def _write(self, meta: ImageMeta, data: bytes, generation: int) -> Optional[ImageMeta]:
+        path = os.path.join(self.folder, meta["filename"])
+        tmp = os.path.join(self.folder, f".tmp-{uuid.uuid4().hex}")
+        dims = _dimensions(data)
+        if dims is not None:
+            meta["width"], meta["height"] = dims
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            with self._lock:
+                stale = generation != self._generation
+                if not stale:
+                    self._append_index(meta)
+                    self.counters["bytes_written"] += len(data)
+                elif meta["filename"] not in self._by_name:
+                    # the gallery was cleared while this write was in flight
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+        except OSError as exc:
+            with self._lock:
+                self.counters["write_errors"] += 1
+                if generation == self._generation:
+                    self._discard(meta)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise exc
+        finally:
+            with self._lock:
+                # a save of the same content after clear() owns the entry now
+                if self._pending.get(meta["filename"]) is data:
+                    del self._pending[meta["filename"]]
+        if stale:
+            return None
+        for callback in self._listeners:
+            try:
+                callback(meta)
+            except Exception as exc:
+                logger.error(f"[IMAGES] listener failed for {meta['filename']}: {exc}")
+        return meta
+
+    def add_listener(self, callback: Callable[[ImageMeta], None]) -> None:
+        """Call callback(meta) on the writer thread after each new file lands on disk."""
+        self._listeners.append(callback)
+
+    def add_catalog_listener(self, callback: Callable[[ImageMeta], None]) -> None:
+        """Call callback(meta) for every image entering the catalog, including ones
+        indexed by other workers. Runs under the store lock: keep it cheap and do
+        not call back into the store.
+        """
+        self._catalog_listeners.append(callback)
+
+    def save(
+        self,
+        data: bytes,
+        ext: str = ".jpg",
+        source: str = "upload",
+        original_name: Optional[str] = None,
+        on_saved: Optional[Callable[[ImageMeta], None]] = None,
+        extra: Optional[Dict[str, Any]] = None,
+    ) -> ImageMeta:
+        """Queue data for writing and return its metadata immediately.
+
+        extra is merged into the metadata (e.g. GPS at capture). on_saved runs
+        on the writer thread once the file is in place (or right away for a
+        duplicate frame); it is skipped if clear() runs before the write lands.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        ext = (ext or ".jpg").lower()
+        if not ext.startswith("."):
+            ext = "." + ext
+        # extension may come from a client-supplied name
+        if not _SAFE_EXT.fullmatch(ext):
+            ext = ".jpg"
+
+        with self._lock:
+            self._load_index()
+            existing = self._by_hash.get(digest)
+            if existing is not None:
+                self.counters["deduplicated"] += 1
+                meta = {**self._by_name[existing], "duplicate": True}
+            else:
+                meta = {
+                    "filename": f"{digest[:32]}{ext}",
+                    "sha256": digest,
+                    "size": len(data),
+                    "timestamp": datetime.now(UTC).isoformat(),
+                    "source": source,
+                }
+                if original_name:
+                    meta["original_name"] = original_name
+                if extra:
+                    meta.update({k: v for k, v in extra.items() if v is not None})
+                self._add(meta)
+                self._pending[meta["filename"]] = data
+                self.counters["saved"] += 1
+            generation = self._generation
+
+        if meta.get("duplicate"):
+            if on_saved is not None:
+                on_saved(meta)
+            return meta
+
+        future: Future = self._executor.submit(self._write, meta, data, generation)
+        if on_saved is not None:
+            def _done(fut: Future) -> None:
+                if fut.exception() is None:
+                    if fut.result() is not None:
+                        on_saved(meta)
+                else:
+                    logger.error(f"[IMAGES] failed to write {meta['filename']}: {fut.exception()}")
+            future.add_done_callback(_done)
+        return meta
+
+    # --------------------------------------------------
+    # READS
+    # --------------------------------------------------
+    def read_bytes(self, filename: str) -> Optional[bytes]:
+        """Image bytes from the pending queue or disk; None if unknown."""
+        data = self.pending_bytes(filename)
+        if data is not None:
+            return data
+        try:
+            with open(os.path.join(self.folder, filename), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def pending_bytes(self, filename: str) -> Optional[bytes]:
+        """Bytes of an image still queued for writing, so it can be served meanwhile."""
+        with self._lock:
+            return self._pending.get(filename)
+
+    def get(self, filename: str) -> Optional[ImageMeta]:
+        with self._lock:
+            self._load_index()
+            return self._by_name.get(filename)
+
+    def list(self) -> List[ImageMeta]:
+        """All images, newest first."""
+        with self._lock:
+            self._load_index()
+            return [self._by_name[name] for _, name in reversed(self._order)]
+
+    def page(
+        self,
+        cursor: Optional[str] = None,
+        since: Optional[str] = None,
+        limit: int = 100,
+    ) -> Tuple[List[ImageMeta], Optional[str]]:
+        """Newest-first slice of the catalog; returns (items, next_cursor).
+
+        cursor continues after the last item of a previous page (older images);
+        since keeps only images captured after that timestamp or cursor.
+        """
+        with self._lock:
+            self._load_index()
+            hi = len(self._order)
+            if cursor:
+                hi = bisect.bisect_left(self._order, _parse_cursor(cursor))
+            lo = 0
+            if since:
+                lo = bisect.bisect_right(self._order, _parse_cursor(since, "\uffff"))
+            start = max(lo, hi - limit)
+            keys = self._order[start:hi]
+            items = [self._by_name[name] for _, name in reversed(keys)]
+        next_cursor = _make_cursor(keys[0]) if keys and start > lo else None
+        return items, next_cursor
+
+    def catalog_tag(self) -> str:
+        """Changes whenever the catalog does; used as the gallery ETag."""
+        with self._lock:
+            self._load_index()
+            # pending saves are listed before their index line is written
+            return f"{self._index_tag}-{len(self._by_name):x}"
+
+    # --------------------------------------------------
+    # DELETES
+    # --------------------------------------------------
+    def remove(self, filenames: List[str]) -> List[ImageMeta]:
+        """Drop images from the catalog (one tombstone write per batch); returns their metadata.
+
+        Files stay on disk until delete_files(), so callers can archive them first.
+        """
+        with self._lock:
+            self._load_index()
+            removed = []
+            for name in filenames:
+                meta = self._by_name.get(name)
+                if meta is None or name in self._pending:
+                    continue
+                self._discard(meta)
+                removed.append(meta)
+            if removed:
+                # counted in _tombstones when the next _load_index reads them back
+                self._append_index(*({"filename": meta["filename"], "deleted": True} for meta in removed))
+        return removed
+
+    def delete_files(self, filenames: List[str]) -> List[str]:
+        """Unlink files no longer in the catalog; returns error strings.
+
+        A name that was re-saved meanwhile (same content) is kept.
+        """
+        errors = []
+        for name in filenames:
+            with self._lock:
+                if name in self._by_name or name in self._pending:
+                    continue
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                pass
+            except OSError as exc:
+                errors.append(f"{name}: {exc}")
+        return errors
+
+    def clear(self) -> List[str]:
+        """Empty the catalog and remove the index; returns the detached filenames.
+
+        Deleting the files themselves is left to delete_files(), which callers
+        run off the request thread.
+        """
+        with self._lock:
+            names = list(self._by_name)
+            self._reset()
+            self._pending.clear()
+            self._generation += 1
+            try:
+                os.remove(self.index_path)
+            except FileNotFoundError:
+                pass
+        return names
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.counters,
+                "images": len(self._by_name),
+                "bytes": self._bytes,
+                "pending": len(self._pending),
+                "tombstones": self._tombstones,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
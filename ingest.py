@@ -0,0 +1,278 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Tuple
+
+__all__ = ["IngestStage", "IngestPipeline", "POLICIES"]
+
+# Backpressure policies for a full stage queue:
+#   drop_oldest - evict the oldest queued message (latest telemetry wins)
+#   block       - wait up to block_timeout for room, then drop the new message
+#   spill       - write the message to spill_dir and replay it once there is room
+#                 (at most spill_max_bytes on disk; beyond that new messages are dropped)
+POLICIES = ("drop_oldest", "block", "spill")
+
+logger = logging.getLogger(__name__)
+
+Message = Tuple[str, bytes, float]
+
+
+class IngestStage:
+    """Bounded queue plus worker threads for one class of MQTT topics."""
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[str, bytes, float], None],
+        maxsize: int = 1000,
+        policy: str = "drop_oldest",
+        workers: int = 1,
+        block_timeout: float = 1.0,
+        spill_dir: Optional[str] = None,
+        spill_max_bytes: int = 256 * 1024 * 1024,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        if policy == "spill" and not spill_dir:
+            raise ValueError("spill policy requires spill_dir")
+
+        self.name = name
+        self.handler = handler
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self.worker_count = max(1, int(workers))
+
+        self._queue: deque = deque()
+        self._spilled: deque = deque()  # (path, size), oldest first
+        self._spill_bytes = 0
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = False
+
+        self.counters = {
+            "enqueued": 0,
+            "processed": 0,
+            "dropped": 0,
+            "spilled": 0,
+            "spill_errors": 0,
+            "errors": 0,
+            "high_water": 0,
+        }
+
+        if policy == "spill":
+            os.makedirs(spill_dir, exist_ok=True)
+
+    # --------------------------------------------------
+    # PRODUCER SIDE (paho network thread)
+    # --------------------------------------------------
+    def submit(self, topic: str, raw: bytes, recv_ts: float) -> bool:
+        """Enqueue a message; returns False when it was dropped."""
+        item = (topic, raw, recv_ts)
+        spill = False
+        with self._cond:
+            if self._spill_bytes and self.policy == "spill":
+                # older messages are still on disk: queue behind them to keep arrival order
+                spill = True
+            elif len(self._queue) >= self.maxsize:
+                if self.policy == "drop_oldest":
+                    self._queue.popleft()
+                    self.counters["dropped"] += 1
+                elif self.policy == "block":
+                    deadline = time.monotonic() + self.block_timeout
+                    while len(self._queue) >= self.maxsize:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self._running:
+                            self.counters["dropped"] += 1
+                            return False
+                        self._cond.wait(remaining)
+                else:
+                    spill = True
+
+            if not spill:
+                self._queue.append(item)
+                self.counters["enqueued"] += 1
+                depth = len(self._queue)
+                if depth > self.counters["high_water"]:
+                    self.counters["high_water"] = depth
+                self._cond.notify()
+                return True
+
+        # disk write happens outside the lock so workers keep draining
+        return self._spill(item)
+
+    def _spill(self, item: Message) -> bool:
+        topic, raw, recv_ts = item
+        header = f"{recv_ts!r}\n{topic}\n".encode("utf-8")
+        size = len(header) + len(raw)
+        with self._cond:
+            if self._spill_bytes + size > self.spill_max_bytes:
+                self.counters["dropped"] += 1
+                return False
+            # reserved now so concurrent producers cannot overshoot the bound
+            self._spill_bytes += size
+        path = os.path.join(self.spill_dir, f"{recv_ts:.6f}-{uuid.uuid4().hex}.spill")
+        try:
+            with open(path, "wb") as f:
+                f.write(header)
+                f.write(raw)
+        except OSError as exc:
+            logger.error(f"[INGEST] {self.name}: spill failed: {exc}")
+            with self._cond:
+                self._spill_bytes -= size
+                self.counters["dropped"] += 1
+            return False
+        with self._cond:
+            self._spilled.append((path, size))
+            self.counters["spilled"] += 1
+            self._cond.notify()
+        return True
+
+    def _recover_spill(self) -> None:
+        """Pick up messages spilled by a previous process (called with _cond held)."""
+        try:
+            names = sorted(n for n in os.listdir(self.spill_dir) if n.endswith(".spill"))
+        except OSError:
+            return
+        known = {path for path, _ in self._spilled}
+        recovered = []
+        for name in names:
+            path = os.path.join(self.spill_dir, name)
+            if path in known:
+                continue
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            recovered.append((path, size))
+            self._spill_bytes += size
+        # older than anything this process spilled
+        self._spilled.extendleft(reversed(recovered))
+
+    def _load_spilled(self, path: str) -> Optional[Message]:
+        """Read and remove a spill file; None (counted) if it is unreadable or truncated."""
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.remove(path)
+        except OSError as exc:
+            logger.error(f"[INGEST] {self.name}: cannot read spill file {path}: {exc}")
+            with self._cond:
+                self.counters["spill_errors"] += 1
+            return None
+        try:
+            ts_line, topic_line, raw = data.split(b"\n", 2)
+            return topic_line.decode("utf-8"), raw, float(ts_line)
+        except (ValueError, UnicodeDecodeError) as exc:
+            logger.error(f"[INGEST] {self.name}: skipping corrupt spill file {path}: {exc}")
+            with self._cond:
+                self.counters["spill_errors"] += 1
+            return None
+
+    # --------------------------------------------------
+    # CONSUMER SIDE (stage workers)
+    # --------------------------------------------------
+    def _next_item(self) -> Optional[Message]:
+        while True:
+            with self._cond:
+                while self._running and not self._queue and not self._spilled:
+                    self._cond.wait()
+                # the queue holds the older messages: spilling starts only once it is
+                # full, and new messages go to disk while anything is spilled
+                if self._queue:
+                    item = self._queue.popleft()
+                    self._cond.notify_all()
+                    return item
+                if not self._spilled:
+                    return None
+                path, size = self._spilled.popleft()
+                self._spill_bytes -= size
+            # spilled files are read outside the lock
+            item = self._load_spilled(path)
+            if item is not None:
+                return item
+
+    def _worker(self) -> None:
+        while True:
+            item = self._next_item()
+            if item is None:
+                return
+            try:
+                self.handler(*item)
+                with self._cond:
+                    self.counters["processed"] += 1
+            except Exception as exc:
+                with self._cond:
+                    self.counters["errors"] += 1
+                logger.error(f"[INGEST] {self.name}: handler failed on {item[0]}: {exc}")
+
+    def start(self) -> None:
+        """Start the workers; a spill stage first adopts files left in spill_dir.
+
+        Only the process that runs ingest starts its stages, so with several
+        workers sharing spill_dir the leftovers are replayed exactly once.
+        """
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            if self.policy == "spill":
+                self._recover_spill()
+        for i in range(self.worker_count):
+            t = threading.Thread(target=self._worker, name=f"ingest-{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop accepting work; queued messages are drained before workers exit."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                **self.counters,
+                "depth": len(self._queue),
+                "spill_depth": len(self._spilled),
+                "spill_bytes": self._spill_bytes,
+                "capacity": self.maxsize,
+                "policy": self.policy,
+            }
+
+
+class IngestPipeline:
+    """Routes raw MQTT messages to the stage responsible for their topic class."""
+
+    def __init__(self, classify: Callable[[str], str]):
+        self.classify = classify
+        self.stages: Dict[str, IngestStage] = {}
+
+    def add_stage(self, stage: IngestStage) -> IngestStage:
+        self.stages[stage.name] = stage
+        return stage
+
+    def submit(self, topic: str, raw: bytes, recv_ts: Optional[float] = None) -> bool:
+        stage = self.stages.get(self.classify(topic))
+        if stage is None:
+            return False
+        return stage.submit(topic, raw, time.time() if recv_ts is None else recv_ts)
+
+    def start(self) -> None:
+        for stage in self.stages.values():
+            stage.start()
+
+    def stop(self) -> None:
+        for stage in self.stages.values():
+            stage.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: stage.stats() for name, stage in self.stages.items()}
@@ -0,0 +1,420 @@
+import os
+import json
+import time
+import base64
+import logging
+import threading
+from bisect import bisect_right
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+__all__ = ["Journal", "JournalSegment"]
+
+logger = logging.getLogger(__name__)
+
+# Record kinds (first key of every JSON line, so restore can filter by prefix
+# without parsing the large MQTT/image records):
+#   m  raw MQTT message      {"k":"m","ts":..,"topic":..,"p":text | "b":base64}
+#   s  status updates        {"k":"s","ts":..,"u":{...}}
+#   i  latest image          {"k":"i","ts":..,"img":{...}}
+#   l  mission log entry     {"k":"l","ts":..,"e":{...}}
+#   x  mission log cleared   {"k":"x","ts":..}
+#   c  checkpoint            {"k":"c","ts":..,"status":..,"image":..,"logs":[...],"log_seq":..}
+# A checkpoint is appended right behind the record whose state change it
+# snapshots, so everything after it in the file is newer than the snapshot.
+# That relies on record_state being called in the order the changes were
+# applied: state.py runs its listeners under the same lock as the change.
+_STATE_PREFIXES = tuple(f'{{"k":"{kind}"'.encode("ascii") for kind in "silxc")
+_CHECKPOINT_PREFIX = b'{"k":"c"'
+
+# () -> (status, latest image, log tail, next log seq)
+CheckpointProvider = Callable[[], Tuple[Dict[str, Any], Optional[Dict[str, Any]], List[Dict[str, Any]], int]]
+
+
+def _dumps(record: Dict[str, Any]) -> bytes:
+    return json.dumps(record, separators=(",", ":"), default=str).encode("utf-8") + b"\n"
+
+
+class JournalSegment:
+    """One append-only JSONL file plus its sparse (timestamp, offset) index."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index_path = path[:-len(".jsonl")] + ".idx"
+        self.first_ts: Optional[float] = None
+        self.last_ts: Optional[float] = None
+        self.index: List[Tuple[float, int]] = []
+        self.checkpoint: Optional[int] = None
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+
+    @staticmethod
+    def name_for(ts: float) -> str:
+        return f"seg-{int(ts * 1000):015d}.jsonl"
+
+    def load_index(self, index_bytes: int) -> None:
+        """Load the sidecar index, rebuilding it by scanning if missing or stale."""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("size") == self.size:
+                self.first_ts = data["first_ts"]
+                self.last_ts = data["last_ts"]
+                self.index = [tuple(entry) for entry in data["index"]]
+                self.checkpoint = data.get("checkpoint")
+                return
+        except (OSError, ValueError, KeyError):
+            pass
+        self._rebuild_index(index_bytes)
+
+    def _rebuild_index(self, index_bytes: int) -> None:
+        self.index = []
+        self.checkpoint = None
+        next_mark = 0
+        offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    ts = json.loads(line)["ts"]
+                except (ValueError, KeyError):
+                    # torn final line after a crash
+                    break
+                self.note(ts, offset, line.startswith(_CHECKPOINT_PREFIX))
+                if offset >= next_mark:
+                    self.index.append((ts, offset))
+                    next_mark = offset + index_bytes
+                offset += len(line)
+        self.size = offset
+        self.save_index()
+
+    def note(self, ts: float, offset: int, is_checkpoint: bool) -> None:
+        if self.first_ts is None:
+            self.first_ts = ts
+        self.last_ts = ts
+        if is_checkpoint:
+            self.checkpoint = offset
+
+    def save_index(self) -> None:
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "size": self.size,
+                "first_ts": self.first_ts,
+                "last_ts": self.last_ts,
+                "checkpoint": self.checkpoint,
+                "index": self.index,
+            }, f)
+        os.replace(tmp, self.index_path)
+
+    def seek_offset(self, ts: float) -> int:
+        """Offset of the last index mark at or before ts (O(log n))."""
+        keys = [entry[0] for entry in self.index]
+        pos = bisect_right(keys, ts) - 1
+        return self.index[pos][1] if pos >= 0 else 0
+
+    def remove(self) -> None:
+        for path in (self.path, self.index_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class Journal:
+    """Segment-rotated, batched, append-only journal of ingest and state changes."""
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 16 * 1024 * 1024,
+        max_segments: int = 32,
+        flush_interval: float = 0.2,
+        fsync_interval: float = 1.0,
+        index_bytes: int = 64 * 1024,
+        checkpoint_interval: float = 60.0,
+        checkpoint_provider: Optional[CheckpointProvider] = None,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max(1, max_segments)
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.index_bytes = index_bytes
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_provider = checkpoint_provider
+
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._buffer: List[Tuple[float, bytes]] = []
+        self._file = None
+        self._active: Optional[JournalSegment] = None
+        self._next_mark = 0
+        self._last_fsync = time.monotonic()
+        self._last_checkpoint = 0.0
+        self._checkpoint_due = True
+        self._running = False
+        self._local = threading.local()
+
+        self.counters = {"records": 0, "bytes": 0, "flushes": 0, "fsyncs": 0, "rotations": 0, "suppressed": 0}
+
+        os.makedirs(directory, exist_ok=True)
+        self.segments: List[JournalSegment] = []
+        for name in sorted(os.listdir(directory)):
+            if name.startswith("seg-") and name.endswith(".jsonl"):
+                segment = JournalSegment(os.path.join(directory, name))
+                segment.load_index(index_bytes)
+                if segment.first_ts is not None:
+                    self.segments.append(segment)
+                else:
+                    segment.remove()
+
+    # --------------------------------------------------
+    # WRITERS (cheap: only append to the in-memory batch)
+    # --------------------------------------------------
+    def _append(self, record: Dict[str, Any]) -> None:
+        line = _dumps(record)
+        with self._lock:
+            self._buffer.append((record["ts"], line))
+            # snapshot under the buffer lock so no later record can land before it
+            if self.checkpoint_provider is not None and (
+                self._checkpoint_due
+                or time.monotonic() - self._last_checkpoint >= self.checkpoint_interval
+            ):
+                self._buffer.append((record["ts"], _dumps(self._checkpoint_record(record["ts"]))))
+
+    def record_mqtt(self, topic: str, raw: bytes, ts: Optional[float] = None) -> None:
+        record: Dict[str, Any] = {"k": "m", "ts": time.time() if ts is None else ts, "topic": topic}
+        try:
+            record["p"] = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            record["b"] = base64.b64encode(raw).decode("ascii")
+        self._append(record)
+
+    @contextmanager
+    def suppressed(self) -> Iterator[None]:
+        """State changes made by this thread inside the block are not journaled.
+
+        A replay drives the live state; journaling it would change what the
+        next restart restores.
+        """
+        depth = getattr(self._local, "suppressed", 0)
+        self._local.suppressed = depth + 1
+        try:
+            yield
+        finally:
+            self._local.suppressed = depth
+
+    def is_suppressed(self) -> bool:
+        return getattr(self._local, "suppressed", 0) > 0
+
+    def record_state(self, kind: str, data: Any) -> None:
+        """State listener: journals status, image and log events."""
+        if self.is_suppressed():
+            with self._lock:
+                self.counters["suppressed"] += 1
+            return
+        ts = time.time()
+        if kind == "status":
+            self._append({"k": "s", "ts": ts, "u": data})
+        elif kind == "image":
+            self._append({"k": "i", "ts": ts, "img": data})
+        elif kind == "log":
+            self._append({"k": "l", "ts": ts, "e": data})
+        elif kind == "log_clear":
+            self._append({"k": "x", "ts": ts})
+
+    # --------------------------------------------------
+    # FLUSH / ROTATION
+    # --------------------------------------------------
+    def _open_segment(self, ts: float) -> None:
+        name = JournalSegment.name_for(ts)
+        while any(s.path.endswith(name) for s in self.segments):
+            ts += 0.001
+            name = JournalSegment.name_for(ts)
+        segment = JournalSegment(os.path.join(self.directory, name))
+        self._file = open(segment.path, "ab")
+        self._active = segment
+        self._next_mark = 0
+        self.segments.append(segment)
+        while len(self.segments) > self.max_segments:
+            self.segments.pop(0).remove()
+
+    def _close_segment(self) -> None:
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        self._active.save_index()
+        self._active = None
+
+    def _checkpoint_record(self, ts: float) -> Dict[str, Any]:
+        status, image, logs, log_seq = self.checkpoint_provider()
+        self._last_checkpoint = time.monotonic()
+        self._checkpoint_due = False
+        return {"k": "c", "ts": ts, "status": status, "image": image, "logs": logs, "log_seq": log_seq}
+
+    def _write_line(self, ts: float, line: bytes) -> None:
+        segment = self._active
+        offset = segment.size
+        self._file.write(line)
+        segment.size += len(line)
+        segment.note(ts, offset, line.startswith(_CHECKPOINT_PREFIX))
+        if offset >= self._next_mark:
+            segment.index.append((ts, offset))
+            self._next_mark = offset + self.index_bytes
+
+    def flush(self, force_fsync: bool = False) -> int:
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        with self._write_lock:
+            if not batch and not force_fsync:
+                return 0
+            now = time.monotonic()
+            for ts, line in batch:
+                if self._file is None or self._active.size >= self.segment_bytes:
+                    if self._file is not None:
+                        self._close_segment()
+                        self.counters["rotations"] += 1
+                    self._open_segment(ts)
+                    # the next appended record brings a checkpoint into the new segment
+                    with self._lock:
+                        self._checkpoint_due = True
+                self._write_line(ts, line)
+                self.counters["bytes"] += len(line)
+            self.counters["records"] += len(batch)
+            if self._file is not None:
+                self._file.flush()
+                self.counters["flushes"] += 1
+                if force_fsync or now - self._last_fsync >= self.fsync_interval:
+                    os.fsync(self._file.fileno())
+                    self._last_fsync = now
+                    self.counters["fsyncs"] += 1
+        return len(batch)
+
+    def _run(self) -> None:
+        while self._running:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as exc:
+                logger.error(f"[JOURNAL] flush failed: {exc}")
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        threading.Thread(target=self._run, name="journal-flush", daemon=True).start()
+
+    def close(self) -> None:
+        self._running = False
+        self.flush(force_fsync=True)
+        with self._write_lock:
+            self._close_segment()
+
+    # --------------------------------------------------
+    # READERS
+    # --------------------------------------------------
+    def _segments_from(self, ts: Optional[float]) -> List[JournalSegment]:
+        if ts is None:
+            return list(self.segments)
+        firsts = [s.first_ts for s in self.segments]
+        start = max(0, bisect_right(firsts, ts) - 1)
+        return self.segments[start:]
+
+    def iter_records(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        kinds: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Lazily yield records with start <= ts <= end, seeking via the sparse index."""
+        prefixes = None if kinds is None else tuple(f'{{"k":"{k}"'.encode("ascii") for k in kinds)
+        for segment in self._segments_from(start):
+            if end is not None and segment.first_ts is not None and segment.first_ts > end:
+                return
+            offset = segment.seek_offset(start) if start is not None else 0
+            try:
+                f = open(segment.path, "rb")
+            except OSError:
+                continue
+            with f:
+                f.seek(offset)
+                for line in f:
+                    if prefixes is not None and not line.startswith(prefixes):
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    ts = record.get("ts", 0.0)
+                    if start is not None and ts < start:
+                        continue
+                    if end is not None and ts > end:
+                        return
+                    yield record
+
+    def restore(self, log_limit: int = 100) -> Optional[Dict[str, Any]]:
+        """Rebuild status, latest image and log tail from the newest checkpoint onwards."""
+        segments = [s for s in self.segments if s.checkpoint is not None]
+        if not segments:
+            return None
+        segment = segments[-1]
+        status: Dict[str, Any] = {}
+        image = None
+        logs: List[Dict[str, Any]] = []
+        log_seq = 0
+        started = time.perf_counter()
+        replayed = 0
+
+        for seg in self.segments[self.segments.index(segment):]:
+            with open(seg.path, "rb") as f:
+                if seg is segment:
+                    f.seek(segment.checkpoint)
+                for line in f:
+                    if not line.startswith(_STATE_PREFIXES):
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    kind = record["k"]
+                    if kind == "c":
+                        status = dict(record.get("status") or {})
+                        image = record.get("image")
+                        logs = list(record.get("logs") or [])
+                        log_seq = record.get("log_seq", 0)
+                    elif kind == "s":
+                        status.update(record["u"])
+                    elif kind == "i":
+                        image = record["img"]
+                    elif kind == "l":
+                        if record["e"].get("seq", log_seq) < log_seq:
+                            # already part of the checkpoint's log tail
+                            continue
+                        logs.append(record["e"])
+                        if len(logs) > 2 * log_limit:
+                            del logs[:-log_limit]
+                    elif kind == "x":
+                        logs = []
+                    replayed += 1
+
+        return {
+            "status": status,
+            "image": image,
+            "logs": logs[-log_limit:],
+            "records": replayed,
+            "seconds": round(time.perf_counter() - started, 4),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = len(self._buffer)
+        return {
+            **self.counters,
+            "pending": pending,
+            "segments": len(self.segments),
+            "bytes_on_disk": sum(s.size for s in self.segments),
+            "first_ts": self.segments[0].first_ts if self.segments else None,
+            "last_ts": self.segments[-1].last_ts if self.segments else None,
+        }
@@ -0,0 +1,388 @@
+"""Load generator for the web app: simulated drones, dashboard viewers and image bursts.
+
+Drones publish over HTTP (/api/status, /api/log), a real MQTT broker, or an
+in-process stand-in that feeds the app's own MQTT callback. Viewers follow
+/api/stream (SSE) or Socket.IO and time every marked event from publish to
+arrival. Results are JSON with the commit hash and configuration, so runs can
+be compared across commits:
+
+    python loadtest.py --inprocess --drones 20 --rate 10 --viewers 50 --duration 30 -o results.json
+    python loadtest.py --base-url http://localhost:5000 --transport http --drones 10
+    python loadtest.py --base-url http://localhost:5000 --transport mqtt --mqtt-host localhost --mqtt-port 1883
+"""
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import platform
+import threading
+import subprocess
+from datetime import datetime, UTC
+from io import BytesIO
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+from replay import LatencyRecorder
+
+MARKER = "lt|"
+
+
+class Results:
+    """Thread-safe latency samples and counters shared by all load threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = LatencyRecorder(size=100000)
+        self.counts: Dict[str, int] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.latency.add(name, seconds)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def summary(self, duration: float) -> Dict[str, Any]:
+        with self._lock:
+            latency = self.latency.summary()
+            counts = dict(self.counts)
+        for name, stats in latency.items():
+            stats["per_s"] = round(stats["count"] / duration, 2) if duration else 0.0
+        return {"latency": latency, "counts": counts}
+
+
+def _login(session: requests.Session, base_url: str, username: str, password: str) -> None:
+    response = session.post(
+        f"{base_url}/login",
+        data={"username": username, "password": password},
+        allow_redirects=False,
+        timeout=10,
+    )
+    if response.status_code != 302 or "/login" in response.headers.get("Location", ""):
+        raise RuntimeError(f"Login failed for {username!r} (status {response.status_code})")
+    if base_url.startswith("http://") and "Secure" in response.headers.get("Set-Cookie", ""):
+        raise RuntimeError("Server sets Secure cookies; use https or run it with FLASK_DEBUG=true")
+
+
+def _session(args) -> requests.Session:
+    session = requests.Session()
+    _login(session, args.base_url, args.username, args.password)
+    return session
+
+
+def _status_payload() -> Dict[str, Any]:
+    return {
+        "altitude": round(random.uniform(100, 200), 2),
+        "speed": round(random.uniform(5, 15), 1),
+        "battery_percent": random.randint(70, 100),
+        "lat": round(random.uniform(47.5, 47.7), 6),
+        "lon": round(random.uniform(-122.4, -122.3), 6),
+        "flight_mode": random.choice(["AUTO", "GUIDED", "LOITER", "RTL"]),
+    }
+
+
+def _jpeg(width: int, height: int) -> bytes:
+    from PIL import Image
+    img = Image.effect_noise((width, height), random.uniform(20, 80)).convert("RGB")
+    out = BytesIO()
+    img.save(out, "JPEG", quality=80)
+    return out.getvalue()
+
+
+# --------------------------------------------------
+# PUBLISHERS
+# --------------------------------------------------
+def _mqtt_publisher(args) -> Callable[[str, bytes], None]:
+    import paho.mqtt.client as mqtt
+    client = mqtt.Client()
+    if args.mqtt_username:
+        client.username_pw_set(args.mqtt_username, args.mqtt_password)
+    if args.mqtt_tls:
+        client.tls_set()
+    client.connect(args.mqtt_host, args.mqtt_port, keepalive=30)
+    client.loop_start()
+    return lambda topic, payload: client.publish(topic, payload, qos=0)
+
+
+def _inprocess_publisher(webapp) -> Callable[[str, bytes], None]:
+    """Stand-in broker: deliver straight to the app's paho on_message callback."""
+    def publish(topic: str, payload: bytes) -> None:
+        webapp._on_mqtt_message(None, None, SimpleNamespace(topic=topic, payload=payload))
+    return publish
+
+
+# --------------------------------------------------
+# DRONES
+# --------------------------------------------------
+def http_drone(index: int, args, results: Results, stop: threading.Event) -> None:
+    session = _session(args)
+    interval = 1.0 / args.rate
+    seq = 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            response = session.post(f"{args.base_url}/api/status", json=_status_payload(), timeout=10)
+            results.add("http_status", time.perf_counter() - started)
+            results.count("http_status" if response.ok else "http_errors")
+            if seq % args.log_every == 0:
+                t0 = time.perf_counter()
+                session.post(
+                    f"{args.base_url}/api/log",
+                    json={"level": "info", "message": f"{MARKER}{index}|{seq}|{time.time()}"},
+                    timeout=10,
+                )
+                results.add("http_log", time.perf_counter() - t0)
+        except requests.RequestException:
+            results.count("http_errors")
+        seq += 1
+        stop.wait(max(0.0, interval - (time.perf_counter() - started)))
+
+
+def mqtt_drone(index: int, args, publish, results: Results, stop: threading.Event) -> None:
+    interval = 1.0 / args.rate
+    seq = 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        payload = _status_payload()
+        if seq % args.log_every == 0:
+            # logs are emitted immediately, so they carry the end-to-end timestamp
+            payload["message"] = f"{MARKER}{index}|{seq}|{time.time()}"
+        try:
+            publish(args.topic, json.dumps(payload).encode("utf-8"))
+            results.count("published")
+        except Exception:
+            results.count("publish_errors")
+        results.add("publish", time.perf_counter() - started)
+        seq += 1
+        stop.wait(max(0.0, interval - (time.perf_counter() - started)))
+
+
+def image_bursts(args, publish, sent_images: Dict[str, float], results: Results, stop: threading.Event) -> None:
+    """Every image_interval seconds send image_burst frames at once."""
+    width, height = (int(v) for v in args.image_size.split("x"))
+    session = _session(args) if args.transport == "http" else None
+    while not stop.wait(args.image_interval):
+        frames = [_jpeg(width, height) for _ in range(args.image_burst)]
+        threads = []
+        for frame in frames:
+            # the server names files after the content hash, so viewers can match them
+            sent_images[hashlib.sha256(frame).hexdigest()[:32]] = time.time()
+
+            def send(data=frame):
+                started = time.perf_counter()
+                try:
+                    if session is not None:
+                        session.post(f"{args.base_url}/api/image", files={"image": ("burst.jpg", data)}, timeout=30)
+                    else:
+                        publish(args.image_topic, data)
+                    results.add("image_send", time.perf_counter() - started)
+                    results.count("images_sent")
+                except Exception:
+                    results.count("image_errors")
+
+            thread = threading.Thread(target=send, daemon=True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+
+# --------------------------------------------------
+# VIEWERS
+# --------------------------------------------------
+def _on_event(payload: Dict[str, Any], sent_images: Dict[str, float], seen: set, results: Results) -> None:
+    now = time.time()
+    results.count("viewer_events")
+    log = payload.get("log")
+    if log:
+        message = log.get("message", "")
+        marker = message.find(MARKER)
+        if marker >= 0:
+            try:
+                sent = float(message[marker:].split("|")[3])
+                results.add("e2e_log", now - sent)
+            except (IndexError, ValueError):
+                pass
+    image = payload.get("image")
+    if image:
+        stem = os.path.splitext(image.get("filename", ""))[0]
+        sent = sent_images.get(stem)
+        if sent is not None and stem not in seen:
+            seen.add(stem)
+            results.add("e2e_image", now - sent)
+
+
+def sse_viewer(args, sent_images: Dict[str, float], results: Results, stop: threading.Event) -> None:
+    session = _session(args)
+    seen: set = set()
+    try:
+        with session.get(f"{args.base_url}/api/stream", stream=True, timeout=(10, 30)) as response:
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if stop.is_set():
+                    break
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:") and event == "telemetry":
+                    _on_event(json.loads(line[5:]), sent_images, seen, results)
+    except requests.RequestException:
+        if not stop.is_set():
+            results.count("viewer_errors")
+
+
+def socketio_viewer(args, sent_images: Dict[str, float], results: Results, stop: threading.Event) -> None:
+    import socketio
+    session = _session(args)
+    seen: set = set()
+    client = socketio.Client(http_session=session, reconnection=False)
+    client.on("telemetry", lambda payload: _on_event(payload, sent_images, seen, results))
+    try:
+        client.connect(args.base_url)
+        stop.wait()
+    except Exception:
+        results.count("viewer_errors")
+    finally:
+        client.disconnect()
+
+
+# --------------------------------------------------
+# RUN
+# --------------------------------------------------
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def _start_inprocess(args):
+    """Import the app headless and serve it on a local port."""
+    os.environ.setdefault("MQTT_ENABLED", "0")
+    os.environ.setdefault("JOURNAL_ENABLED", "0")
+    os.environ.setdefault("STATE_BACKEND", "memory")
+    from werkzeug.serving import make_server
+    import app as webapp
+
+    # plain-HTTP loopback: production cookie settings would never be sent back
+    webapp.app.config.update(SESSION_COOKIE_SECURE=False, REMEMBER_COOKIE_SECURE=False)
+    webapp.ingest_pipeline.start()
+    server = make_server("127.0.0.1", 0, webapp.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="loadtest-server", daemon=True).start()
+    args.base_url = f"http://127.0.0.1:{server.server_port}"
+    return webapp, server
+
+
+def run(args) -> Dict[str, Any]:
+    results = Results()
+    stop = threading.Event()
+    sent_images: Dict[str, float] = {}
+    webapp = server = None
+
+    if args.inprocess:
+        webapp, server = _start_inprocess(args)
+    if args.transport is None:
+        args.transport = "inprocess" if args.inprocess else "http"
+    if args.transport == "inprocess" and webapp is None:
+        raise SystemExit("--transport inprocess needs --inprocess")
+    publish = None
+    if args.transport == "mqtt":
+        publish = _mqtt_publisher(args)
+    elif args.transport == "inprocess":
+        publish = _inprocess_publisher(webapp)
+
+    viewer = socketio_viewer if args.viewer_transport == "socketio" else sse_viewer
+    threads: List[threading.Thread] = []
+    for _ in range(args.viewers):
+        threads.append(threading.Thread(target=viewer, args=(args, sent_images, results, stop), daemon=True))
+    for i in range(args.drones):
+        if args.transport == "http":
+            target, target_args = http_drone, (i, args, results, stop)
+        else:
+            target, target_args = mqtt_drone, (i, args, publish, results, stop)
+        threads.append(threading.Thread(target=target, args=target_args, daemon=True))
+    if args.image_burst:
+        threads.append(threading.Thread(target=image_bursts, args=(args, publish, sent_images, results, stop), daemon=True))
+
+    # viewers connect first so the first published events are observed
+    for thread in threads[:args.viewers]:
+        thread.start()
+    time.sleep(args.warmup)
+    started = time.monotonic()
+    for thread in threads[args.viewers:]:
+        thread.start()
+    stop.wait(args.duration)
+    stop.set()
+    duration = time.monotonic() - started
+    # let in-flight events drain before summarising
+    time.sleep(min(2.0, args.warmup))
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(UTC).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "duration_s": round(duration, 3),
+            "config": {k: v for k, v in vars(args).items() if k not in ("password", "mqtt_password", "output")},
+        },
+        **results.summary(duration),
+    }
+    if server is not None:
+        server.shutdown()
+        report["server"] = {
+            "ingest": webapp.ingest_pipeline.stats(),
+            "broadcast": webapp.broadcaster.stats(),
+            "stream": webapp.event_stream.stats(),
+        }
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test the drone web app.")
+    parser.add_argument("--base-url", default=os.getenv("LOADTEST_URL", "http://localhost:5000"))
+    parser.add_argument("--username", default=os.getenv("LOADTEST_USER", "admin"))
+    parser.add_argument("--password", default=os.getenv("LOADTEST_PASSWORD", os.getenv("ADMIN_PASSWORD", "admin")))
+    parser.add_argument("--inprocess", action="store_true", help="run the app in this process with a stand-in broker")
+    parser.add_argument("--transport", choices=("http", "mqtt", "inprocess"),
+                        help="how drones publish (default: inprocess with --inprocess, else http)")
+    parser.add_argument("--drones", type=int, default=5)
+    parser.add_argument("--rate", type=float, default=5.0, help="messages per second per drone")
+    parser.add_argument("--log-every", type=int, default=1, help="every Nth drone message carries a timed log marker")
+    parser.add_argument("--viewers", type=int, default=10)
+    parser.add_argument("--viewer-transport", choices=("sse", "socketio"), default="sse")
+    parser.add_argument("--image-burst", type=int, default=0, help="images per burst (0 = no images)")
+    parser.add_argument("--image-interval", type=float, default=5.0)
+    parser.add_argument("--image-size", default="640x480")
+    parser.add_argument("--topic", default="drone/status")
+    parser.add_argument("--image-topic", default="drone/image/raw")
+    parser.add_argument("--mqtt-host", default=os.getenv("MQTT_HOST", "localhost"))
+    parser.add_argument("--mqtt-port", type=int, default=int(os.getenv("MQTT_PORT", "1883")))
+    parser.add_argument("--mqtt-username", default=os.getenv("MQTT_USERNAME", ""))
+    parser.add_argument("--mqtt-password", default=os.getenv("MQTT_PASSWORD", ""))
+    parser.add_argument("--mqtt-tls", action="store_true")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("-o", "--output", help="write the JSON report here as well")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    text = json.dumps(report, indent=2, default=str)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+import os
+import time
+import bisect
+import threading
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+__all__ = [
+    "ENABLED",
+    "Counter",
+    "Histogram",
+    "Registry",
+    "registry",
+    "counter",
+    "histogram",
+    "timed",
+    "gauge_lines",
+    "instrument_app",
+    "render",
+]
+
+# METRICS=0 turns every helper below into a no-op (timed() returns the function unchanged)
+ENABLED = os.getenv("METRICS", "1").strip().lower() in {"1", "true", "yes", "on"}
+
+LabelKey = Tuple[str, ...]
+
+
+def _log_buckets(low: float = 50e-6, high: float = 60.0, per_decade: int = 8) -> List[float]:
+    """Log-spaced upper bounds (HDR-style: constant relative precision per bucket)."""
+    bounds = []
+    step = 10 ** (1.0 / per_decade)
+    value = low
+    while value < high:
+        bounds.append(float(f"{value:.3g}"))
+        value *= step
+    bounds.append(high)
+    return bounds
+
+
+DEFAULT_BUCKETS = _log_buckets()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: LabelKey, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Fixed log-spaced buckets; observe() is a bisect and two increments."""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.bounds = list(buckets)
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[LabelKey, List[Any]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.bounds) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(key, list(s[0]), s[1], s[2]) for key, s in sorted(self._series.items())]
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.bounds, counts):
+                cumulative += n
+                le = 'le="%g"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total:.9g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Any] = {}
+        # callables returning extra exposition lines (gauges read from other components)
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def _get(self, cls, name: str, help_text: str, labels: Sequence[str]):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labels)
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, help_text, labels)
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Histogram:
+        return self._get(Histogram, name, help_text, labels)
+
+    def add_collector(self, collector: Callable[[], List[str]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as exc:
+                lines.append(f"# collector failed: {_escape(exc)}")
+        return "\n".join(lines) + "\n"
+
+
+class _Noop:
+    """Stand-in handed out while metrics are disabled."""
+
+    def inc(self, *args) -> None:
+        pass
+
+    def observe(self, *args) -> None:
+        pass
+
+
+_NOOP = _Noop()
+
+registry = Registry()
+
+
+def counter(name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+    return registry.counter(name, help_text, labels) if ENABLED else _NOOP
+
+
+def histogram(name: str, help_text: str, labels: Sequence[str] = ()) -> Histogram:
+    return registry.histogram(name, help_text, labels) if ENABLED else _NOOP
+
+
+def gauge_lines(name: str, help_text: str, values: Dict[LabelKey, float], labels: Sequence[str] = ()) -> List[str]:
+    """Exposition lines for a gauge computed at scrape time (used by collectors)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for key, value in sorted(values.items()):
+        lines.append(f"{name}{_format_labels(labels, key)} {value:g}")
+    return lines
+
+
+def render() -> str:
+    return registry.render()
+
+
+def timed(name: str, help_text: str, label: Optional[Callable[..., str]] = None):
+    """Decorator recording call duration into a histogram.
+
+    label(*args, **kwargs) may derive one label value ("kind") from the call.
+    Disabled metrics return the function itself, so there is no wrapper cost.
+    """
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+        hist = histogram(name, help_text, ("kind",) if label else ())
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                if label is None:
+                    hist.observe(elapsed)
+                else:
+                    hist.observe(elapsed, label(*args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def instrument_app(app, blueprints: Sequence[str]) -> None:
+    """Per-route latency and status counts for requests served by the given blueprints."""
+    if not ENABLED:
+        return
+    from flask import g, request
+
+    latency = histogram(
+        "dron_http_request_seconds",
+        "Request handling time per blueprint route",
+        ("blueprint", "route", "method"),
+    )
+    responses = counter(
+        "dron_http_responses_total",
+        "Responses per blueprint route and status code",
+        ("blueprint", "route", "status"),
+    )
+    wanted = set(blueprints)
+
+    @app.before_request
+    def _metrics_start():
+        if request.blueprint in wanted:
+            g._metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _metrics_stop(response):
+        started = g.pop("_metrics_started", None)
+        if started is not None:
+            # the rule template, not the URL, keeps label cardinality bounded
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            latency.observe(time.perf_counter() - started, request.blueprint, route, request.method)
+            responses.inc(1, request.blueprint, route, str(response.status_code))
+        return response
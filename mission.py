@@ -0,0 +1,502 @@
+import os
+import json
+import math
+import time
+import uuid
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+__all__ = [
+    "COMMANDS",
+    "MissionPlan",
+    "MissionStore",
+    "SegmentIndex",
+    "haversine",
+    "initial_bearing",
+    "validate_waypoints",
+]
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371008.8
+
+COMMANDS = ("WAYPOINT", "TAKEOFF", "LAND", "RTL")
+
+MAX_WAYPOINTS = int(os.getenv("MISSION_MAX_WAYPOINTS", "1000"))
+MAX_ALTITUDE = float(os.getenv("MISSION_MAX_ALTITUDE", "500"))
+
+
+# --------------------------------------------------
+# GEODESY (arrays in radians)
+# --------------------------------------------------
+def haversine(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in metres, element-wise."""
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def initial_bearing(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Initial great-circle bearing in degrees [0, 360), element-wise."""
+    dlon = lon2 - lon1
+    y = np.sin(dlon) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return np.degrees(np.arctan2(y, x)) % 360.0
+
+
+def _slerp(lat1, lon1, lat2, lon2, fraction, angle) -> Tuple[np.ndarray, np.ndarray]:
+    """Points at `fraction` along great circles of central `angle` (all arrays)."""
+    sin_angle = np.sin(angle)
+    short = sin_angle < 1e-12
+    safe = np.where(short, 1.0, sin_angle)
+    a = np.where(short, 1.0 - fraction, np.sin((1.0 - fraction) * angle) / safe)
+    b = np.where(short, fraction, np.sin(fraction * angle) / safe)
+    x = a * np.cos(lat1) * np.cos(lon1) + b * np.cos(lat2) * np.cos(lon2)
+    y = a * np.cos(lat1) * np.sin(lon1) + b * np.cos(lat2) * np.sin(lon2)
+    z = a * np.sin(lat1) + b * np.sin(lat2)
+    return np.arctan2(z, np.hypot(x, y)), np.arctan2(y, x)
+
+
+# --------------------------------------------------
+# VALIDATION
+# --------------------------------------------------
+def validate_waypoints(waypoints: Any) -> List[Dict[str, Any]]:
+    """Normalized copies of the map's waypoint dicts; raises ValueError on the first problem."""
+    if not isinstance(waypoints, list) or not waypoints:
+        raise ValueError("waypoints must be a non-empty list")
+    if len(waypoints) > MAX_WAYPOINTS:
+        raise ValueError(f"Too many waypoints (max {MAX_WAYPOINTS})")
+    out = []
+    for n, wp in enumerate(waypoints, start=1):
+        if not isinstance(wp, dict):
+            raise ValueError(f"Waypoint {n}: expected an object")
+        try:
+            lat = float(wp["lat"])
+            lon = float(wp["lng"] if "lng" in wp else wp["lon"])
+            alt = float(wp.get("alt", 0.0))
+            delay = float(wp.get("delay", 0.0))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Waypoint {n}: lat, lng, alt and delay must be numbers")
+        command = str(wp.get("command", "WAYPOINT")).upper()
+        if not (math.isfinite(lat) and -90.0 <= lat <= 90.0):
+            raise ValueError(f"Waypoint {n}: latitude out of range")
+        if not (math.isfinite(lon) and -180.0 <= lon <= 180.0):
+            raise ValueError(f"Waypoint {n}: longitude out of range")
+        if not (0.0 <= alt <= MAX_ALTITUDE):
+            raise ValueError(f"Waypoint {n}: altitude must be within 0..{MAX_ALTITUDE:g} m")
+        if not (math.isfinite(delay) and delay >= 0.0):
+            raise ValueError(f"Waypoint {n}: delay must be >= 0")
+        if command not in COMMANDS:
+            raise ValueError(f"Waypoint {n}: unknown command {command!r}")
+        out.append({"lat": lat, "lng": lon, "alt": alt, "command": command, "delay": delay})
+    return out
+
+
+# --------------------------------------------------
+# SEGMENT INDEX
+# --------------------------------------------------
+class SegmentIndex:
+    """Uniform grid over the route's legs in a local metric projection.
+
+    Each leg is registered in every cell it crosses, so a query inspects the
+    position's cell and expanding rings around it until the nearest leg found
+    is provably closer than any unvisited ring; cost depends on the local leg
+    density, not on the route length. Far from the route it falls back to one
+    vectorized pass over all legs.
+    """
+
+    MAX_RINGS = 4
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, cell_m: Optional[float] = None):
+        self.lat0 = float(np.mean(lat))
+        self.lon0 = float(np.mean(lon))
+        self._kx = EARTH_RADIUS_M * math.cos(self.lat0)
+        self.x = (lon - self.lon0) * self._kx
+        self.y = (lat - self.lat0) * EARTH_RADIUS_M
+        self.ax, self.ay = self.x[:-1], self.y[:-1]
+        self.dx, self.dy = np.diff(self.x), np.diff(self.y)
+        self.len2 = self.dx * self.dx + self.dy * self.dy
+        total = float(np.sum(np.sqrt(self.len2)))
+        # about a thousand cells along the route, never finer than 25 m
+        self.cell = cell_m or max(25.0, total / 1000.0)
+        self.cells: Dict[Tuple[int, int], np.ndarray] = {}
+        buckets: Dict[Tuple[int, int], List[int]] = {}
+        for seg in range(len(self.dx)):
+            length = math.sqrt(self.len2[seg])
+            steps = max(1, int(math.ceil(2.0 * length / self.cell)))
+            t = np.linspace(0.0, 1.0, steps + 1)
+            cx = np.floor((self.ax[seg] + t * self.dx[seg]) / self.cell).astype(int)
+            cy = np.floor((self.ay[seg] + t * self.dy[seg]) / self.cell).astype(int)
+            for key in set(zip(cx.tolist(), cy.tolist())):
+                buckets.setdefault(key, []).append(seg)
+        self.cells = {key: np.array(segs, dtype=np.intp) for key, segs in buckets.items()}
+
+    def _project(self, lat_deg: float, lon_deg: float) -> Tuple[float, float]:
+        return (math.radians(lon_deg) - self.lon0) * self._kx, (math.radians(lat_deg) - self.lat0) * EARTH_RADIUS_M
+
+    def _distances(self, segs: np.ndarray, px: float, py: float) -> Tuple[np.ndarray, np.ndarray]:
+        len2 = self.len2[segs]
+        safe = np.where(len2 > 0, len2, 1.0)
+        t = np.clip(((px - self.ax[segs]) * self.dx[segs] + (py - self.ay[segs]) * self.dy[segs]) / safe, 0.0, 1.0)
+        t = np.where(len2 > 0, t, 0.0)
+        ex = self.ax[segs] + t * self.dx[segs] - px
+        ey = self.ay[segs] + t * self.dy[segs] - py
+        return np.hypot(ex, ey), t
+
+    def nearest(self, lat_deg: float, lon_deg: float) -> Tuple[float, int, float]:
+        """(distance m, leg index, fraction along leg) of the closest point on the route."""
+        px, py = self._project(lat_deg, lon_deg)
+        if not len(self.dx):
+            return float(math.hypot(px - self.x[0], py - self.y[0])), 0, 0.0
+        cx, cy = int(math.floor(px / self.cell)), int(math.floor(py / self.cell))
+        seen: set = set()
+        best = (math.inf, 0, 0.0)
+        for ring in range(self.MAX_RINGS + 1):
+            segs = []
+            for ix in range(cx - ring, cx + ring + 1):
+                for iy in range(cy - ring, cy + ring + 1):
+                    if max(abs(ix - cx), abs(iy - cy)) != ring:
+                        continue
+                    found = self.cells.get((ix, iy))
+                    if found is not None:
+                        segs.extend(s for s in found.tolist() if s not in seen)
+            if segs:
+                seen.update(segs)
+                segs = np.array(segs, dtype=np.intp)
+                dist, t = self._distances(segs, px, py)
+                k = int(np.argmin(dist))
+                if dist[k] < best[0]:
+                    best = (float(dist[k]), int(segs[k]), float(t[k]))
+            # legs not seen yet have every sample outside the visited block, and
+            # samples are cell/2 apart, so they are at least this far away
+            if best[0] <= ring * self.cell - self.cell / 4:
+                return best
+        dist, t = self._distances(np.arange(len(self.dx)), px, py)
+        k = int(np.argmin(dist))
+        return float(dist[k]), k, float(t[k])
+
+
+# --------------------------------------------------
+# PLAN
+# --------------------------------------------------
+class MissionPlan:
+    """A waypoint plan with its leg geometry computed once on creation."""
+
+    def __init__(
+        self,
+        waypoints: List[Dict[str, Any]],
+        name: str = "",
+        mission_id: Optional[str] = None,
+        cruise_speed: float = 10.0,
+        climb_rate: float = 3.0,
+        created: Optional[float] = None,
+    ):
+        self.id = mission_id or uuid.uuid4().hex[:12]
+        self.name = name or f"Mission {self.id}"
+        self.waypoints = waypoints
+        self.cruise_speed = max(0.1, float(cruise_speed))
+        self.climb_rate = max(0.1, float(climb_rate))
+        self.created = created or time.time()
+
+        lat = np.radians([wp["lat"] for wp in waypoints])
+        lon = np.radians([wp["lng"] for wp in waypoints])
+        # RTL flies back to the launch point (first waypoint)
+        rtl = np.array([wp["command"] == "RTL" for wp in waypoints])
+        lat[rtl], lon[rtl] = lat[0], lon[0]
+        self.lat, self.lon = lat, lon
+        self.alt = np.array([wp["alt"] for wp in waypoints], dtype=float)
+        self.delay = np.array([wp["delay"] for wp in waypoints], dtype=float)
+
+        self.leg_m = haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        self.bearing = initial_bearing(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        self.climb_m = np.diff(self.alt)
+        # conservative: horizontal and vertical segments flown one after another
+        self.leg_s = self.leg_m / self.cruise_speed + np.abs(self.climb_m) / self.climb_rate + self.delay[1:]
+        self.cumulative_m = np.concatenate(([0.0], np.cumsum(self.leg_m)))
+        self.index = SegmentIndex(lat, lon)
+
+    @property
+    def total_m(self) -> float:
+        return float(self.cumulative_m[-1])
+
+    @property
+    def flight_time_s(self) -> float:
+        return float(self.delay[0] + np.sum(self.leg_s))
+
+    def battery_budget(self, endurance_s: float, reserve_percent: float, available_percent: Optional[float] = None) -> Dict[str, Any]:
+        """Battery share the plan needs, assuming linear drain over `endurance_s`."""
+        required = self.flight_time_s / max(endurance_s, 1.0) * 100.0
+        budget = {
+            "required_percent": round(required, 1),
+            "reserve_percent": reserve_percent,
+            "endurance_s": endurance_s,
+        }
+        if available_percent is not None:
+            budget["available_percent"] = available_percent
+            budget["feasible"] = bool(required + reserve_percent <= available_percent)
+        return budget
+
+    def _points_at(self, along: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions at the given distances along the route (metres from the start)."""
+        if len(self.leg_m) == 0:
+            return np.repeat(self.lat, len(along)), np.repeat(self.lon, len(along))
+        leg = np.clip(np.searchsorted(self.cumulative_m, along, side="right") - 1, 0, len(self.leg_m) - 1)
+        length = self.leg_m[leg]
+        fraction = np.where(length > 0, (along - self.cumulative_m[leg]) / np.where(length > 0, length, 1.0), 0.0)
+        fraction = np.clip(fraction, 0.0, 1.0)
+        lat, lon = _slerp(
+            self.lat[leg], self.lon[leg], self.lat[leg + 1], self.lon[leg + 1],
+            fraction, length / EARTH_RADIUS_M,
+        )
+        return lat, lon
+
+    def densify(self, spacing_m: float) -> List[List[float]]:
+        """Route with a point at least every spacing_m metres (waypoints kept)."""
+        spacing_m = max(1.0, float(spacing_m))
+        along = np.union1d(np.arange(0.0, self.total_m, spacing_m), self.cumulative_m)
+        return self._as_points(*self._points_at(along))
+
+    def resample(self, count: int) -> List[List[float]]:
+        """count points spaced evenly along the route."""
+        count = max(2, int(count))
+        return self._as_points(*self._points_at(np.linspace(0.0, self.total_m, count)))
+
+    @staticmethod
+    def _as_points(lat: np.ndarray, lon: np.ndarray) -> List[List[float]]:
+        return np.round(np.column_stack((np.degrees(lat), np.degrees(lon))), 7).tolist()
+
+    def progress(self, lat_deg: float, lon_deg: float) -> Dict[str, Any]:
+        """Where a position is relative to the route: cross-track distance, next waypoint, distance left."""
+        distance, leg, fraction = self.index.nearest(lat_deg, lon_deg)
+        here_lat, here_lon = math.radians(lat_deg), math.radians(lon_deg)
+        next_wp = min(leg + 1, len(self.waypoints) - 1)
+        to_next = float(haversine(here_lat, here_lon, self.lat[next_wp], self.lon[next_wp]))
+        along = float(self.cumulative_m[leg] + fraction * (self.leg_m[leg] if len(self.leg_m) else 0.0))
+        return {
+            "distance_to_route_m": round(distance, 2),
+            "leg": leg,
+            "leg_fraction": round(fraction, 4),
+            "next_waypoint": next_wp,
+            "distance_to_next_m": round(to_next, 2),
+            "along_route_m": round(along, 2),
+            "remaining_m": round(self.total_m - along, 2),
+        }
+
+    def to_dict(self, analysis: bool = True) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "id": self.id,
+            "name": self.name,
+            "created": self.created,
+            "cruise_speed": self.cruise_speed,
+            "climb_rate": self.climb_rate,
+            "waypoints": self.waypoints,
+        }
+        if analysis:
+            data["legs"] = [
+                {"from": i, "to": i + 1, "distance_m": round(d, 2), "bearing_deg": round(b, 1),
+                 "climb_m": round(c, 2), "time_s": round(s, 1)}
+                for i, (d, b, c, s) in enumerate(zip(
+                    self.leg_m.tolist(), self.bearing.tolist(), self.climb_m.tolist(), self.leg_s.tolist()
+                ))
+            ]
+            data["total_m"] = round(self.total_m, 2)
+            data["flight_time_s"] = round(self.flight_time_s, 1)
+        return data
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "created": self.created,
+            "waypoints": len(self.waypoints),
+            "total_m": round(self.total_m, 2),
+            "flight_time_s": round(self.flight_time_s, 1),
+        }
+
+
+# --------------------------------------------------
+# STORE
+# --------------------------------------------------
+class MissionStore:
+    """Mission plans persisted to one JSON file, with one active plan per vehicle.
+
+    Every worker serves from its own copy and re-reads the file when another
+    one rewrote it. The active plan's progress is computed on read from the
+    position the caller passes in and cached until that position changes.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        cruise_speed: float = 10.0,
+        climb_rate: float = 3.0,
+        endurance_s: float = 1200.0,
+        reserve_percent: float = 20.0,
+    ):
+        self.path = path
+        self.cruise_speed = cruise_speed
+        self.climb_rate = climb_rate
+        self.endurance_s = endurance_s
+        self.reserve_percent = reserve_percent
+        self._lock = threading.Lock()
+        self._plans: Dict[str, MissionPlan] = {}
+        # vehicle -> mission id / (plan, lat, lon, progress) of the last read
+        self._active: Dict[str, str] = {}
+        self._progress: Dict[str, Tuple[MissionPlan, float, float, Dict[str, Any]]] = {}
+        # (inode, mtime, size) of the file as last loaded or written
+        self._stamp: Optional[Tuple[int, int, int]] = None
+        with self._lock:
+            self._refresh()
+
+    def _file_stamp(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self) -> None:
+        """Reload if the file changed since we last read or wrote it (caller holds the lock)."""
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return
+        self._stamp = stamp
+        self._plans, self._active = self._load()
+
+    def _load(self) -> Tuple[Dict[str, MissionPlan], Dict[str, str]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}, {}
+        except (OSError, ValueError) as exc:
+            logger.error(f"[MISSION] store unreadable, starting empty: {exc}")
+            return {}, {}
+        plans: Dict[str, MissionPlan] = {}
+        for item in data.get("missions", []):
+            try:
+                plan = MissionPlan(
+                    validate_waypoints(item["waypoints"]),
+                    name=item.get("name", ""),
+                    mission_id=item["id"],
+                    cruise_speed=item.get("cruise_speed", self.cruise_speed),
+                    climb_rate=item.get("climb_rate", self.climb_rate),
+                    created=item.get("created"),
+                )
+            except (KeyError, ValueError) as exc:
+                logger.warning(f"[MISSION] skipping stored mission: {exc}")
+                continue
+            plans[plan.id] = plan
+        return plans, {v: m for v, m in data.get("active", {}).items() if m in plans}
+
+    def _save(self) -> None:
+        """Rewrite the file atomically (caller holds the lock)."""
+        data = {
+            "missions": [plan.to_dict(analysis=False) for plan in self._plans.values()],
+            "active": self._active,
+        }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.tmp-{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+        self._stamp = self._file_stamp()
+
+    def create(self, data: Dict[str, Any], mission_id: Optional[str] = None) -> MissionPlan:
+        """Validate and store a plan (replacing mission_id if given); raises ValueError."""
+        try:
+            cruise_speed = float(data.get("cruise_speed", self.cruise_speed))
+            climb_rate = float(data.get("climb_rate", self.climb_rate))
+        except (TypeError, ValueError):
+            raise ValueError("cruise_speed and climb_rate must be numbers")
+        plan = MissionPlan(
+            validate_waypoints(data.get("waypoints")),
+            name=str(data.get("name") or ""),
+            mission_id=mission_id,
+            cruise_speed=cruise_speed,
+            climb_rate=climb_rate,
+        )
+        with self._lock:
+            self._refresh()
+            self._plans[plan.id] = plan
+            self._save()
+        return plan
+
+    def get(self, mission_id: str) -> Optional[MissionPlan]:
+        with self._lock:
+            self._refresh()
+            return self._plans.get(mission_id)
+
+    def delete(self, mission_id: str) -> bool:
+        with self._lock:
+            self._refresh()
+            if self._plans.pop(mission_id, None) is None:
+                return False
+            for vehicle in [v for v, m in self._active.items() if m == mission_id]:
+                del self._active[vehicle]
+            self._save()
+        return True
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._refresh()
+            plans = sorted(self._plans.values(), key=lambda p: p.created)
+            active = dict(self._active)
+        return [
+            {**plan.summary(), "active_for": sorted(v for v, m in active.items() if m == plan.id)}
+            for plan in plans
+        ]
+
+    def activate(self, mission_id: Optional[str], vehicle: str) -> None:
+        """Make mission_id the vehicle's active plan (None clears it); raises KeyError."""
+        with self._lock:
+            self._refresh()
+            if mission_id is None:
+                self._active.pop(vehicle, None)
+            elif mission_id not in self._plans:
+                raise KeyError(mission_id)
+            else:
+                self._active[vehicle] = mission_id
+            self._save()
+
+    def active(self, vehicle: str) -> Optional[MissionPlan]:
+        with self._lock:
+            self._refresh()
+            mission_id = self._active.get(vehicle)
+            return self._plans.get(mission_id) if mission_id else None
+
+    def budget(self, plan: MissionPlan, available_percent: Optional[float] = None) -> Dict[str, Any]:
+        return plan.battery_budget(self.endurance_s, self.reserve_percent, available_percent)
+
+    def progress(self, vehicle: str, status: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Progress of the vehicle's active plan at the position in status.
+
+        None without a plan or a position; (0, 0) is the "no fix" placeholder
+        and counts as no position.
+        """
+        plan = self.active(vehicle)
+        if plan is None or not status:
+            return None
+        lat, lon = status.get("gps_lat", status.get("lat")), status.get("gps_lon", status.get("lon"))
+        try:
+            lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            return None
+        if lat == 0.0 and lon == 0.0:
+            return None
+        with self._lock:
+            cached = self._progress.get(vehicle)
+        if cached is not None and cached[0] is plan and cached[1] == lat and cached[2] == lon:
+            return cached[3]
+        # computed outside the lock: a large plan must not stall other store calls
+        progress = plan.progress(lat, lon)
+        progress.update({"mission": plan.id, "timestamp": time.time()})
+        with self._lock:
+            self._progress[vehicle] = (plan, lat, lon, progress)
+        return progress
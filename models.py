@@ -3,16 +3,25 @@ from werkzeug.security import generate_password_hash
 from flask_login import UserMixin
 
 class User(UserMixin):
-    def __init__(self, id, username, password_hash):
+    def __init__(self, id, username, password_hash=None, password=None):
         self.id = id
         self.username = username
-        self.password_hash = password_hash
+        self._password_hash = password_hash
+        self._password = password
+
+    @property
+    def password_hash(self):
+        # hashed on first login rather than at import: scrypt takes ~0.1 s of worker boot
+        if self._password_hash is None and self._password is not None:
+            self._password_hash = generate_password_hash(self._password)
+            self._password = None
+        return self._password_hash
 
 # In-memory user store (for demo purposes)
 default_admin_password = os.getenv("ADMIN_PASSWORD", "admin")
 
 users = {
-    "admin": User(id=1, username="admin", password_hash=generate_password_hash(default_admin_password))
+    "admin": User(id=1, username="admin", password=default_admin_password)
 }
 
 
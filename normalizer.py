@@ -0,0 +1,269 @@
+import os
+import json
+import struct
+import threading
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+__all__ = [
+    "DEFAULT_SCHEMA",
+    "ENCODINGS",
+    "STRUCT_LAYOUTS",
+    "Decoded",
+    "TelemetryNormalizer",
+    "load_schema",
+    "split_encoding",
+    "encoding_for_content_type",
+]
+
+# Payload encodings, selected by a trailing topic segment ("drone/pose/struct",
+# "drone/image/raw"); topics without one are JSON
+ENCODINGS = ("json", "msgpack", "cbor", "struct", "raw")
+
+_CONTENT_TYPES = {
+    "application/json": "json",
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+    "application/vnd.msgpack": "msgpack",
+    "application/cbor": "cbor",
+    "application/octet-stream": "raw",
+    "image/jpeg": "raw",
+    "image/png": "raw",
+    "image/webp": "raw",
+}
+
+# Fixed little-endian layouts for "struct" topics, keyed by topic suffix.
+# pose: timestamp (f64), lat, lon (f64), alt, speed, heading (f32) = 36 bytes
+STRUCT_LAYOUTS: Dict[str, Tuple[struct.Struct, Tuple[str, ...]]] = {
+    "pose": (struct.Struct("<dddfff"), ("timestamp", "lat", "lon", "alt", "speed", "heading")),
+}
+
+
+def split_encoding(topic: str) -> Tuple[str, str]:
+    """'drone/pose/struct' -> ('drone/pose', 'struct'); plain topics are JSON."""
+    base, _, last = topic.rpartition("/")
+    if base and last in ENCODINGS:
+        return base, last
+    return topic, "json"
+
+
+def encoding_for_content_type(content_type: Optional[str]) -> Optional[str]:
+    if not content_type:
+        return None
+    return _CONTENT_TYPES.get(content_type.split(";", 1)[0].strip().lower())
+
+# topic suffix -> status field -> spec. "*" applies to every topic; a more
+# specific topic's aliases win over the defaults for the same field.
+#   aliases: payload keys, first match wins
+#   type:    number (int/float kept, strings parsed), float, int, str, raw
+#   scale / offset: unit conversion for numeric types (value * scale + offset)
+DEFAULT_SCHEMA: Dict[str, Dict[str, Dict[str, Any]]] = {
+    "*": {
+        "altitude": {"aliases": ["altitude", "alt"], "type": "number"},
+        "speed": {"aliases": ["speed", "velocity"], "type": "number"},
+        "battery_percent": {"aliases": ["battery_percent", "battery", "percent"], "type": "number"},
+        "battery_voltage": {"aliases": ["battery_voltage", "voltage"], "type": "number"},
+        "gps_relative": {"aliases": ["gps_relative"], "type": "raw"},
+        "flight_mode": {"aliases": ["flight_mode", "mode"], "type": "str"},
+        "mission_time": {"aliases": ["mission_time"], "type": "str"},
+        "heading": {"aliases": ["heading", "yaw"], "type": "number"},
+        "gps_lat": {"aliases": ["lat", "latitude"], "type": "float"},
+        "gps_lon": {"aliases": ["lon", "longitude"], "type": "float"},
+    },
+    "battery": {
+        "battery_percent": {"aliases": ["percent"], "type": "number"},
+        "battery_voltage": {"aliases": ["voltage"], "type": "number"},
+    },
+}
+
+
+class Decoded(NamedTuple):
+    """An MQTT payload after the single decode pass.
+
+    payload is the outer message (used for log/message keys); structured is
+    the same object, or the JSON object a ROS2 std_msgs/String carried in
+    its "data" field.
+    """
+
+    payload: Any
+    structured: Any
+
+
+def _number(value: Any) -> Any:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return float(value)
+
+
+_CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    "number": _number,
+    "float": float,
+    "int": int,
+    "str": str,
+    "raw": lambda value: value,
+}
+
+
+def _converter(spec: Dict[str, Any]) -> Callable[[Any], Any]:
+    kind = spec.get("type", "raw")
+    base = _CONVERTERS.get(kind)
+    if base is None:
+        raise ValueError(f"Unknown field type: {kind}")
+    scale = spec.get("scale")
+    offset = spec.get("offset")
+    if kind in ("number", "float", "int") and (scale is not None or offset is not None):
+        scale = 1.0 if scale is None else float(scale)
+        offset = 0.0 if offset is None else float(offset)
+        return lambda value: base(value) * scale + offset
+    return base
+
+
+def load_schema(path: Optional[str] = None) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """DEFAULT_SCHEMA with a JSON file (TELEMETRY_SCHEMA) merged over it per topic/field."""
+    schema = {topic: dict(fields) for topic, fields in DEFAULT_SCHEMA.items()}
+    path = path or os.getenv("TELEMETRY_SCHEMA")
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+        for topic, fields in overrides.items():
+            schema.setdefault(topic, {}).update(fields)
+    return schema
+
+
+# alias -> (rank, target field, converter); lower rank wins
+_Table = Dict[str, Tuple[int, str, Callable[[Any], Any]]]
+
+
+class TelemetryNormalizer:
+    """Decodes MQTT payloads and maps them onto status fields.
+
+    Each topic's alias table is compiled once from the schema and cached, so a
+    message costs one pass over its own keys.
+    """
+
+    MAX_TOPICS = 1024
+
+    def __init__(self, schema: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None):
+        self.schema = schema or load_schema()
+        # validate every spec up front rather than on the first matching message
+        self._compiled = {
+            topic: [(target, spec.get("aliases") or [target], _converter(spec)) for target, spec in fields.items()]
+            for topic, fields in self.schema.items()
+        }
+        self._tables: Dict[str, _Table] = {}
+        self._lock = threading.Lock()
+        self.invalid = 0
+
+    # --------------------------------------------------
+    # DECODE
+    # --------------------------------------------------
+    @staticmethod
+    def _unwrap(payload: Any) -> Decoded:
+        """Pair payload with the JSON object a ROS2 string carries in "data", if any."""
+        structured = payload
+        if isinstance(payload, dict):
+            inner = payload.get("data")
+            # only JSON objects; skips base64 image data without attempting a parse
+            if isinstance(inner, str) and inner[:1] == "{":
+                try:
+                    decoded = json.loads(inner)
+                except ValueError:
+                    decoded = None
+                if isinstance(decoded, dict):
+                    structured = decoded
+        return Decoded(payload, structured)
+
+    def decode(self, raw: bytes, encoding: str = "json", topic: str = "") -> Decoded:
+        """bytes -> Decoded in a single pass for the given payload encoding.
+
+        Binary encodings never go through text decoding; "raw" hands the bytes
+        through untouched (image frames).
+        """
+        if encoding == "raw":
+            return Decoded(raw, raw)
+        if encoding == "struct":
+            return self._decode_struct(raw, topic)
+        if encoding == "msgpack":
+            if msgpack is None:
+                raise RuntimeError("msgpack payload received but the msgpack package is not installed")
+            return self._unwrap(msgpack.unpackb(raw, raw=False))
+        if encoding == "cbor":
+            if cbor2 is None:
+                raise RuntimeError("CBOR payload received but the cbor2 package is not installed")
+            return self._unwrap(cbor2.loads(raw))
+
+        try:
+            text = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            text = raw.decode("utf-8", errors="ignore")
+            return Decoded(text, text)
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            return Decoded(text, text)
+        return self._unwrap(payload)
+
+    @staticmethod
+    def _decode_struct(raw: bytes, topic: str) -> Decoded:
+        for suffix, (layout, fields) in STRUCT_LAYOUTS.items():
+            if topic.endswith(suffix):
+                payload = dict(zip(fields, layout.unpack(raw)))
+                return Decoded(payload, payload)
+        raise ValueError(f"No struct layout for topic {topic!r}")
+
+    # --------------------------------------------------
+    # FIELD MAPPING
+    # --------------------------------------------------
+    def _compile(self, topic: str) -> _Table:
+        table: _Table = {}
+        rank = 0
+        # topic-specific schemas first (longest suffix first), then "*"
+        keys = sorted((k for k in self._compiled if k != "*" and topic.endswith(k)), key=len, reverse=True)
+        for key in keys + ["*"]:
+            for target, aliases, convert in self._compiled.get(key, ()):
+                for alias in aliases:
+                    if alias not in table:
+                        table[alias] = (rank, target, convert)
+                    rank += 1
+        with self._lock:
+            if len(self._tables) >= self.MAX_TOPICS:
+                self._tables.clear()
+            self._tables[topic] = table
+        return table
+
+    def extract(self, topic: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Status updates carried by payload for this topic."""
+        table = self._tables.get(topic) or self._compile(topic)
+        updates: Dict[str, Any] = {}
+        ranks: Dict[str, int] = {}
+        lookup = table.get
+        for key, value in payload.items():
+            entry = lookup(key)
+            if entry is None or value is None:
+                continue
+            rank, target, convert = entry
+            if target in ranks and ranks[target] <= rank:
+                continue
+            try:
+                updates[target] = convert(value)
+            except (TypeError, ValueError):
+                self.invalid += 1
+                continue
+            ranks[target] = rank
+
+        # string form kept for clients that display "lat,lon"
+        if "gps_lat" in updates and "gps_lon" in updates:
+            updates["gps_global"] = f"{updates['gps_lat']},{updates['gps_lon']}"
+        return updates
+
+    def stats(self) -> Dict[str, Any]:
+        return {"topics_compiled": len(self._tables), "invalid_values": self.invalid}
@@ -0,0 +1,259 @@
+import os
+import sys
+import json
+import time
+import base64
+import logging
+import argparse
+import threading
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+__all__ = ["VirtualClock", "journal_source", "ReplaySession", "ReplayManager", "LatencyRecorder"]
+
+logger = logging.getLogger(__name__)
+
+Message = Tuple[float, str, bytes]
+
+
+def journal_source(journal, start: Optional[float] = None, end: Optional[float] = None) -> Iterator[Message]:
+    """Lazily yield recorded MQTT messages as (ts, topic, raw bytes)."""
+    for record in journal.iter_records(start, end, kinds="m"):
+        if "b" in record:
+            raw = base64.b64decode(record["b"])
+        else:
+            raw = record.get("p", "").encode("utf-8")
+        yield record["ts"], record["topic"], raw
+
+
+class VirtualClock:
+    """Maps recorded timestamps onto wall time at a given speed (0 = as fast as possible)."""
+
+    def __init__(self, speed: float = 1.0):
+        self.speed = max(0.0, float(speed))
+        self._virtual_origin: Optional[float] = None
+        self._wall_origin: Optional[float] = None
+
+    def now(self) -> Optional[float]:
+        if self._virtual_origin is None:
+            return None
+        if self.speed == 0:
+            return self._virtual_origin
+        return self._virtual_origin + (time.monotonic() - self._wall_origin) * self.speed
+
+    def wait_until(self, ts: float, stop: threading.Event) -> float:
+        """Sleep until ts is due; returns how late (seconds) the message is."""
+        if self._virtual_origin is None:
+            self._virtual_origin = ts
+            self._wall_origin = time.monotonic()
+            return 0.0
+        if self.speed == 0:
+            self._virtual_origin = ts
+            return 0.0
+        due = self._wall_origin + (ts - self._virtual_origin) / self.speed
+        delay = due - time.monotonic()
+        if delay > 0:
+            stop.wait(delay)
+            return 0.0
+        return -delay
+
+
+class LatencyRecorder:
+    """Bounded reservoir of per-stage latencies with percentile summaries."""
+
+    def __init__(self, size: int = 10000):
+        self.size = size
+        self.samples: Dict[str, List[float]] = {}
+        self.counts: Dict[str, int] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        bucket = self.samples.setdefault(stage, [])
+        count = self.counts.get(stage, 0)
+        if len(bucket) < self.size:
+            bucket.append(seconds)
+        else:
+            # keep a rolling window of the most recent samples
+            bucket[count % self.size] = seconds
+        self.counts[stage] = count + 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        out = {}
+        for stage, bucket in self.samples.items():
+            if not bucket:
+                continue
+            ordered = sorted(bucket)
+            n = len(ordered)
+            out[stage] = {
+                "count": self.counts[stage],
+                "p50_ms": round(ordered[n // 2] * 1000, 4),
+                "p99_ms": round(ordered[min(n - 1, int(n * 0.99))] * 1000, 4),
+                "max_ms": round(ordered[-1] * 1000, 4),
+                "mean_ms": round(sum(ordered) / n * 1000, 4),
+            }
+        return out
+
+
+class ReplaySession:
+    """Feeds a message source through named pipeline stages under a virtual clock.
+
+    `stages` is an ordered list of (name, callable); the first callable receives
+    (topic, raw, ts) and each following one receives (topic, previous_result).
+    `context` (e.g. Journal.suppressed) is entered around the whole run, in the
+    replay thread.
+    """
+
+    def __init__(
+        self,
+        source: Iterator[Message],
+        stages: List[Tuple[str, Callable[..., Any]]],
+        speed: float = 1.0,
+        limit: Optional[int] = None,
+        context: Optional[Callable[[], ContextManager]] = None,
+    ):
+        self.source = source
+        self.stages = stages
+        self.context = context
+        self.clock = VirtualClock(speed)
+        self.limit = limit
+        self.latency = LatencyRecorder()
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.messages = 0
+        self.errors = 0
+        self.max_lag = 0.0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.position: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def run(self) -> Dict[str, Any]:
+        """Replay synchronously until the source is exhausted, limit reached or stopped."""
+        self.started_at = time.monotonic()
+        with self.context() if self.context is not None else nullcontext():
+            self._replay()
+        self.finished_at = time.monotonic()
+        return self.stats()
+
+    def _replay(self) -> None:
+        for ts, topic, raw in self.source:
+            if self._stop.is_set() or (self.limit is not None and self.messages >= self.limit):
+                break
+            lag = self.clock.wait_until(ts, self._stop)
+            if self._stop.is_set():
+                break
+            self.max_lag = max(self.max_lag, lag)
+            self.position = ts
+
+            started = time.perf_counter()
+            name = None
+            try:
+                result = None
+                for i, (name, stage) in enumerate(self.stages):
+                    t0 = time.perf_counter()
+                    result = stage(topic, raw, ts) if i == 0 else stage(topic, result)
+                    self.latency.add(name, time.perf_counter() - t0)
+            except Exception:
+                self.errors += 1
+                logger.exception(f"[REPLAY] stage {name} failed on {topic} at {ts}")
+            self.latency.add("total", time.perf_counter() - started)
+            self.messages += 1
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.run, name="replay", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        end = self.finished_at or time.monotonic()
+        elapsed = (end - self.started_at) if self.started_at else 0.0
+        return {
+            "running": self.running,
+            "speed": self.clock.speed,
+            "messages": self.messages,
+            "errors": self.errors,
+            "elapsed_s": round(elapsed, 4),
+            "messages_per_s": round(self.messages / elapsed, 2) if elapsed > 0 else 0.0,
+            "position": self.position,
+            "max_lag_s": round(self.max_lag, 4),
+            "stages": self.latency.summary(),
+        }
+
+
+class ReplayManager:
+    """Owns at most one background replay session for the admin API."""
+
+    def __init__(self, journal_getter: Callable[[], Any], stages: List[Tuple[str, Callable[..., Any]]]):
+        self.journal_getter = journal_getter
+        self.stages = stages
+        self.session: Optional[ReplaySession] = None
+        self._lock = threading.Lock()
+
+    def start(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        speed: float = 1.0,
+        limit: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        journal = self.journal_getter()
+        if journal is None:
+            raise RuntimeError("Journal is not available in this worker")
+        with self._lock:
+            if self.session is not None and self.session.running:
+                raise RuntimeError("A replay is already running")
+            # replayed state changes must not end up in the live journal
+            self.session = ReplaySession(
+                journal_source(journal, start, end), self.stages, speed, limit, context=journal.suppressed
+            )
+            self.session.start()
+            return self.session.stats()
+
+    def stop(self) -> Dict[str, Any]:
+        with self._lock:
+            if self.session is None:
+                return {"running": False}
+            self.session.stop()
+            return self.session.stats()
+
+    def status(self) -> Dict[str, Any]:
+        session = self.session
+        return session.stats() if session is not None else {"running": False}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replay a recorded journal through the ingest path.")
+    parser.add_argument("--journal", default=os.getenv("JOURNAL_DIR", os.path.join("data", "journal")))
+    parser.add_argument("--speed", type=float, default=0.0, help="1 = real time, 10 = 10x, 0 = as fast as possible")
+    parser.add_argument("--from", dest="start", type=float, default=None, help="start timestamp (epoch s)")
+    parser.add_argument("--to", dest="end", type=float, default=None, help="end timestamp (epoch s)")
+    parser.add_argument("--limit", type=int, default=None, help="stop after N messages")
+    args = parser.parse_args(argv)
+
+    # Headless: no broker connection and no journaling of the replayed traffic
+    os.environ.setdefault("MQTT_ENABLED", "0")
+    os.environ.setdefault("JOURNAL_ENABLED", "0")
+    os.environ.setdefault("STATE_BACKEND", "memory")
+
+    import app as webapp
+    from journal import Journal
+
+    if not os.path.isdir(args.journal):
+        print(f"Journal directory not found: {args.journal}", file=sys.stderr)
+        return 1
+
+    source = journal_source(Journal(args.journal), args.start, args.end)
+    session = ReplaySession(source, webapp.replay_stages(), speed=args.speed, limit=args.limit)
+    print(json.dumps(session.run(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,399 @@
+import os
+import re
+import json
+import heapq
+import queue
+import shutil
+import logging
+import threading
+import time
+import zipfile
+from datetime import datetime
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import metrics
+from startup import lazy_import
+
+__all__ = ["RetentionEngine", "ARCHIVE_DIR"]
+
+logger = logging.getLogger(__name__)
+
+# Lives inside the upload folder; the leading dot keeps ImageStore from indexing it
+ARCHIVE_DIR = ".archive"
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]")
+
+ImageMeta = Dict[str, Any]
+
+
+def _epoch(meta: ImageMeta) -> float:
+    try:
+        return datetime.fromisoformat(meta["timestamp"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return 0.0
+
+
+def _group(meta: ImageMeta) -> str:
+    """Images of one flight age out together; images without a flight on their own."""
+    return meta.get("flight") or meta["filename"]
+
+
+class RetentionEngine:
+    """Keeps the upload folder within a byte quota and a maximum age.
+
+    Eviction candidates are kept in min-heaps fed by the store's catalog
+    listener (no directory rescans): one over images by capture time for the
+    quota, one over flights by their newest image for the age limit, so a
+    flight is dropped as a whole once its last frame is older than max_age.
+    A single background thread deletes in batches, runs deferred deletes such
+    as a gallery clear, optionally downsamples evicted frames into per-flight
+    ZIP archives, and compacts the store index once tombstones pile up.
+    """
+
+    def __init__(
+        self,
+        store,
+        derivatives=None,
+        quota_bytes: int = 0,
+        max_age_s: float = 0.0,
+        low_water: float = 0.9,
+        batch_size: int = 200,
+        interval: float = 60.0,
+        archive_edge: int = 0,
+        archive_quality: int = 60,
+        archive_quota_bytes: int = 0,
+    ):
+        self.store = store
+        self.derivatives = derivatives
+        self.quota_bytes = max(0, quota_bytes)
+        self.max_age_s = max(0.0, max_age_s)
+        self.low_water = min(max(low_water, 0.1), 1.0)
+        self.batch_size = max(1, batch_size)
+        self.interval = max(1.0, interval)
+        self.archive_edge = max(0, archive_edge)
+        self.archive_quality = archive_quality
+        self.archive_quota_bytes = max(0, archive_quota_bytes)
+        self.archive_dir = os.path.join(store.folder, ARCHIVE_DIR)
+
+        self._lock = threading.Lock()
+        self._images: List[Tuple[float, str, int]] = []
+        self._groups: Dict[str, List[Any]] = {}
+        self._group_heap: List[Tuple[float, str]] = []
+        self._added = 0
+        self._jobs: "queue.Queue[Tuple[str, Any, Optional[Callable[[], None]]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+        self.counters = {
+            "sweeps": 0,
+            "evicted_age": 0,
+            "evicted_quota": 0,
+            "deleted": 0,
+            "freed_bytes": 0,
+            "archived": 0,
+            "archive_pruned": 0,
+            "compactions": 0,
+            "errors": 0,
+            "last_sweep_ms": 0.0,
+        }
+
+        if self.archive_edge:
+            os.makedirs(self.archive_dir, exist_ok=True)
+        store.add_catalog_listener(self.track)
+        for meta in store.list():
+            self.track(meta)
+
+    # --------------------------------------------------
+    # CANDIDATES
+    # --------------------------------------------------
+    def track(self, meta: ImageMeta) -> None:
+        """Catalog listener (called under the store lock: no store calls here)."""
+        ts = _epoch(meta)
+        size = meta.get("size") or 0
+        wake = False
+        with self._lock:
+            if self.quota_bytes:
+                heapq.heappush(self._images, (ts, meta["filename"], size))
+                self._added += size
+                # a burst of new images triggers a sweep before the next interval
+                if self._added >= self.quota_bytes * (1.0 - self.low_water):
+                    self._added = 0
+                    wake = True
+            if self.max_age_s:
+                group = _group(meta)
+                entry = self._groups.get(group)
+                if entry is None:
+                    entry = self._groups[group] = [ts, []]
+                    heapq.heappush(self._group_heap, (ts, group))
+                elif ts > entry[0]:
+                    # the old heap entry goes stale and is skipped when popped
+                    entry[0] = ts
+                    heapq.heappush(self._group_heap, (ts, group))
+                entry[1].append(meta["filename"])
+        if wake and self._running:
+            self._jobs.put(("sweep", None, None))
+
+    def _expired(self, cutoff: float) -> List[str]:
+        names: List[str] = []
+        with self._lock:
+            while self._group_heap and self._group_heap[0][0] < cutoff and len(names) < self.batch_size:
+                ts, group = heapq.heappop(self._group_heap)
+                entry = self._groups.get(group)
+                if entry is None or entry[0] != ts:
+                    continue
+                del self._groups[group]
+                names.extend(entry[1])
+        return names
+
+    def _oldest(self) -> List[str]:
+        with self._lock:
+            count = min(self.batch_size, len(self._images))
+            return [heapq.heappop(self._images)[1] for _ in range(count)]
+
+    def reset(self) -> None:
+        """Forget every candidate (after the catalog was cleared)."""
+        with self._lock:
+            self._images.clear()
+            self._groups.clear()
+            self._group_heap.clear()
+            self._added = 0
+
+    # --------------------------------------------------
+    # EVICTION
+    # --------------------------------------------------
+    def _evict(self, names: List[str], reason: str, retry: List[str]) -> int:
+        """Remove a batch from the catalog, archive it, unlink it; returns bytes freed.
+
+        Names the store kept (still being written) are added to retry.
+        """
+        if not names:
+            return 0
+        removed = self.store.remove(names)
+        gone = {meta["filename"] for meta in removed}
+        retry.extend(set(names) - gone)
+        if not removed:
+            return 0
+        if self.archive_edge:
+            self._archive(removed)
+        self._delete(list(gone))
+        freed = sum(meta.get("size") or 0 for meta in removed)
+        with self._lock:
+            self.counters[f"evicted_{reason}"] += len(removed)
+            self.counters["freed_bytes"] += freed
+        return freed
+
+    def _delete(self, names: List[str]) -> None:
+        for start in range(0, len(names), self.batch_size):
+            batch = names[start:start + self.batch_size]
+            errors = self.store.delete_files(batch)
+            if self.derivatives is not None:
+                self.derivatives.forget(batch)
+            with self._lock:
+                self.counters["deleted"] += len(batch) - len(errors)
+                self.counters["errors"] += len(errors)
+            if errors:
+                logger.error(f"[RETENTION] delete errors: {errors[:5]}")
+
+    # --------------------------------------------------
+    # ARCHIVE
+    # --------------------------------------------------
+    def _archive(self, metas: List[ImageMeta]) -> None:
+        """Append downsampled copies to <archive>/<flight>.zip (metadata as entry comment)."""
+        by_group: Dict[str, List[ImageMeta]] = {}
+        for meta in metas:
+            by_group.setdefault(_group(meta), []).append(meta)
+        for group, items in by_group.items():
+            path = os.path.join(self.archive_dir, _UNSAFE.sub("_", group) + ".zip")
+            try:
+                with zipfile.ZipFile(path, "a", compression=zipfile.ZIP_STORED) as archive:
+                    for meta in items:
+                        data = self.store.read_bytes(meta["filename"])
+                        if data is None:
+                            continue
+                        frame = self._downsample(data)
+                        if frame is None:
+                            continue
+                        info = zipfile.ZipInfo(os.path.splitext(meta["filename"])[0] + ".jpg")
+                        info.date_time = time.gmtime(_epoch(meta) or time.time())[:6]
+                        info.comment = json.dumps(meta, separators=(",", ":")).encode("utf-8")[:65535]
+                        archive.writestr(info, frame)
+                        with self._lock:
+                            self.counters["archived"] += 1
+            except (OSError, zipfile.BadZipFile) as exc:
+                logger.error(f"[RETENTION] archive {path} failed: {exc}")
+                with self._lock:
+                    self.counters["errors"] += 1
+        if self.archive_quota_bytes:
+            self._prune_archive()
+
+    def _downsample(self, data: bytes) -> Optional[bytes]:
+        try:
+            with lazy_import("PIL.Image").open(BytesIO(data)) as img:
+                img.draft("RGB", (self.archive_edge, self.archive_edge))
+                img.thumbnail((self.archive_edge, self.archive_edge))
+                if img.mode not in ("RGB", "L"):
+                    img = img.convert("RGB")
+                out = BytesIO()
+                img.save(out, "JPEG", quality=self.archive_quality)
+            return out.getvalue()
+        except Exception as exc:
+            logger.warning(f"[RETENTION] cannot downsample frame: {exc}")
+            return None
+
+    def _archives(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        try:
+            with os.scandir(self.archive_dir) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith(".zip"):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _prune_archive(self) -> None:
+        """Oldest flight archives go first once the archive exceeds its own quota."""
+        entries = sorted(self._archives())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.archive_quota_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.counters["archive_pruned"] += 1
+
+    # --------------------------------------------------
+    # SWEEP
+    # --------------------------------------------------
+    @metrics.timed("dron_retention_sweep_seconds", "Image retention sweep time (age + quota eviction)")
+    def sweep(self) -> None:
+        started = time.perf_counter()
+        self.store.refresh()
+        retry: List[str] = []
+        if self.max_age_s:
+            cutoff = time.time() - self.max_age_s
+            while True:
+                names = self._expired(cutoff)
+                if not names:
+                    break
+                self._evict(names, "age", retry)
+        if self.quota_bytes:
+            excess = self.store.stats()["bytes"] - self.quota_bytes
+            if excess > 0:
+                # evict down to the low-water mark so the next image does not trigger another sweep
+                need = excess + self.quota_bytes * (1.0 - self.low_water)
+                while need > 0:
+                    names = self._oldest()
+                    if not names:
+                        break
+                    need -= self._evict(names, "quota", retry)
+        for name in retry:
+            # re-queued after the loops so a pending write cannot spin them
+            meta = self.store.get(name)
+            if meta is not None:
+                self.track(meta)
+        self._maybe_compact()
+        with self._lock:
+            self.counters["sweeps"] += 1
+            self.counters["last_sweep_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+    def _maybe_compact(self) -> None:
+        st = self.store.stats()
+        # rebuild the candidate heaps when stale entries (evicted elsewhere) dominate
+        with self._lock:
+            stale = len(self._images) > 2 * st["images"] + 1024 or len(self._group_heap) > 2 * len(self._groups) + 1024
+        if stale:
+            self.reset()
+            for meta in self.store.list():
+                self.track(meta)
+        if st["tombstones"] > max(1000, st["images"]) and self._jobs.empty():
+            self.store.compact_index()
+            with self._lock:
+                self.counters["compactions"] += 1
+
+    # --------------------------------------------------
+    # DEFERRED DELETES
+    # --------------------------------------------------
+    def discard(self, filenames: List[str], then: Optional[Callable[[], None]] = None) -> None:
+        """Unlink files already dropped from the catalog on the background thread."""
+        self._jobs.put(("delete", list(filenames), then))
+        if not self._running:
+            self._drain()
+
+    def _drain(self) -> None:
+        while True:
+            try:
+                kind, names, then = self._jobs.get_nowait()
+            except queue.Empty:
+                return
+            self._run_job(kind, names, then)
+
+    def _run_job(self, kind: str, names: Any, then: Optional[Callable[[], None]]) -> None:
+        try:
+            if kind == "delete":
+                self._delete(names)
+            else:
+                self.sweep()
+            if then is not None:
+                then()
+        except Exception as exc:
+            logger.error(f"[RETENTION] {kind} failed: {exc}")
+            with self._lock:
+                self.counters["errors"] += 1
+
+    def _run(self) -> None:
+        next_sweep = time.monotonic() + min(self.interval, 5.0)
+        while self._running:
+            try:
+                kind, names, then = self._jobs.get(timeout=max(0.0, next_sweep - time.monotonic()))
+            except queue.Empty:
+                kind, names, then = "sweep", None, None
+            if kind == "stop":
+                break
+            self._run_job(kind, names, then)
+            if kind == "sweep":
+                next_sweep = time.monotonic() + self.interval
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="image-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._running = False
+        self._jobs.put(("stop", None, None))
+
+    # --------------------------------------------------
+    # REPORTING
+    # --------------------------------------------------
+    def usage(self) -> Dict[str, Any]:
+        images = self.store.stats()
+        disk = shutil.disk_usage(self.store.folder)
+        archives = self._archives() if self.archive_edge else []
+        with self._lock:
+            counters = dict(self.counters)
+            flights = len(self._groups)
+        return {
+            "images": images["images"],
+            "bytes": images["bytes"],
+            "quota_bytes": self.quota_bytes or None,
+            "quota_used_percent": round(100.0 * images["bytes"] / self.quota_bytes, 1) if self.quota_bytes else None,
+            "max_age_s": self.max_age_s or None,
+            "flights_tracked": flights,
+            "pending_jobs": self._jobs.qsize(),
+            "disk": {"total": disk.total, "used": disk.used, "free": disk.free},
+            "archive": {
+                "enabled": bool(self.archive_edge),
+                "flights": len(archives),
+                "bytes": sum(size for _, size, _ in archives),
+                "quota_bytes": self.archive_quota_bytes or None,
+            },
+            **counters,
+        }
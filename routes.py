@@ -1,25 +1,55 @@
 from flask import Blueprint, render_template, request, jsonify, send_from_directory, abort, Response, current_app
-from flask_login import login_required
+from flask_login import current_user, login_required
 from werkzeug.utils import secure_filename
-from PIL import Image
-from io import BytesIO
+from functools import partial
 import os
 import time
 import base64
+import json
+import mimetypes
+import zlib
 
+import metrics
 import state
+from history import telemetry_history
+from http_cache import conditional_stats
+from track import track_store
 
 bp = Blueprint('routes', __name__)
 
 
+# Cache-Control for content-addressed images (private: the routes require login)
+IMMUTABLE_CACHE = 'private, max-age=31536000, immutable'
+
+
+def _image_store():
+    return current_app.extensions['image_store']
+
+
+def _posted_vehicle(data):
+    """vehicle_id of a posted payload (removed from it); None is the default vehicle.
+
+    Raises ValueError for a malformed id or a full fleet.
+    """
+    vehicle = data.pop('vehicle_id', None) if isinstance(data, dict) else None
+    if vehicle is None or str(vehicle) == state.fleet.default_id:
+        return None
+    try:
+        state.fleet.partition(str(vehicle), create=True)
+    except LookupError as exc:
+        raise ValueError(str(exc))
+    state.fleet.touch(str(vehicle))
+    return str(vehicle)
+
+
 @bp.route('/')
 @login_required
 def dashboard():
     return render_template(
         'index.html',
-        status=state.drone_status,
-        latest_image=state.latest_image,
-        logs=state.mission_log[-100:],
+        status=state.get_status(),
+        latest_image=state.get_latest_image(),
+        logs=state.get_mission_log(100),
     )
 
 
@@ -35,12 +65,224 @@ def map_view():
 def handle_status():
     if request.method == 'POST':
         new_data = request.get_json(silent=True)
+        try:
+            vehicle = _posted_vehicle(new_data)
+        except ValueError as exc:
+            return jsonify({'success': False, 'error': str(exc)}), 400
         if new_data:
-            state.drone_status.update(new_data)
-            state.drone_status['last_update'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
-        return jsonify({'success': True, 'status': state.drone_status})
+            state.update_status({
+                **new_data,
+                'last_update': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            }, vehicle)
+        return jsonify({'success': True, 'status': state.get_status(vehicle)})
+
+    etag = state.get_version_tag()
+    if request.if_none_match.contains(etag):
+        conditional_stats.record_not_modified('status')
+        return Response(status=304, headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
+
+    started = time.perf_counter()
+    response = jsonify({**state.get_status(), 'latest_image': state.get_latest_image()})
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    conditional_stats.record_full('status', response.content_length or 0, time.perf_counter() - started)
+    return response
+
+
+@bp.route('/api/telemetry/history')
+@login_required
+def telemetry_history_api():
+    vehicle = request.args.get('vehicle') or None
+    if vehicle == state.fleet.default_id:
+        vehicle = None
+    field = request.args.get('field')
+    if not field:
+        return jsonify({'fields': telemetry_history.stats(vehicle)})
+    try:
+        start = request.args.get('from', type=float)
+        end = request.args.get('to', type=float)
+        max_points = min(request.args.get('max_points', 500, type=int), 10000)
+        method = request.args.get('method', 'buckets')
+        return jsonify(telemetry_history.query(field, start, end, max_points, method, vehicle))
+    except KeyError:
+        return jsonify({'success': False, 'error': f'Unknown field: {field}'}), 404
+    except ValueError as exc:
+        return jsonify({'success': False, 'error': str(exc)}), 400
+
+
+@bp.route('/api/track')
+@login_required
+def track_api():
+    """Simplified GPS track: ?vehicle=&flight=&zoom=&bbox=minLon,minLat,maxLon,maxLat&since=<next>."""
+    bbox = request.args.get('bbox')
+    if bbox:
+        try:
+            bbox = tuple(float(v) for v in bbox.split(','))
+        except ValueError:
+            bbox = ()
+        if len(bbox) != 4:
+            return jsonify({'success': False, 'error': 'bbox must be minLon,minLat,maxLon,maxLat'}), 400
+    since = request.args.get('since', type=int)
+    if since is not None and since < -1:
+        return jsonify({'success': False, 'error': 'since must be a previous "next" (>= -1)'}), 400
+    result = track_store.query(
+        request.args.get('vehicle') or state.fleet.default_id,
+        flight_id=request.args.get('flight', type=int),
+        zoom=request.args.get('zoom', type=float),
+        bbox=bbox or None,
+        since=since,
+    )
+    if result is None:
+        return jsonify({'success': False, 'error': 'No track recorded'}), 404
+    return jsonify(result)
+
+
+@bp.route('/api/track/flights')
+@login_required
+def track_flights():
+    vehicle = request.args.get('vehicle') or state.fleet.default_id
+    return jsonify({'vehicle': vehicle, 'flights': track_store.flights(vehicle), 'stats': track_store.stats()})
+
+
+def _missions():
+    return current_app.extensions['missions']
 
-    return jsonify({**state.drone_status, 'latest_image': state.latest_image})
+
+def _vehicle_status(vehicle):
+    """Status of a known vehicle, or None (never creates a partition)."""
+    if state.fleet.partition(vehicle) is None:
+        return None
+    return state.get_status(None if vehicle == state.fleet.default_id else vehicle)
+
+
+def _mission_response(plan, vehicle):
+    status = _vehicle_status(vehicle) or {}
+    battery = status.get('battery_percent')
+    data = plan.to_dict()
+    data['battery'] = _missions().budget(plan, float(battery) if battery is not None else None)
+    return data
+
+
+@bp.route('/api/mission', methods=['GET', 'POST'])
+@login_required
+def missions_api():
+    if request.method == 'POST':
+        try:
+            plan = _missions().create(request.get_json(silent=True) or {})
+        except ValueError as exc:
+            return jsonify({'success': False, 'error': str(exc)}), 400
+        state.log_message(current_app, 'info', f'Mission saved: {plan.name} ({len(plan.waypoints)} waypoints)')
+        return jsonify({'success': True, 'mission': _mission_response(plan, state.fleet.default_id)}), 201
+    return jsonify({'missions': _missions().list()})
+
+
+@bp.route('/api/mission/active', methods=['GET', 'POST'])
+@login_required
+def mission_active():
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        vehicle = str(data.get('vehicle') or state.fleet.default_id)
+        if not state.VEHICLE_ID_RE.match(vehicle):
+            return jsonify({'success': False, 'error': 'Invalid vehicle id'}), 400
+        try:
+            _missions().activate(data.get('mission'), vehicle)
+        except KeyError:
+            return jsonify({'success': False, 'error': 'Unknown mission'}), 404
+        return jsonify({'success': True})
+
+    vehicle = request.args.get('vehicle') or state.fleet.default_id
+    plan = _missions().active(vehicle)
+    if plan is None:
+        return jsonify({'vehicle': vehicle, 'mission': None, 'progress': None})
+    progress = _missions().progress(vehicle, _vehicle_status(vehicle))
+    return jsonify({'vehicle': vehicle, 'mission': plan.summary(), 'progress': progress})
+
+
+@bp.route('/api/mission/<mission_id>', methods=['GET', 'PUT', 'DELETE'])
+@login_required
+def mission_api(mission_id):
+    missions = _missions()
+    if request.method == 'DELETE':
+        if not missions.delete(mission_id):
+            abort(404)
+        return jsonify({'success': True})
+
+    if missions.get(mission_id) is None:
+        abort(404)
+    if request.method == 'PUT':
+        try:
+            missions.create(request.get_json(silent=True) or {}, mission_id=mission_id)
+        except ValueError as exc:
+            return jsonify({'success': False, 'error': str(exc)}), 400
+
+    plan = missions.get(mission_id)
+    data = _mission_response(plan, request.args.get('vehicle') or state.fleet.default_id)
+    # ?densify=<metres> or ?resample=<count> add an interpolated great-circle path
+    densify = request.args.get('densify', type=float)
+    resample = request.args.get('resample', type=int)
+    if densify:
+        data['path'] = plan.densify(max(densify, plan.total_m / 10000))
+    elif resample:
+        data['path'] = plan.resample(min(resample, 10000))
+    return jsonify(data)
+
+
+@bp.route('/api/mission/<mission_id>/distance')
+@login_required
+def mission_distance(mission_id):
+    """Distance from ?lat=&lon= (default: the vehicle's current position) to the route."""
+    plan = _missions().get(mission_id)
+    if plan is None:
+        abort(404)
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    if lat is None or lon is None:
+        status = _vehicle_status(request.args.get('vehicle') or state.fleet.default_id) or {}
+        lat, lon = status.get('gps_lat'), status.get('gps_lon')
+        if lat is None or lon is None:
+            try:
+                lat, lon = (float(v) for v in str(status.get('gps_global', '')).split(','))
+            except ValueError:
+                return jsonify({'success': False, 'error': 'No position available'}), 400
+        if float(lat) == 0.0 and float(lon) == 0.0:
+            # the vehicle has no GPS fix yet: no progress rather than distances to (0, 0)
+            return jsonify(None)
+    return jsonify(plan.progress(float(lat), float(lon)))
+
+
+def _alerts():
+    return current_app.extensions['alerts']
+
+
+@bp.route('/api/alerts')
+@login_required
+def alerts_overview():
+    """Currently firing alerts, recent transitions and engine counters."""
+    engine = _alerts()
+    vehicle = request.args.get('vehicle')
+    active = engine.active()
+    history = engine.history(min(request.args.get('limit', 100, type=int), 1000))
+    if vehicle:
+        active = [a for a in active if a['vehicle'] == vehicle]
+        history = [e for e in history if e['vehicle'] == vehicle]
+    return jsonify({'active': active, 'history': history, 'stats': engine.stats()})
+
+
+@bp.route('/api/alerts/rules', methods=['GET', 'PUT'])
+@login_required
+def alert_rules():
+    """GET the compiled rules; PUT a JSON list to replace them (resets alert state)."""
+    engine = _alerts()
+    if request.method == 'PUT':
+        rules = request.get_json(silent=True)
+        if not isinstance(rules, list):
+            return jsonify({'success': False, 'error': 'Expected a JSON list of rules'}), 400
+        try:
+            engine.load(rules)
+        except (ValueError, TypeError) as exc:
+            return jsonify({'success': False, 'error': str(exc)}), 400
+        state.log_message(current_app, 'info', f'Alert rules replaced ({len(rules)} rules)')
+    return jsonify({'rules': engine.describe(), 'stats': engine.stats()})
 
 
 @bp.route('/api/image', methods=['POST'])
@@ -51,16 +293,23 @@ def upload_image():
     file = request.files['image']
     if file.filename == '':
         return jsonify({'success': False, 'error': 'Empty filename'}), 400
-    filename = secure_filename(f"{int(time.time())}_{file.filename}")
-    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
-    state.latest_image = {
+    original_name = secure_filename(file.filename)
+    meta = _image_store().save(
+        file.read(),
+        ext=os.path.splitext(original_name)[1] or '.jpg',
+        source='upload',
+        original_name=original_name,
+        extra={'gps': state.get_status().get('gps_global')},
+    )
+    filename = meta['filename']
+    image = {
         'filename': filename,
         'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
-        'size': os.path.getsize(filepath),
+        'size': meta['size'],
     }
+    state.set_latest_image(image)
     state.log_message(current_app, 'info', f'New image received: {filename}')
-    return jsonify({'success': True, 'image': state.latest_image})
+    return jsonify({'success': True, 'image': image})
 
 
 @bp.route('/images/<path:filename>')
@@ -68,7 +317,40 @@ def upload_image():
 def serve_image(filename):
     if '..' in filename or filename.startswith('/'):
         abort(400)
-    return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
+    size = request.args.get('size') or 'full'
+    thumbnails = current_app.extensions['thumbnails']
+    if size != 'full' and size not in thumbnails.sizes:
+        abort(400)
+    endpoint = f'image:{size}'
+
+    # Content-addressed files never change, so the hash is a strong validator
+    meta = _image_store().get(filename)
+    etag = None
+    if meta is not None and meta.get('sha256'):
+        etag = meta['sha256'][:32] if size == 'full' else f"{meta['sha256'][:32]}-{size}"
+        if request.if_none_match.contains(etag):
+            conditional_stats.record_not_modified(endpoint, meta['size'] if size == 'full' else 0)
+            return Response(status=304, headers={'ETag': f'"{etag}"', 'Cache-Control': IMMUTABLE_CACHE})
+
+    if size != 'full':
+        data = thumbnails.get(filename, size)
+        if data is None:
+            abort(404)
+        response = Response(data, mimetype='image/jpeg')
+    else:
+        # Frames still queued for the background writer are served from memory
+        pending = _image_store().pending_bytes(filename)
+        if pending is not None:
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = Response(pending, mimetype=mimetype)
+        else:
+            response = send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
+
+    if etag is not None and response.status_code == 200:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE
+    conditional_stats.record_full(endpoint, response.content_length or 0)
+    return response
 
 
 @bp.route('/api/log', methods=['GET', 'POST', 'DELETE'])
@@ -77,16 +359,58 @@ def handle_log():
     if request.method == 'POST':
         data = request.get_json(silent=True)
         if data and 'message' in data:
+            try:
+                vehicle = _posted_vehicle(data)
+            except ValueError as exc:
+                return jsonify({'success': False, 'error': str(exc)}), 400
             level = data.get('level', 'info')
-            state.log_message(current_app, level, data['message'])
+            state.log_message(current_app, level, data['message'], vehicle)
             return jsonify({'success': True})
         return jsonify({'success': False, 'error': 'Invalid log data'}), 400
 
     if request.method == 'DELETE':
-        state.mission_log = []
+        state.clear_mission_log()
         return jsonify({'success': True})
 
-    return jsonify({'logs': state.mission_log[-100:]})
+    return _log_page()
+
+
+def _log_page(vehicle=None):
+    since = request.args.get('since', 0, type=int)
+    level = request.args.get('level') or None
+    limit = max(0, min(request.args.get('limit', 100, type=int), state.MISSION_LOG_LIMIT))
+    logs, next_seq, first_seq = state.get_mission_log_since(since, level, limit, vehicle)
+    return jsonify({
+        'logs': logs,
+        'next': next_seq,
+        'first': first_seq,
+        # entries between since and first were evicted; client should reload the tail
+        'resync': 0 < since < first_seq,
+        'counts': state.get_log_counts(vehicle),
+    })
+
+
+def _store_telemetry_image(app, store, future):
+    try:
+        data, ext = future.result()
+        meta = store.save(
+            data,
+            ext=ext,
+            source='telemetry',
+            original_name=f'drone_capture{ext}',
+            extra={
+                'gps': state.get_status().get('gps_global'),
+                'flight': track_store.flight_key(state.fleet.default_id),
+            },
+        )
+    except Exception as exc:
+        state.log_message(app, 'error', f'Failed to process image: {exc}')
+        return
+    state.set_latest_image({
+        'filename': meta['filename'],
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'size': meta['size'],
+    })
 
 
 @bp.route('/api/telemetry', methods=['POST'])
@@ -97,23 +421,23 @@ def telemetry_endpoint():
         return jsonify({'success': False, 'error': 'No data provided'}), 400
 
     if 'status' in data:
-        state.drone_status.update(data['status'])
-        state.drone_status['last_update'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        state.update_status({
+            **data['status'],
+            'last_update': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        })
 
     if 'image' in data and data['image']:
         try:
             img_data = data['image'].split(',', 1)[1]
-            img = Image.open(BytesIO(base64.b64decode(img_data)))
-            filename = f"{int(time.time())}_drone_capture.jpg"
-            filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            img.save(filepath, 'JPEG', quality=85)
-            state.latest_image = {
-                'filename': filename,
-                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
-                'size': os.path.getsize(filepath),
-            }
+            raw = base64.b64decode(img_data)
         except Exception as exc:
             state.log_message(current_app, 'error', f'Failed to process image: {exc}')
+        else:
+            # JPEG/PNG/WebP pass through inline; other formats transcode on the worker pool
+            future = current_app.extensions['transcoder'].submit(raw)
+            future.add_done_callback(
+                partial(_store_telemetry_image, current_app._get_current_object(), _image_store())
+            )
 
     if 'logs' in data:
         for log_entry in data['logs']:
@@ -126,21 +450,203 @@ def telemetry_endpoint():
 @bp.route('/api/images', methods=['GET', 'DELETE'])
 @login_required
 def images_api():
-    folder = current_app.config['UPLOAD_FOLDER']
+    store = _image_store()
     if request.method == 'DELETE':
-        errors = []
-        for filename in os.listdir(folder):
-            try:
-                os.remove(os.path.join(folder, filename))
-            except Exception as exc:
-                errors.append(f"{filename}: {exc}")
-        if errors:
-            state.log_message(current_app, 'error', f'Image delete errors: {errors}')
-            return jsonify({'success': False, 'error': errors}), 500
-        state.log_message(current_app, 'info', 'Gallery cleared')
-        return jsonify({'success': True})
-    images = sorted(os.listdir(folder), reverse=True)
-    return jsonify({'images': images})
+        # the catalog empties now; files and derivatives are unlinked in the background
+        names = store.clear()
+        retention = current_app.extensions['retention']
+        retention.reset()
+        retention.discard(names, then=current_app.extensions['thumbnails'].clear)
+        state.log_message(current_app, 'info', f'Gallery cleared ({len(names)} images)')
+        return jsonify({'success': True, 'deleted': len(names)}), 202
+
+    cursor = request.args.get('cursor')
+    since = request.args.get('since')
+    limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+    query = f'{cursor}|{since}|{limit}'.encode('utf-8')
+    etag = f'{store.catalog_tag()}-{zlib.crc32(query):x}'
+    if request.if_none_match.contains_weak(etag):
+        conditional_stats.record_not_modified('images')
+        return Response(status=304, headers={'ETag': f'W/"{etag}"'})
+
+    started = time.perf_counter()
+
+    items, next_cursor = store.page(cursor=cursor, since=since, limit=limit)
+    response = jsonify({
+        'images': [meta['filename'] for meta in items],
+        'items': items,
+        'next_cursor': next_cursor,
+    })
+    response.set_etag(etag, weak=True)
+    # let browsers revalidate instead of reusing a stale listing
+    response.headers['Cache-Control'] = 'no-cache'
+    conditional_stats.record_full('images', response.content_length or 0, time.perf_counter() - started)
+    return response
+
+
+@bp.route('/api/fleet')
+@login_required
+def fleet_summary():
+    return jsonify(state.fleet.summary())
+
+
+def _known_vehicle(vehicle):
+    if state.fleet.partition(vehicle) is None:
+        abort(404)
+    return None if vehicle == state.fleet.default_id else vehicle
+
+
+@bp.route('/api/fleet/<vehicle>')
+@login_required
+def fleet_vehicle(vehicle):
+    vehicle = _known_vehicle(vehicle)
+    return jsonify({
+        **state.get_status(vehicle),
+        'latest_image': state.get_latest_image(vehicle),
+        'vehicle': vehicle or state.fleet.default_id,
+    })
+
+
+@bp.route('/api/fleet/<vehicle>/log')
+@login_required
+def fleet_vehicle_log(vehicle):
+    return _log_page(_known_vehicle(vehicle))
+
+
+@bp.route('/api/ingest/stats')
+@login_required
+def ingest_stats():
+    pipeline = current_app.extensions.get('ingest')
+    if pipeline is None:
+        return jsonify({'stages': {}})
+    return jsonify({'stages': pipeline.stats()})
+
+
+@bp.route('/api/broadcast/stats')
+@login_required
+def broadcast_stats():
+    broadcaster = current_app.extensions.get('broadcaster')
+    return jsonify(broadcaster.stats() if broadcaster else {})
+
+
+@bp.route('/api/journal/stats')
+@login_required
+def journal_stats():
+    journal = current_app.extensions.get('journal')
+    return jsonify(journal.stats() if journal else {'enabled': False})
+
+
+@bp.route('/api/replay', methods=['GET', 'POST', 'DELETE'])
+@login_required
+def replay_api():
+    manager = current_app.extensions.get('replay')
+    if manager is None:
+        return jsonify({'success': False, 'error': 'Replay not available'}), 503
+
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            # coerced here so bad values are a 400, not a failure in the replay thread
+            start = data.get('from')
+            end = data.get('to')
+            limit = data.get('limit')
+            speed = float(data.get('speed', 1.0))
+            if not speed >= 0:  # also NaN
+                raise ValueError('speed must be >= 0 (0 = as fast as possible)')
+            stats = manager.start(
+                start=float(start) if start is not None else None,
+                end=float(end) if end is not None else None,
+                speed=speed,
+                limit=int(limit) if limit is not None else None,
+            )
+        except (TypeError, ValueError) as exc:
+            return jsonify({'success': False, 'error': str(exc)}), 400
+        except RuntimeError as exc:
+            return jsonify({'success': False, 'error': str(exc)}), 409
+        state.log_message(current_app, 'info', f"Replay started at {stats['speed']}x")
+        return jsonify({'success': True, 'replay': stats})
+
+    if request.method == 'DELETE':
+        return jsonify({'success': True, 'replay': manager.stop()})
+
+    return jsonify(manager.status())
+
+
+@bp.route('/api/images/usage')
+@login_required
+def image_usage():
+    """Disk usage against the retention quota, plus eviction counters."""
+    return jsonify(current_app.extensions['retention'].usage())
+
+
+@bp.route('/api/images/stats')
+@login_required
+def image_store_stats():
+    return jsonify({
+        **_image_store().stats(),
+        'transcode': current_app.extensions['transcoder'].stats(),
+        'thumbnails': current_app.extensions['thumbnails'].stats(),
+    })
+
+
+def _stream_snapshot():
+    return {'status': state.get_status(), 'latest_image': state.get_latest_image()}
+
+
+@bp.route('/api/stream')
+@login_required
+def telemetry_stream():
+    """SSE telemetry feed; ?transport=poll&since=<id> is the long-poll fallback."""
+    stream = current_app.extensions['stream']
+
+    if request.args.get('transport') == 'poll':
+        since = request.args.get('since', type=int)
+        if since is None:
+            return jsonify({'next': stream.last_seq, 'events': [], 'snapshot': _stream_snapshot()})
+        timeout = min(request.args.get('timeout', 25, type=float), 55)
+        events, next_id, gap = stream.poll(since, timeout)
+        # events is already JSON text; splice it in rather than re-encoding
+        body = f'{{"next":{next_id},"resync":{"true" if gap else "false"},"events":{events}}}'
+        if gap:
+            body = body[:-1] + ',"snapshot":' + json.dumps(_stream_snapshot(), default=str) + '}'
+        return Response(body, mimetype='application/json', headers={'Cache-Control': 'no-cache'})
+
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_id = int(last_id) if last_id is not None else None
+    except ValueError:
+        last_id = None
+    return Response(
+        stream.sse(last_id, _stream_snapshot),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@bp.route('/api/stream/stats')
+@login_required
+def stream_stats():
+    return jsonify(current_app.extensions['stream'].stats())
+
+
+@bp.route('/api/cache/stats')
+@login_required
+def cache_stats():
+    return jsonify(conditional_stats.stats())
+
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    if not metrics.ENABLED:
+        abort(404)
+    # scrapers authenticate with METRICS_TOKEN; without one the endpoint is behind the login
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            abort(401)
+    elif not current_user.is_authenticated:
+        return current_app.login_manager.unauthorized()
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 
 @bp.route('/healthz')
@@ -148,41 +654,39 @@ def healthz():
     return jsonify({'status': 'ok'})
 
 
-# --- Video feed (best-effort; Render likely doesn't provide camera) ---
-try:
-    import cv2
-    _CV2_AVAILABLE = True
-except Exception:
-    cv2 = None
-    _CV2_AVAILABLE = False
-
-
-def generate_frames():
-    if not _CV2_AVAILABLE:
-        raise RuntimeError('OpenCV is not available in the environment')
-    camera = cv2.VideoCapture(0)
-    if not camera.isOpened():
-        raise RuntimeError('Camera access unavailable')
-    while True:
-        success, frame = camera.read()
-        if not success:
-            break
-        ret, buffer = cv2.imencode('.jpg', frame)
-        if not ret:
-            break
-        frame_bytes = buffer.tobytes()
-        yield (b"--frame\r\n"
-               b"Content-Type: image/jpeg\r\n\r\n" + frame_bytes + b"\r\n")
+@bp.route('/api/startup')
+@login_required
+def startup_report():
+    """Startup-phase breakdown of this worker, plus background events (MQTT, lazy imports)."""
+    return jsonify(current_app.extensions['startup'].report())
 
 
+# --- Video feed (best-effort; Render likely doesn't provide camera) ---
 @bp.route('/video_feed')
 @login_required
 def video_feed():
-    if not _CV2_AVAILABLE:
-        state.log_message(current_app, 'error', 'OpenCV nie jest dostępne w środowisku')
-        return jsonify({'success': False, 'error': 'OpenCV nie jest dostępne na serwerze'}), 503
+    camera = current_app.extensions['camera']
+    fps = request.args.get('fps', type=float)
+    if fps is not None and not fps > 0:  # also NaN
+        return jsonify({'success': False, 'error': 'fps must be > 0'}), 400
     try:
-        return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+        # one shared capture per worker; every viewer gets the same encoded frames
+        camera.ensure_started()
     except Exception as exc:
         state.log_message(current_app, 'error', f'Błąd strumienia wideo: {exc}')
         return jsonify({'success': False, 'error': str(exc)}), 503
+    # ?tier=high|medium|low pins a tier (no adaptation); ?fps= caps the frame rate
+    # (values above the capture rate are clamped to it)
+    frames = camera.frames(
+        tier=request.args.get('tier'),
+        fps=fps,
+        remote=request.remote_addr,
+    )
+    return Response(frames, mimetype='multipart/x-mixed-replace; boundary=frame')
+
+
+@bp.route('/api/camera/stats')
+@login_required
+def camera_stats():
+    camera = current_app.extensions['camera']
+    return jsonify({**camera.stats(), 'clients': camera.viewer_stats()})
@@ -0,0 +1,382 @@
+import os
+import json
+import mmap
+import time
+import fcntl
+import struct
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, UTC
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+__all__ = ["SharedMemoryBackend", "SharedFleetPartitions", "IngestLeader"]
+
+logger = logging.getLogger(__name__)
+
+# File layout (all integers little-endian):
+#   0   doc_version  u64   bumped on every status / latest_image write
+#   8   doc_len      u64   length of the JSON document below
+#   16  log_seq      u64   sequence number of the next log entry
+#   24  log_start    u64   first visible sequence number (moved by clear_log)
+#   32  magic        u64
+#   40  doc_size     u64
+#   48  log_slots    u32
+#   52  slot_size    u32
+#   64  log_counts   u64 per level (levels + "other"), reset by clear_log
+#   112 last_seen    f64 epoch seconds of the last message (Fleet.touch)
+#   120 messages     u64 messages received
+#   128 JSON document {"status": ..., "latest_image": ...}
+#   128 + doc_size   log ring: log_slots * (u32 length, u8 level, JSON entry)
+_HEADER = struct.Struct("<QQQQQQII")
+_HEADER_SIZE = 128
+_COUNTS_OFFSET = 64
+_ACTIVITY_OFFSET = 112
+_MAGIC = 0x44524F4E53544155  # "DRONSTAU"
+_U64 = struct.Struct("<Q")
+_SLOT = struct.Struct("<IB")
+_F64 = struct.Struct("<d")
+
+
+def _default_path() -> str:
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm/dron_webapp.state"
+    return os.path.join("data", "state.shm")
+
+
+class SharedMemoryBackend:
+    """State kept in an mmap-ed file shared by every worker on the host.
+
+    Writers serialise on an flock (plus a thread lock, since flock is per open
+    file). Readers compare the 8-byte doc_version against their cached copy and
+    only re-parse the JSON document when another process changed it.
+    """
+
+    name = "shared"
+
+    def __init__(
+        self,
+        path: str,
+        default_status: Dict[str, Any],
+        levels: Tuple[str, ...] = ("debug", "info", "warning", "error", "critical"),
+        log_slots: int = 1000,
+        doc_size: int = 64 * 1024,
+        slot_size: int = 1024,
+    ):
+        self.path = path
+        self.doc_size = doc_size
+        self.log_slots = log_slots
+        self.slot_size = slot_size
+        self.total_size = _HEADER_SIZE + doc_size + log_slots * slot_size
+        self._log_offset = _HEADER_SIZE + doc_size
+        self.levels = tuple(levels) + ("other",)
+        if _COUNTS_OFFSET + 8 * len(self.levels) > _ACTIVITY_OFFSET:
+            raise ValueError("Too many log levels for the shared state header")
+
+        self._tlock = threading.RLock()
+        self._cache_version = -1
+        self._cache: Dict[str, Any] = {}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked():
+            if not self._layout_matches():
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self.total_size)
+                self._mm = mmap.mmap(self._fd, self.total_size)
+                _HEADER.pack_into(self._mm, 0, 0, 0, 0, 0, _MAGIC, doc_size, log_slots, slot_size)
+                self._write_doc({
+                    "status": {**default_status, "last_update": datetime.now(UTC).isoformat()},
+                    "latest_image": None,
+                })
+            else:
+                self._mm = mmap.mmap(self._fd, self.total_size)
+        # same file for every worker; a recreated file gets a new inode
+        self.epoch = f"{os.fstat(self._fd).st_ino:x}"
+
+    @classmethod
+    def from_env(
+        cls,
+        default_status: Dict[str, Any],
+        log_limit: int,
+        levels: Tuple[str, ...],
+    ) -> "SharedMemoryBackend":
+        return cls(
+            os.getenv("STATE_SHARED_PATH", _default_path()),
+            default_status,
+            levels=levels,
+            log_slots=log_limit,
+            doc_size=int(os.getenv("STATE_SHARED_DOC_SIZE", str(64 * 1024))),
+            slot_size=int(os.getenv("STATE_SHARED_SLOT_SIZE", "1024")),
+        )
+
+    # --------------------------------------------------
+    # LOW-LEVEL HELPERS
+    # --------------------------------------------------
+    def _layout_matches(self) -> bool:
+        if os.fstat(self._fd).st_size != self.total_size:
+            return False
+        header = os.pread(self._fd, _HEADER.size, 0)
+        fields = _HEADER.unpack(header)
+        return fields[4:] == (_MAGIC, self.doc_size, self.log_slots, self.slot_size)
+
+    @contextmanager
+    def _locked(self, shared: bool = False):
+        with self._tlock:
+            fcntl.flock(self._fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _u64(self, offset: int) -> int:
+        return _U64.unpack_from(self._mm, offset)[0]
+
+    def _write_doc(self, doc: Dict[str, Any]) -> None:
+        data = json.dumps(doc, separators=(",", ":"), default=str).encode("utf-8")
+        if len(data) > self.doc_size:
+            raise ValueError(f"Shared state document too large ({len(data)} > {self.doc_size} bytes)")
+        self._mm[_HEADER_SIZE:_HEADER_SIZE + len(data)] = data
+        version = self._u64(0) + 1
+        _U64.pack_into(self._mm, 8, len(data))
+        _U64.pack_into(self._mm, 0, version)
+        self._cache = doc
+        self._cache_version = version
+
+    def _read_doc(self) -> Dict[str, Any]:
+        """Return the document, re-parsing only if another writer bumped the version."""
+        if self._u64(0) == self._cache_version:
+            return self._cache
+        with self._locked(shared=True):
+            version = self._u64(0)
+            length = self._u64(8)
+            doc = json.loads(self._mm[_HEADER_SIZE:_HEADER_SIZE + length])
+        self._cache = doc
+        self._cache_version = version
+        return doc
+
+    # --------------------------------------------------
+    # BACKEND INTERFACE
+    # --------------------------------------------------
+    def version(self) -> int:
+        return self._u64(0)
+
+    def get_status(self) -> Dict[str, Any]:
+        # a copy: the parsed document is cached for the next reader
+        return dict(self._read_doc()["status"])
+
+    def update_status(self, updates: Dict[str, Any]) -> None:
+        with self._locked():
+            doc = self._read_doc_unlocked()
+            doc["status"].update(updates)
+            self._write_doc(doc)
+
+    def get_latest_image(self) -> Optional[Dict[str, Any]]:
+        return self._read_doc()["latest_image"]
+
+    def set_latest_image(self, image: Optional[Dict[str, Any]]) -> None:
+        with self._locked():
+            doc = self._read_doc_unlocked()
+            doc["latest_image"] = image
+            self._write_doc(doc)
+
+    def _read_doc_unlocked(self) -> Dict[str, Any]:
+        length = self._u64(8)
+        return json.loads(self._mm[_HEADER_SIZE:_HEADER_SIZE + length])
+
+    def _level_index(self, level: Any) -> int:
+        level = str(level).lower()
+        return self.levels.index(level) if level in self.levels else len(self.levels) - 1
+
+    def _encode_entry(self, entry: Dict[str, Any]) -> bytes:
+        limit = self.slot_size - _SLOT.size
+        data = json.dumps(entry, separators=(",", ":"), default=str).encode("utf-8")
+        if len(data) <= limit:
+            return data
+        # Truncate the message so the entry fits its slot
+        message = str(entry.get("message", ""))
+        overflow = len(data) - limit + 3
+        trimmed = {**entry, "message": message[:max(0, len(message) - overflow)] + "..."}
+        return json.dumps(trimmed, separators=(",", ":"), default=str).encode("utf-8")[:limit]
+
+    def append_log(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        level = self._level_index(entry.get("level", "info"))
+        with self._locked():
+            seq = self._u64(16)
+            entry["seq"] = seq
+            data = self._encode_entry(entry)
+            offset = self._log_offset + (seq % self.log_slots) * self.slot_size
+            _SLOT.pack_into(self._mm, offset, len(data), level)
+            self._mm[offset + _SLOT.size:offset + _SLOT.size + len(data)] = data
+            count_offset = _COUNTS_OFFSET + 8 * level
+            _U64.pack_into(self._mm, count_offset, self._u64(count_offset) + 1)
+            _U64.pack_into(self._mm, 16, seq + 1)
+        return entry
+
+    def log_seq(self) -> int:
+        return self._u64(16)
+
+    def log_since(
+        self,
+        since: int = 0,
+        level: Optional[str] = None,
+        limit: int = 100,
+    ) -> Tuple[List[Dict[str, Any]], int, int]:
+        """Entries with seq >= since (newest `limit`); returns (entries, next_seq, first_seq).
+
+        The level byte in each slot header lets level filters skip JSON parsing.
+        """
+        wanted = None if level is None else self._level_index(level)
+        raw = []
+        with self._locked(shared=True):
+            next_seq = self._u64(16)
+            first_seq = max(self._u64(24), next_seq - self.log_slots)
+            # walk newest to oldest so the limit stops the scan early
+            for i in range(next_seq - 1, max(since, first_seq) - 1, -1):
+                if len(raw) >= limit:
+                    break
+                offset = self._log_offset + (i % self.log_slots) * self.slot_size
+                length, slot_level = _SLOT.unpack_from(self._mm, offset)
+                if wanted is not None and slot_level != wanted:
+                    continue
+                raw.append(self._mm[offset + _SLOT.size:offset + _SLOT.size + length])
+        entries = []
+        for data in reversed(raw):
+            try:
+                entries.append(json.loads(data))
+            except ValueError:
+                continue
+        return entries, next_seq, first_seq
+
+    def log_counts(self) -> Dict[str, int]:
+        return {
+            level: self._u64(_COUNTS_OFFSET + 8 * i)
+            for i, level in enumerate(self.levels)
+        }
+
+    def log_tail(self, limit: int = 100) -> List[Dict[str, Any]]:
+        return self.log_since(0, None, limit)[0]
+
+    def touch(self) -> None:
+        with self._locked():
+            _F64.pack_into(self._mm, _ACTIVITY_OFFSET, time.time())
+            _U64.pack_into(self._mm, _ACTIVITY_OFFSET + 8, self._u64(_ACTIVITY_OFFSET + 8) + 1)
+
+    def activity(self) -> Tuple[Optional[float], int]:
+        """(last seen epoch seconds or None, messages received)."""
+        last_seen = _F64.unpack_from(self._mm, _ACTIVITY_OFFSET)[0]
+        return (last_seen or None), self._u64(_ACTIVITY_OFFSET + 8)
+
+    def clear_log(self) -> None:
+        with self._locked():
+            _U64.pack_into(self._mm, 24, self._u64(16))
+            for i in range(len(self.levels)):
+                _U64.pack_into(self._mm, _COUNTS_OFFSET + 8 * i, 0)
+
+
+class SharedFleetPartitions:
+    """Per-vehicle SharedMemoryBackend files next to the default state file.
+
+    Whichever worker sees a vehicle first creates its file; the others attach
+    to it on lookup, so fleet reads agree no matter which worker answers.
+    """
+
+    def __init__(
+        self,
+        base_path: str,
+        default_status: Dict[str, Any],
+        levels: Tuple[str, ...],
+        log_slots: int = 200,
+        doc_size: int = 16 * 1024,
+        slot_size: int = 1024,
+    ):
+        self.directory = os.path.dirname(base_path) or "."
+        self.prefix = os.path.basename(base_path) + ".v-"
+        self.default_status = default_status
+        self.levels = levels
+        self.log_slots = log_slots
+        self.doc_size = doc_size
+        self.slot_size = slot_size
+
+    @classmethod
+    def from_env(cls, default_status: Dict[str, Any], levels: Tuple[str, ...]) -> "SharedFleetPartitions":
+        return cls(
+            os.getenv("STATE_SHARED_PATH", _default_path()),
+            default_status,
+            levels,
+            log_slots=int(os.getenv("STATE_SHARED_FLEET_LOG_SLOTS", "200")),
+            doc_size=int(os.getenv("STATE_SHARED_FLEET_DOC_SIZE", str(16 * 1024))),
+            slot_size=int(os.getenv("STATE_SHARED_SLOT_SIZE", "1024")),
+        )
+
+    def path(self, vehicle: str) -> str:
+        return os.path.join(self.directory, self.prefix + vehicle)
+
+    def open(self, vehicle: str, create: bool = False) -> Optional[SharedMemoryBackend]:
+        """Backend for vehicle; None if no worker created it yet and create is False."""
+        path = self.path(vehicle)
+        if not create and not os.path.exists(path):
+            return None
+        return SharedMemoryBackend(
+            path,
+            self.default_status,
+            levels=self.levels,
+            log_slots=self.log_slots,
+            doc_size=self.doc_size,
+            slot_size=self.slot_size,
+        )
+
+    def vehicles(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return [name[len(self.prefix):] for name in names if name.startswith(self.prefix)]
+
+
+class IngestLeader:
+    """Elects one worker per host to run the MQTT bridge via a non-blocking flock.
+
+    The lock is held for the lifetime of the process; when the leader exits the
+    kernel releases it and a waiting worker takes over on its next attempt.
+    """
+
+    def __init__(self, lock_path: str, retry_interval: float = 5.0):
+        self.lock_path = lock_path
+        self.retry_interval = retry_interval
+        self.is_leader = False
+        self._fd: Optional[int] = None
+
+    def try_acquire(self) -> bool:
+        if self.is_leader:
+            return True
+        directory = os.path.dirname(self.lock_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode("ascii"))
+        self._fd = fd
+        self.is_leader = True
+        return True
+
+    def run_when_elected(self, callback: Callable[[], None]) -> None:
+        """Call callback now if elected, otherwise keep retrying in the background."""
+        if self.try_acquire():
+            callback()
+            return
+
+        def _wait():
+            while not self.try_acquire():
+                time.sleep(self.retry_interval)
+            logger.info(f"[INGEST] pid {os.getpid()} took over as ingest leader")
+            callback()
+
+        threading.Thread(target=_wait, name="ingest-leader-election", daemon=True).start()
@@ -0,0 +1,82 @@
+import time
+import importlib
+import threading
+from types import ModuleType
+from typing import Any, Dict, List, Optional
+
+__all__ = ["StartupTimer", "timer", "lazy_import"]
+
+
+class StartupTimer:
+    """Startup-phase breakdown: sequential phases plus one-off background events.
+
+    mark(phase) closes the phase that started at the previous mark; event()
+    records things that finish later (broker connection, first lazy import)
+    as an offset from process start.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self._origin = time.perf_counter()
+        self._last = self._origin
+        self.phases: List[Dict[str, Any]] = []
+        self.events: Dict[str, Dict[str, Any]] = {}
+        self.ready_ms: Optional[float] = None
+
+    def mark(self, phase: str) -> float:
+        """End `phase` now; returns its duration in ms."""
+        now = time.perf_counter()
+        with self._lock:
+            ms = round((now - self._last) * 1000, 3)
+            self.phases.append({"phase": phase, "ms": ms})
+            self._last = now
+        return ms
+
+    def ready(self) -> float:
+        """The worker can serve requests; returns ms since process start."""
+        with self._lock:
+            self.ready_ms = round((time.perf_counter() - self._origin) * 1000, 3)
+            return self.ready_ms
+
+    def event(self, name: str, duration_ms: Optional[float] = None) -> None:
+        """First occurrence of name (later ones are ignored)."""
+        with self._lock:
+            if name in self.events:
+                return
+            self.events[name] = {
+                "at_ms": round((time.perf_counter() - self._origin) * 1000, 3),
+                "ms": round(duration_ms, 3) if duration_ms is not None else None,
+            }
+
+    def summary(self) -> str:
+        with self._lock:
+            return ", ".join(f"{p['phase']}={p['ms']:.0f}ms" for p in self.phases)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "started": self.started,
+                "ready_ms": self.ready_ms,
+                "phases": list(self.phases),
+                "events": dict(self.events),
+            }
+
+
+timer = StartupTimer()
+
+_loaded: Dict[str, ModuleType] = {}
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Import a heavy optional module on first use, timing it as "import:<name>".
+
+    Raises ImportError like a regular import when it is not installed.
+    """
+    module = _loaded.get(name)
+    if module is None:
+        started = time.perf_counter()
+        module = importlib.import_module(name)
+        timer.event(f"import:{name}", (time.perf_counter() - started) * 1000)
+        _loaded[name] = module
+    return module
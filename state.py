@@ -1,34 +1,445 @@
 import os
+import re
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from itertools import islice
 from datetime import datetime, UTC
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-__all__ = ["drone_status", "latest_image", "mission_log", "log_message", "ensure_upload_dirs"]
+import metrics
+
+__all__ = [
+    "backend",
+    "fleet",
+    "Fleet",
+    "InMemoryBackend",
+    "get_status",
+    "get_version_tag",
+    "update_status",
+    "get_latest_image",
+    "set_latest_image",
+    "get_mission_log",
+    "get_mission_log_since",
+    "get_log_counts",
+    "clear_mission_log",
+    "log_message",
+    "subscribe",
+    "subscribe_fleet",
+    "ensure_upload_dirs",
+]
+
+logger = logging.getLogger(__name__)
 
 # Shared runtime state for the application
 
-drone_status = {
+DEFAULT_STATUS = {
     "altitude": 0.0,
     "speed": 0.0,
     "battery_percent": 100,
     "battery_voltage": 0,
     "gps_global": "0.0,0.0",
+    "gps_lat": 0.0,
+    "gps_lon": 0.0,
     "gps_relative": "0.0,0.0",
     "mission_time": "00:00:00",
     "flight_mode": "INIT",
-    "last_update": datetime.now(UTC).isoformat(),
 }
 
-latest_image = None
-mission_log = []
+MISSION_LOG_LIMIT = 1000
+
+LOG_LEVELS = ("debug", "info", "warning", "error", "critical")
+
+
+# Fleet: vehicles other than the default one get their own partition
+FLEET_DEFAULT_VEHICLE = os.getenv("FLEET_DEFAULT_VEHICLE", "default").strip() or "default"
+FLEET_MAX_VEHICLES = int(os.getenv("FLEET_MAX_VEHICLES", "256"))
+
+# vehicle ids end up in Socket.IO room names and URLs
+VEHICLE_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+# status fields included per vehicle in Fleet.summary()
+SUMMARY_FIELDS = (
+    "altitude",
+    "speed",
+    "battery_percent",
+    "flight_mode",
+    "gps_lat",
+    "gps_lon",
+    "heading",
+    "last_update",
+)
+
+
+def _level_key(level: str) -> str:
+    level = str(level).lower()
+    return level if level in LOG_LEVELS else "other"
+
+
+def _tail(entries, count: int) -> List[Dict[str, Any]]:
+    """Last count items of a deque without walking it from the left."""
+    if count <= 0:
+        return []
+    tail = list(islice(reversed(entries), count))
+    tail.reverse()
+    return tail
+
+
+class InMemoryBackend:
+    """Process-local state (one copy per worker)."""
+
+    name = "memory"
+
+    def __init__(self, log_limit: int = MISSION_LOG_LIMIT):
+        self.log_limit = log_limit
+        self._lock = threading.Lock()
+        self._status: Dict[str, Any] = {
+            **DEFAULT_STATUS,
+            "last_update": datetime.now(UTC).isoformat(),
+        }
+        self._latest_image: Optional[Dict[str, Any]] = None
+        self._log: deque = deque(maxlen=log_limit)
+        self._log_seq = 0
+        self._log_counts = dict.fromkeys(LOG_LEVELS + ("other",), 0)
+        self._version = 0
+        # [last seen (epoch s), messages]
+        self._activity: List[float] = [0.0, 0]
+        # distinguishes this process's counter from other workers and restarts
+        self.epoch = uuid.uuid4().hex[:8]
+
+    def version(self) -> int:
+        return self._version
+
+    def get_status(self) -> Dict[str, Any]:
+        """A copy: callers must not see (or make) changes behind the lock."""
+        with self._lock:
+            return dict(self._status)
+
+    def update_status(self, updates: Dict[str, Any]) -> None:
+        with self._lock:
+            self._status.update(updates)
+            self._version += 1
+
+    def get_latest_image(self) -> Optional[Dict[str, Any]]:
+        return self._latest_image
+
+    def set_latest_image(self, image: Optional[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._latest_image = image
+            self._version += 1
+
+    def append_log(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            entry["seq"] = self._log_seq
+            self._log_seq += 1
+            # deque(maxlen) evicts the oldest entry in O(1)
+            self._log.append(entry)
+            self._log_counts[_level_key(entry.get("level", "info"))] += 1
+        return entry
+
+    def log_seq(self) -> int:
+        return self._log_seq
+
+    def log_since(
+        self,
+        since: int = 0,
+        level: Optional[str] = None,
+        limit: int = 100,
+    ) -> Tuple[List[Dict[str, Any]], int, int]:
+        """Entries with seq >= since (newest `limit`); returns (entries, next_seq, first_seq)."""
+        with self._lock:
+            next_seq = self._log_seq
+            first_seq = next_seq - len(self._log)
+            available = next_seq - max(since, first_seq)
+            if level is None:
+                return _tail(self._log, min(available, limit)), next_seq, first_seq
+            wanted = _level_key(level)
+            matching = [
+                e for e in _tail(self._log, available)
+                if _level_key(e.get("level", "info")) == wanted
+            ]
+        return matching[max(0, len(matching) - limit):], next_seq, first_seq
+
+    def log_counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._log_counts)
+
+    def log_tail(self, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            return _tail(self._log, limit)
+
+    def clear_log(self) -> None:
+        with self._lock:
+            self._log.clear()
+            self._log_counts = dict.fromkeys(self._log_counts, 0)
+
+    def touch(self) -> None:
+        with self._lock:
+            self._activity[0] = time.time()
+            self._activity[1] += 1
+
+    def activity(self) -> Tuple[Optional[float], int]:
+        """(last seen epoch seconds or None, messages received)."""
+        return (self._activity[0] or None), int(self._activity[1])
+
+
+def _create_backend():
+    kind = os.getenv("STATE_BACKEND", "memory").strip().lower()
+    if kind == "shared":
+        from shared_state import SharedMemoryBackend
+        return SharedMemoryBackend.from_env(DEFAULT_STATUS, MISSION_LOG_LIMIT, LOG_LEVELS)
+    return InMemoryBackend()
+
+
+backend = _create_backend()
+
+
+def _create_fleet_partitions():
+    """Shared per-vehicle files when the default vehicle is shared, else None (process-local)."""
+    if backend.name != "shared":
+        return None
+    from shared_state import SharedFleetPartitions
+    return SharedFleetPartitions.from_env(DEFAULT_STATUS, LOG_LEVELS)
+
+
+class Fleet:
+    """Per-vehicle state partitions (status, latest image, mission log).
+
+    The default vehicle is the module-level backend, i.e. the single-drone
+    state the dashboard, journal and shared-memory workers use. Every other
+    vehicle gets its own InMemoryBackend on its first message or, with shared
+    partitions, a shared file that the other workers attach to on lookup.
+    Lookups are one dict get, so per-message cost does not grow with the fleet.
+    """
+
+    def __init__(
+        self,
+        default_backend,
+        default_id: str = "default",
+        max_vehicles: int = 256,
+        log_limit: int = MISSION_LOG_LIMIT,
+        shared=None,
+    ):
+        self.default_id = default_id
+        self.max_vehicles = max_vehicles
+        self.log_limit = log_limit
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._partitions: Dict[str, Any] = {default_id: default_backend}
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self._partitions)
+
+    def partition(self, vehicle: Optional[str], create: bool = False):
+        """Backend for vehicle (None = default); None if unknown and not created.
+
+        Raises ValueError for malformed ids and LookupError when the fleet is full.
+        """
+        if vehicle is None:
+            vehicle = self.default_id
+        partition = self._partitions.get(vehicle)
+        if partition is not None or not (create or self.shared):
+            return partition
+        if not VEHICLE_ID_RE.match(vehicle):
+            if not create:
+                return None
+            raise ValueError(f"Invalid vehicle id: {vehicle!r}")
+        with self._lock:
+            partition = self._partitions.get(vehicle)
+            if partition is None and self.shared is not None:
+                # possibly created by another worker
+                partition = self.shared.open(vehicle)
+            if partition is None:
+                if not create:
+                    return None
+                count = len(self._partitions) if self.shared is None else len(self.shared.vehicles()) + 1
+                if count >= self.max_vehicles:
+                    self.rejected += 1
+                    raise LookupError(f"Fleet limit reached ({self.max_vehicles} vehicles)")
+                if self.shared is not None:
+                    partition = self.shared.open(vehicle, create=True)
+                else:
+                    partition = InMemoryBackend(self.log_limit)
+            self._partitions[vehicle] = partition
+        return partition
 
+    def _attach_shared(self) -> None:
+        """Attach partitions other workers created since the last call."""
+        if self.shared is None:
+            return
+        for vehicle in self.shared.vehicles():
+            if vehicle not in self._partitions:
+                self.partition(vehicle)
 
-def log_message(app, level: str, message: str) -> None:
-    """Append message to in‑memory log and to the app logger."""
+    def touch(self, vehicle: Optional[str]) -> None:
+        """Record a message from vehicle (liveness for the summary)."""
+        partition = self.partition(vehicle)
+        if partition is not None:
+            partition.touch()
+
+    def vehicles(self) -> List[str]:
+        self._attach_shared()
+        return sorted(self._partitions)
+
+    def summary(self) -> Dict[str, Any]:
+        """One compact entry per vehicle for fleet overviews."""
+        self._attach_shared()
+        with self._lock:
+            partitions = sorted(self._partitions.items())
+        vehicles = []
+        for vehicle, partition in partitions:
+            status = partition.get_status()
+            last_seen, messages = partition.activity()
+            vehicles.append({
+                "id": vehicle,
+                "default": vehicle == self.default_id,
+                "status": {field: status.get(field) for field in SUMMARY_FIELDS},
+                "latest_image": partition.get_latest_image(),
+                "log_seq": partition.log_seq(),
+                "last_seen": datetime.fromtimestamp(last_seen, UTC).isoformat() if last_seen else None,
+                "messages": int(messages),
+            })
+        return {
+            "default": self.default_id,
+            "count": len(vehicles),
+            "max_vehicles": self.max_vehicles,
+            "rejected": self.rejected,
+            "vehicles": vehicles,
+        }
+
+
+fleet = Fleet(backend, FLEET_DEFAULT_VEHICLE, FLEET_MAX_VEHICLES, shared=_create_fleet_partitions())
+
+
+# Read by vehicles that have no partition: defaults, never written
+_NO_PARTITION = InMemoryBackend(log_limit=1)
+
+
+def _target(vehicle: Optional[str]):
+    """Backend written for vehicle; the default vehicle (or None) is the shared one."""
+    if vehicle is None or vehicle == fleet.default_id:
+        return backend
+    return fleet.partition(vehicle, create=True)
+
+
+def _source(vehicle: Optional[str]):
+    """Backend read for vehicle. Unknown vehicles read as defaults: a read never
+    creates a partition (or, in shared mode, its backing file)."""
+    if vehicle is None or vehicle == fleet.default_id:
+        return backend
+    return fleet.partition(vehicle) or _NO_PARTITION
+
+# Callbacks notified of every state change as (kind, data), where kind is one
+# of "status", "image", "log" or "log_clear" (journal, alert rules, ...).
+# These only see the default vehicle and run while _apply_lock is held, so
+# they observe changes in exactly the order they were applied (a journal
+# checkpoint taken from a listener matches the records written before it).
+# Fleet listeners get (vehicle, kind, data) for every vehicle, after the lock
+# is released.
+_listeners: List[Callable[[str, Any], None]] = []
+_fleet_listeners: List[Callable[[str, str, Any], None]] = []
+_apply_lock = threading.RLock()
+
+
+def subscribe(callback: Callable[[str, Any], None]) -> None:
+    _listeners.append(callback)
+
+
+def subscribe_fleet(callback: Callable[[str, str, Any], None]) -> None:
+    _fleet_listeners.append(callback)
+
+
+def _notify_ordered(kind: str, data: Any, vehicle: Optional[str] = None) -> None:
+    """Default-vehicle listeners; call with _apply_lock held, right after the change."""
+    if vehicle is not None and vehicle != fleet.default_id:
+        return
+    for callback in _listeners:
+        try:
+            callback(kind, data)
+        except Exception as exc:
+            logger.error(f"[STATE] {kind} listener failed: {exc}")
+
+
+def _notify(kind: str, data: Any, vehicle: Optional[str] = None) -> None:
+    if vehicle is None:
+        vehicle = fleet.default_id
+    for callback in _fleet_listeners:
+        try:
+            callback(vehicle, kind, data)
+        except Exception as exc:
+            logger.error(f"[STATE] {kind} listener failed: {exc}")
+
+
+def get_status(vehicle: Optional[str] = None) -> Dict[str, Any]:
+    return _source(vehicle).get_status()
+
+
+def get_version_tag(vehicle: Optional[str] = None) -> str:
+    """Opaque tag that changes whenever status or the latest image does (ETag material)."""
+    target = _source(vehicle)
+    return f"{target.epoch}-{target.version():x}"
+
+
+def update_status(updates: Dict[str, Any], vehicle: Optional[str] = None) -> None:
+    with _apply_lock:
+        _target(vehicle).update_status(updates)
+        _notify_ordered("status", updates, vehicle)
+    _notify("status", updates, vehicle)
+
+
+def get_latest_image(vehicle: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    return _source(vehicle).get_latest_image()
+
+
+def set_latest_image(image: Optional[Dict[str, Any]], vehicle: Optional[str] = None) -> None:
+    with _apply_lock:
+        _target(vehicle).set_latest_image(image)
+        _notify_ordered("image", image, vehicle)
+    _notify("image", image, vehicle)
+
+
+def get_mission_log(limit: int = 100, vehicle: Optional[str] = None) -> List[Dict[str, Any]]:
+    return _source(vehicle).log_tail(limit)
+
+
+def get_mission_log_since(
+    since: int = 0,
+    level: Optional[str] = None,
+    limit: int = 100,
+    vehicle: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], int, int]:
+    return _source(vehicle).log_since(since, level, limit)
+
+
+def get_log_counts(vehicle: Optional[str] = None) -> Dict[str, int]:
+    return _source(vehicle).log_counts()
+
+
+def clear_mission_log(vehicle: Optional[str] = None) -> None:
+    with _apply_lock:
+        _target(vehicle).clear_log()
+        _notify_ordered("log_clear", None, vehicle)
+    _notify("log_clear", None, vehicle)
+
+
+@metrics.timed("dron_log_message_seconds", "state.log_message time (backend append, listeners, app logger)")
+def log_message(app, level: str, message: str, vehicle: Optional[str] = None) -> Dict[str, Any]:
+    """Append message to the (vehicle's) mission log and to the app logger; returns the entry with its seq."""
     entry = {
         "timestamp": datetime.now(UTC).isoformat(),
         "level": level,
         "message": message,
     }
-    mission_log.append(entry)
+    if vehicle is not None and vehicle != fleet.default_id:
+        entry["vehicle"] = vehicle
+        message = f"[{vehicle}] {message}"
+    with _apply_lock:
+        entry = _target(vehicle).append_log(entry)
+        _notify_ordered("log", entry, vehicle)
+    _notify("log", entry, vehicle)
 
     # use Flask app logger if available
     try:
@@ -37,9 +448,7 @@ def log_message(app, level: str, message: str) -> None:
     except Exception:
         print(message)
 
-    # keep at most 1000 entries
-    if len(mission_log) > 1000:
-        mission_log.pop(0)
+    return entry
 
 
 def ensure_upload_dirs(app):
@@ -55,4 +464,3 @@ def ensure_upload_dirs(app):
         with open(test_file, "w") as f:
             f.write("test")
         os.remove(test_file)
-
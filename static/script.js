@@ -7,6 +7,12 @@ let isConnected = false;
 let isMqttConnected = false;
 let manualImageSelected = false;
 
+// Last known full status; Socket.IO pushes only changed fields (deltas)
+let currentStatus = {};
+
+// Sequence number of the next mission log entry we expect (null until first load)
+let nextLogSeq = null;
+
 // Mission timer variables
 let missionStartTime = null;
 let missionTimerInterval = null;
@@ -130,8 +136,34 @@ function setupEventListeners() {
     });
 }
 
+// Fallback when the Socket.IO client is unavailable: Server-Sent Events.
+// EventSource resumes with Last-Event-ID on its own after a drop.
+function connectEventStream() {
+    const source = new EventSource('/api/stream');
+    source.addEventListener('open', () => {
+        isConnected = true;
+        updateConnectionStatus(true);
+    });
+    source.addEventListener('error', () => {
+        isConnected = false;
+        updateConnectionStatus(false);
+    });
+    source.addEventListener('snapshot', (event) => {
+        const data = JSON.parse(event.data);
+        Object.assign(currentStatus, data.status);
+        updateDroneStatus(currentStatus);
+    });
+    source.addEventListener('telemetry', (event) => {
+        processIncomingData(JSON.parse(event.data));
+    });
+}
+
 function connectWebSocket() {
     if (socket && socket.connected) return;
+    if (typeof io === 'undefined') {
+        connectEventStream();
+        return;
+    }
     socket = io({
         transports: ['websocket', 'polling'],
         reconnectionAttempts: maxReconnectAttempts,
@@ -143,6 +175,8 @@ function connectWebSocket() {
         reconnectAttempts = 0;
         updateConnectionStatus(true);
         addLogEntry('info', 'WebSocket connected');
+        // After a reconnect fetch only the entries we missed
+        if (nextLogSeq !== null) fetchLogsSince(nextLogSeq);
     });
 
     socket.on('connect_error', (error) => {
@@ -196,7 +230,10 @@ function fetchInitialData() {
 
     fetch('/api/log')
         .then(response => response.json())
-        .then(data => updateLogDisplay(data.logs))
+        .then(data => {
+            updateLogDisplay(data.logs);
+            nextLogSeq = data.next;
+        })
         .catch(error => {
             console.error('Error fetching initial logs:', error);
             addLogEntry('error', `Failed to fetch initial logs: ${error.message}`);
@@ -210,24 +247,27 @@ function processIncomingData(data) {
         return;
     }
 
+    const hasMqtt = !!data.topic || (Array.isArray(data.topics) && data.topics.length > 0);
+
     // Debug logging for received data
-    if (data.topic || data.status || data.image) {
+    if (hasMqtt || data.status || data.image) {
         console.debug('Telemetry received:', {
             hasStatus: !!data.status,
             hasImage: !!data.image,
-            hasMqtt: !!(data.topic && data.payload)
+            hasMqtt: hasMqtt
         });
     }
 
-    // Detect MQTT connection by presence of MQTT data
-    if (data.topic && data.payload) {
+    // Detect MQTT connection by presence of MQTT topics
+    if (hasMqtt) {
         updateMqttStatus(true);
         lastMqttMessageTime = Date.now();
     }
 
-    // Handle status updates with null-safe access
+    // Status arrives as a delta: merge into the last known status
     if (data.status) {
-        const safeStatus = sanitizeStatus(data.status);
+        Object.assign(currentStatus, data.status);
+        const safeStatus = sanitizeStatus(currentStatus);
         updateDroneStatus(safeStatus);
     }
 
@@ -235,23 +275,18 @@ function processIncomingData(data) {
     if (data.image) updateImageDisplay(data.image);
 
     // Handle log arrays
-    if (Array.isArray(data.logs)) updateLogDisplay(data.logs);
+    if (Array.isArray(data.logs)) appendLogEntries(data.logs);
 
     // Handle individual log entry
-    if (data.log) {
+    const hasSeq = data.log && typeof data.log.seq === 'number';
+    const alreadyShown = hasSeq && nextLogSeq !== null && data.log.seq < nextLogSeq;
+    if (data.log && !alreadyShown) {
+        if (hasSeq) nextLogSeq = data.log.seq + 1;
         const logLevel = data.log.level || 'info';
         const logMessage = data.log.message || JSON.stringify(data.log);
         const logTimestamp = data.log.timestamp;
         addLogEntry(logLevel, logMessage, logTimestamp);
     }
-
-    // Handle MQTT topic/payload
-    if (data.topic && data.payload) {
-        const payloadStr = typeof data.payload === 'string'
-            ? data.payload
-            : JSON.stringify(data.payload);
-        addLogEntry('mqtt', `[${data.topic}] ${payloadStr}`);
-    }
 }
 
 // Sanitize status object to handle null/undefined values
@@ -278,12 +313,28 @@ function updateFlightStatusIndicator(flightMode) {
     }
 }
 
+// Last /api/status ETag seen per consumer; an unchanged ETag means the
+// browser revalidated with If-None-Match and there is nothing to redraw
+const statusEtags = {};
+
+function fetchStatusIfChanged(consumer) {
+    return fetch('/api/status').then(response => {
+        const etag = response.headers.get('ETag');
+        if (etag && statusEtags[consumer] === etag) return null;
+        statusEtags[consumer] = etag;
+        return response.json();
+    });
+}
+
 function updateDroneStatus(status) {
     // If status is not provided, fetch from API
     if (!status) {
-        fetch('/api/status')
-            .then(response => response.json())
-            .then(data => updateDroneStatus(data))
+        fetchStatusIfChanged('status')
+            .then(data => {
+                if (!data) return;
+                Object.assign(currentStatus, data);
+                updateDroneStatus(data);
+            })
             .catch(error => {
                 console.error('Error fetching drone status:', error);
                 showError('Failed to update drone status');
@@ -338,10 +389,9 @@ function updateImagePanel() {
     // Don't update if manual image is selected
     if (manualImageSelected) return;
 
-    fetch('/api/status')
-        .then(response => response.json())
+    fetchStatusIfChanged('image')
         .then(data => {
-            if (data.latest_image) {
+            if (data && data.latest_image) {
                 droneImage.src = `/images/${data.latest_image.filename}`;
                 imageTimestamp.textContent = `Uploaded: ${new Date(data.latest_image.timestamp).toLocaleString()}`;
                 imageSize.textContent = `Size: ${(data.latest_image.size / 1024).toFixed(2)} KB`;
@@ -353,12 +403,22 @@ function updateImagePanel() {
         });
 }
 setInterval(updateImagePanel, 6000);
+const GALLERY_PAGE_SIZE = 100;
 setInterval(loadGallery, 6000);
 
+let galleryEtag = null;
+
 function loadGallery() {
-    fetch('/api/images')
-        .then(response => response.json())
+    fetch(`/api/images?limit=${GALLERY_PAGE_SIZE}`)
+        .then(response => {
+            const etag = response.headers.get('ETag');
+            // Revalidated via If-None-Match: nothing changed since the last poll
+            if (etag && etag === galleryEtag) return null;
+            galleryEtag = etag;
+            return response.json();
+        })
         .then(data => {
+            if (!data) return;
             const gallery = document.getElementById('gallery-container');
             if (!gallery) return;
 
@@ -371,7 +431,8 @@ function loadGallery() {
 
             data.images.forEach(filename => {
                 const img = document.createElement('img');
-                img.src = `/images/${filename}`;
+                img.src = `/images/${filename}?size=thumb`;
+                img.loading = 'lazy';
                 img.className = 'thumbnail';
                 img.alt = filename;
                 img.title = filename;
@@ -466,6 +527,34 @@ function updateLogDisplay(logs) {
     logs.forEach(log => addLogEntry(log.level, log.message, log.timestamp));
 }
 
+// Append entries not yet shown (seq >= nextLogSeq); full redraw before first load
+function appendLogEntries(logs) {
+    if (nextLogSeq === null) {
+        updateLogDisplay(logs);
+    } else {
+        logs.filter(log => typeof log.seq !== 'number' || log.seq >= nextLogSeq)
+            .forEach(log => addLogEntry(log.level, log.message, log.timestamp));
+    }
+    const last = logs[logs.length - 1];
+    if (last && typeof last.seq === 'number') {
+        nextLogSeq = Math.max(nextLogSeq ?? 0, last.seq + 1);
+    }
+}
+
+function fetchLogsSince(since) {
+    fetch(`/api/log?since=${since}&limit=200`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.resync) {
+                updateLogDisplay(data.logs);
+            } else {
+                appendLogEntries(data.logs);
+            }
+            nextLogSeq = data.next;
+        })
+        .catch(error => console.error('Error fetching new logs:', error));
+}
+
 function addLogEntry(level, message, timestamp) {
     if (!missionLog) return;
 
@@ -0,0 +1,117 @@
+import json
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+__all__ = ["EventStream"]
+
+
+class EventStream:
+    """Sequence-numbered fan-out of telemetry events for SSE and long-poll clients.
+
+    Each event is serialized exactly once when published; subscribers only copy
+    the prepared bytes, so the per-client cost is a wakeup and a socket write.
+    A bounded ring of recent events lets clients resume from Last-Event-ID.
+    """
+
+    def __init__(self, buffer: int = 2048, keepalive: float = 15.0, event: str = "telemetry"):
+        self.keepalive = keepalive
+        self.event = event
+        self._cond = threading.Condition()
+        # (seq, json text, SSE frame)
+        self._ring: deque = deque(maxlen=buffer)
+        self._seq = 0
+        self.subscribers = 0
+        self.counters = {"published": 0, "serialized_bytes": 0, "frames_sent": 0, "resyncs": 0}
+
+    # --------------------------------------------------
+    # PRODUCER
+    # --------------------------------------------------
+    def publish(self, payload: Dict[str, Any]) -> int:
+        """Serialize payload once and wake every subscriber; returns its seq."""
+        text = json.dumps(payload, separators=(",", ":"), default=str)
+        with self._cond:
+            self._seq += 1
+            frame = f"id: {self._seq}\nevent: {self.event}\ndata: {text}\n\n".encode("utf-8")
+            self._ring.append((self._seq, text, frame))
+            self.counters["published"] += 1
+            self.counters["serialized_bytes"] += len(frame)
+            self._cond.notify_all()
+            return self._seq
+
+    # --------------------------------------------------
+    # CONSUMERS
+    # --------------------------------------------------
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    def _since(self, last_id: int) -> Tuple[List[Tuple[int, str, bytes]], bool]:
+        """Buffered events after last_id (caller holds the lock); flags a gap."""
+        if not self._ring or last_id >= self._seq:
+            return [], False
+        first = self._ring[0][0]
+        gap = last_id < first - 1
+        start = max(0, last_id + 1 - first)
+        return [self._ring[i] for i in range(start, len(self._ring))], gap
+
+    def wait(self, last_id: int, timeout: float) -> Tuple[List[Tuple[int, str, bytes]], bool]:
+        """Block until there are events after last_id or timeout expires."""
+        with self._cond:
+            if self._seq <= last_id:
+                self._cond.wait_for(lambda: self._seq > last_id, timeout)
+            return self._since(last_id)
+
+    def sse(self, last_id: Optional[int], snapshot: Callable[[], Dict[str, Any]]) -> Iterator[bytes]:
+        """SSE byte stream resuming after last_id; sends a snapshot when it cannot resume."""
+        with self._cond:
+            self.subscribers += 1
+            current = self._seq
+            _, gap = self._since(last_id) if last_id is not None else ([], True)
+        try:
+            yield b"retry: 3000\n\n"
+            if last_id is None or gap or last_id > current:
+                # new client, or its position fell out of the ring (or predates a restart)
+                with self._cond:
+                    self.counters["resyncs"] += 1
+                text = json.dumps(snapshot(), separators=(",", ":"), default=str)
+                yield f"id: {current}\nevent: snapshot\ndata: {text}\n\n".encode("utf-8")
+                last_id = current
+
+            while True:
+                events, gap = self.wait(last_id, self.keepalive)
+                if gap:
+                    with self._cond:
+                        self.counters["resyncs"] += 1
+                    text = json.dumps(snapshot(), separators=(",", ":"), default=str)
+                    yield f"id: {events[-1][0]}\nevent: snapshot\ndata: {text}\n\n".encode("utf-8")
+                    last_id = events[-1][0]
+                    continue
+                if not events:
+                    yield b": keepalive\n\n"
+                    continue
+                last_id = events[-1][0]
+                with self._cond:
+                    self.counters["frames_sent"] += len(events)
+                yield b"".join(frame for _, _, frame in events)
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+    def poll(self, since: int, timeout: float) -> Tuple[str, int, bool]:
+        """Long-poll body: a JSON array built from the pre-serialized events."""
+        events, gap = self.wait(since, timeout)
+        next_id = events[-1][0] if events else max(since, 0)
+        if since > self._seq:
+            gap = True
+            next_id = self._seq
+        return "[" + ",".join(text for _, text, _ in events) + "]", next_id, gap
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                **self.counters,
+                "seq": self._seq,
+                "buffered": len(self._ring),
+                "subscribers": self.subscribers,
+            }
@@ -0,0 +1,36 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py configures itself from the environment at import time: keep it off
+# the network and out of the working tree
+_DATA = tempfile.mkdtemp(prefix="dron-tests-")
+for name, value in {
+    "MQTT_ENABLED": "0",
+    "JOURNAL_ENABLED": "0",
+    "STATE_BACKEND": "memory",
+    "SECRET_KEY": "test",
+    "UPLOAD_FOLDER": os.path.join(_DATA, "images"),
+    "LOG_FILE": os.path.join(_DATA, "mission.log"),
+    "MISSION_FILE": os.path.join(_DATA, "missions.json"),
+    "INGEST_SPILL_DIR": os.path.join(_DATA, "spool"),
+    "INGEST_LOCK_PATH": os.path.join(_DATA, "ingest.lock"),
+}.items():
+    os.environ.setdefault(name, value)
+
+
+@pytest.fixture
+def client():
+    """Logged-in test client for the route tests."""
+    import app as webapp
+
+    webapp.app.config["SESSION_COOKIE_SECURE"] = False
+    client = webapp.app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = "1"
+    return client
@@ -0,0 +1,55 @@
+from alerts import RuleEngine
+
+BATTERY = {"id": "battery_low", "type": "threshold", "field": "battery_percent", "op": "<", "value": 20, "clear": 25,
+           "level": "warning", "message": "Battery low: {value:.0f}%"}
+FENCE = {"id": "field", "type": "geofence", "mode": "outside", "level": "critical", "message": "Left the field",
+         "polygon": [[50.0, 19.0], [50.0, 19.1], [50.1, 19.1], [50.1, 19.0]]}
+
+
+def _states(events):
+    return [(event["rule"], event["state"]) for event in events]
+
+
+def test_threshold_clears_only_past_the_clear_value():
+    engine = RuleEngine([BATTERY])
+
+    assert _states(engine.evaluate("d1", {"battery_percent": 19})) == [("battery_low", "firing")]
+    assert engine.evaluate("d1", {"battery_percent": 22}) == []
+    assert engine.evaluate("d1", {"battery_percent": 18}) == []
+    assert _states(engine.evaluate("d1", {"battery_percent": 26})) == [("battery_low", "cleared")]
+    assert engine.active() == []
+
+
+def test_vehicles_keep_separate_alert_state():
+    engine = RuleEngine([BATTERY])
+    engine.evaluate("d1", {"battery_percent": 10})
+
+    assert engine.evaluate("d2", {"battery_percent": 50}) == []
+    assert [alert["vehicle"] for alert in engine.active()] == ["d1"]
+
+
+def test_geofence_fires_on_leaving_and_clears_on_return():
+    engine = RuleEngine([FENCE])
+
+    assert engine.evaluate("d1", {"gps_lat": 50.05, "gps_lon": 19.05}) == []
+    assert engine.evaluate("d1", {"gps_lat": 50.06, "gps_lon": 19.05}) == []
+    assert _states(engine.evaluate("d1", {"gps_lat": 50.2, "gps_lon": 19.05})) == [("field", "firing")]
+    assert _states(engine.evaluate("d1", {"gps_lat": 50.05, "gps_lon": 19.05})) == [("field", "cleared")]
+
+
+def test_geofence_ignores_the_no_fix_position():
+    engine = RuleEngine([FENCE])
+
+    assert engine.evaluate("d1", {"gps_lat": 0.0, "gps_lon": 0.0}) == []
+
+
+def test_owner_evaluates_rules_changed_on_another_worker(tmp_path):
+    path = str(tmp_path / "alerts.json")
+    owner, follower = RuleEngine([BATTERY]), RuleEngine([BATTERY])
+    owner.share(path, lambda: True)
+    follower.share(path, lambda: False)
+    owner.sync()
+
+    follower.load([dict(BATTERY, value=50, clear=55)])
+
+    assert _states(owner.evaluate("d1", {"battery_percent": 40})) == [("battery_low", "firing")]
@@ -0,0 +1,52 @@
+import pytest
+
+from camera import CameraService
+
+
+class CountingSource:
+    def __init__(self):
+        self.frame = 0
+
+    def read(self):
+        self.frame += 1
+        return self.frame
+
+    def encode(self, frame, scale, quality):
+        return f"{frame}@{scale}".encode()
+
+    def close(self):
+        pass
+
+
+def test_viewer_fps_is_capped_at_the_capture_rate():
+    camera = CameraService(CountingSource, fps=20, idle_timeout=0.1)
+    camera.ensure_started()
+    fast = camera.frames(fps=1000)
+    slow = camera.frames(fps=2)
+
+    next(fast), next(slow)
+    target = {v["id"]: v["target_fps"] for v in camera.viewer_stats()}
+    fast.close(), slow.close()
+
+    assert sorted(target.values()) == [2.0, 20.0]
+
+
+def test_viewers_share_one_encode_per_tier():
+    camera = CameraService(CountingSource, fps=50, idle_timeout=0.1)
+    camera.ensure_started()
+    viewers = [camera.frames(tier="high") for _ in range(3)]
+
+    parts = [next(v) for v in viewers]
+    for v in viewers:
+        v.close()
+
+    assert all(part.startswith(b"--frame\r\n") for part in parts)
+    stats = camera.stats()
+    assert stats["encodes"] <= stats["frames"]
+
+
+@pytest.mark.parametrize("fps", ["0", "-5", "nan"])
+def test_video_feed_rejects_non_positive_fps(client, fps):
+    response = client.get(f"/video_feed?fps={fps}")
+
+    assert response.status_code == 400
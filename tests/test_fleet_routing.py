@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+import app as webapp
+import state
+from broadcaster import vehicle_room
+from history import telemetry_history
+
+
+@pytest.mark.parametrize("payload, expected", [
+    ({"vehicle": "DJI Mavic 3"}, None),
+    ({"drone_id": "d9"}, None),
+    ({"vehicle_id": "bad id!"}, None),
+    ({"vehicle_id": ""}, None),
+    ({"vehicle_id": state.fleet.default_id}, None),
+    ({"vehicle_id": "d7"}, "d7"),
+    ({"vehicle_id": 12}, "12"),
+])
+def test_payload_vehicle(payload, expected):
+    assert webapp._message_vehicle("drone/status", payload) == (expected, "drone/status")
+
+
+def test_topic_prefix_wins_over_payload():
+    assert webapp._message_vehicle("fleet/d2/drone/status", {"vehicle_id": "d7"}) == ("d2", "drone/status")
+
+
+def test_display_name_lands_on_default_vehicle():
+    payload = {"vehicle": "DJI Mavic 3", "battery": 42}
+    webapp._handle_mqtt_payload("drone/status", (json.dumps(payload).encode(), payload))
+
+    assert state.get_status()["battery_percent"] == 42
+    assert state.fleet.partition("DJI Mavic 3") is None
+
+
+def test_invalid_vehicle_id_falls_back_to_default():
+    payload = {"vehicle_id": "no spaces allowed", "battery": 37}
+    webapp._handle_mqtt_payload("drone/status", (json.dumps(payload).encode(), payload))
+
+    assert state.get_status()["battery_percent"] == 37
+
+
+def test_valid_vehicle_id_gets_its_own_partition():
+    payload = {"vehicle_id": "d7", "battery": 12}
+    webapp._handle_mqtt_payload("drone/status", (json.dumps(payload).encode(), payload))
+
+    assert state.get_status("d7")["battery_percent"] == 12
+    assert "d7" in state.fleet.vehicles()
+
+
+def _socket_rooms(client):
+    sid = client.eio_sid
+    server = webapp.socketio.server
+    return set(server.manager.get_rooms(server.manager.sid_from_eio_sid(sid, "/"), "/"))
+
+
+def test_exclusive_subscribe_leaves_every_vehicle_room():
+    client = webapp.socketio.test_client(webapp.app)
+    for vehicle in ("d1", "d2"):
+        assert client.emit("subscribe", {"vehicle": vehicle, "exclusive": False}, callback=True)["success"]
+
+    reply = client.emit("subscribe", {"vehicle": "d3"}, callback=True)
+
+    vehicle_rooms = {room for room in _socket_rooms(client) if room.startswith("vehicle")}
+    assert vehicle_rooms == {reply["room"]} == {vehicle_room("d3")}
+    client.disconnect()
+
+
+def test_reads_do_not_create_partitions():
+    assert state.get_status("ghost")["battery_percent"] == state.DEFAULT_STATUS["battery_percent"]
+    assert state.get_latest_image("ghost") is None
+    assert state.get_mission_log(10, vehicle="ghost") == []
+    assert state.get_mission_log_since(0, vehicle="ghost")[0] == []
+    state.get_version_tag("ghost")
+
+    assert state.fleet.partition("ghost") is None
+    assert "ghost" not in state.fleet.vehicles()
+
+
+def test_status_is_returned_as_a_copy():
+    state.get_status()["battery_percent"] = -1
+
+    assert state.get_status()["battery_percent"] != -1
+
+
+def test_history_is_recorded_once_per_vehicle(client):
+    before = telemetry_history.stats("d8")["altitude"]
+
+    response = client.post("/api/status", json={"vehicle_id": "d8", "altitude": 42})
+
+    assert response.status_code == 200
+    assert telemetry_history.stats("d8")["altitude"] == before + 1
+    result = client.get("/api/telemetry/history?field=altitude&vehicle=d8").get_json()
+    assert result["avg"][-1] == 42.0
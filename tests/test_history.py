@@ -0,0 +1,72 @@
+import math
+
+import pytest
+
+from history import RingBuffer, TelemetryHistory
+
+
+def _history(samples, capacity=100):
+    history = TelemetryHistory(["altitude"], capacity)
+    for ts, value in samples:
+        history.record({"altitude": value}, ts)
+    return history
+
+
+def test_range_query_is_inclusive_and_chronological_after_wraparound():
+    history = _history([(float(i), i * 10.0) for i in range(15)], capacity=10)
+
+    result = history.query("altitude", start=7, end=9)
+
+    assert result["t"] == [7.0, 8.0, 9.0]
+    assert result["avg"] == [70.0, 80.0, 90.0]
+    assert history.query("altitude", start=0, end=4)["count"] == 0  # overwritten
+
+
+def test_out_of_order_timestamps_stay_searchable():
+    buf = RingBuffer(4)
+    for ts in (1.0, 3.0, 2.0):
+        buf.append(ts, ts)
+
+    assert buf.range(3.0, None)[0].tolist() == [3.0, 3.0]
+
+
+def test_buckets_keep_extremes():
+    history = _history([(float(i), 100.0 if i == 37 else 1.0) for i in range(100)])
+
+    result = history.query("altitude", max_points=10)
+
+    assert result["points"] == 10 and result["count"] == 100
+    assert max(result["max"]) == 100.0
+    assert min(result["min"]) == 1.0
+
+
+def test_lttb_picks_real_samples_and_keeps_endpoints_and_peaks():
+    samples = [(float(i), math.sin(i / 10.0) + (5.0 if i == 250 else 0.0)) for i in range(1000)]
+    history = _history(samples, capacity=1000)
+
+    result = history.query("altitude", max_points=50, method="lttb")
+
+    assert result["points"] == 50
+    assert result["t"][0] == 0.0 and result["t"][-1] == 999.0
+    assert 250.0 in result["t"]
+    raw = dict(samples)
+    assert all(raw[t] == v for t, v in zip(result["t"], result["value"]))
+
+
+def test_non_finite_values_are_skipped():
+    history = TelemetryHistory(["altitude", "speed"])
+
+    added = history.record({"altitude": "nan", "speed": float("inf")}, 1.0)
+    added += history.record({"altitude": "12.5", "speed": True}, 2.0)
+
+    assert added == 1
+    assert history.stats() == {"altitude": 1, "speed": 0}
+
+
+def test_unknown_method_and_field():
+    history = _history([(1.0, 1.0)])
+
+    with pytest.raises(ValueError):
+        history.query("altitude", method="spline")
+    with pytest.raises(KeyError):
+        history.query("heading")
@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+
+from ingest import IngestStage
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def test_corrupt_spill_files_are_skipped(tmp_path):
+    # left behind by a previous process: one truncated, one valid
+    (tmp_path / "1.000000-a.spill").write_bytes(b"not a spill file")
+    (tmp_path / "2.000000-b.spill").write_bytes(b"2.0\ndrone/status\n{}")
+    handled = []
+    stage = IngestStage("t", lambda topic, raw, ts: handled.append((topic, raw, ts)), policy="spill", spill_dir=str(tmp_path))
+
+    stage.start()
+    _wait_for(lambda: stage.stats()["spill_depth"] == 0 and stage.stats()["processed"] == 1)
+    stage.stop()
+
+    assert handled == [("drone/status", b"{}", 2.0)]
+    assert stage.stats()["spill_errors"] == 1
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".spill")]
+
+
+def test_spill_keeps_arrival_order(tmp_path):
+    release = threading.Event()
+    handled = []
+
+    def handler(topic, raw, ts):
+        release.wait()
+        handled.append(int(raw))
+
+    stage = IngestStage("t", handler, maxsize=2, policy="spill", spill_dir=str(tmp_path))
+    stage.start()
+    for i in range(8):
+        assert stage.submit("drone/status", str(i).encode(), float(i))
+    assert stage.stats()["spilled"] > 0
+    release.set()
+    _wait_for(lambda: len(handled) == 8)
+    stage.stop()
+
+    assert handled == list(range(8))
+
+
+def test_spill_is_bounded(tmp_path):
+    stage = IngestStage("t", lambda *item: None, maxsize=1, policy="spill", spill_dir=str(tmp_path), spill_max_bytes=100)
+    results = [stage.submit("drone/status", b"x" * 40, float(i)) for i in range(5)]
+
+    assert results[0] and not all(results)
+    assert stage.stats()["spill_bytes"] <= 100
+
+
+def test_unreadable_spill_file_is_counted(tmp_path):
+    (tmp_path / "1.000000-a.spill").mkdir()
+    stage = IngestStage("t", lambda *item: None, policy="spill", spill_dir=str(tmp_path))
+
+    stage.start()
+    _wait_for(lambda: stage.stats()["spill_errors"] == 1)
+    stage.stop()
+
+    assert stage.stats()["processed"] == 0
+
+
+def test_leftover_spill_is_adopted_only_on_start(tmp_path):
+    (tmp_path / "1.000000-a.spill").write_bytes(b"1.0\ndrone/status\n{}")
+    handled = []
+    stage = IngestStage("t", lambda topic, raw, ts: handled.append(ts), policy="spill", spill_dir=str(tmp_path))
+
+    # a worker that never starts its stages (not the ingest leader) leaves the file alone
+    assert stage.stats()["spill_depth"] == 0
+
+    stage.start()
+    _wait_for(lambda: handled == [1.0])
+    stage.stop()
@@ -0,0 +1,111 @@
+import time
+import threading
+
+import state
+from journal import Journal
+
+
+class FakeState:
+    """Stands in for state.py: mutates first, then notifies the journal."""
+
+    def __init__(self):
+        self.status = {}
+        self.logs = []
+        self.seq = 0
+        self.journal = None
+
+    def checkpoint(self):
+        return dict(self.status), None, list(self.logs), self.seq
+
+    def log(self, message):
+        entry = {"message": message, "seq": self.seq}
+        self.seq += 1
+        self.logs.append(entry)
+        self.journal.record_state("log", entry)
+
+    def clear(self):
+        self.logs = []
+        self.journal.record_state("log_clear", None)
+
+    def update(self, changes):
+        self.status.update(changes)
+        self.journal.record_state("status", changes)
+
+
+def _journal(tmp_path, fake, **kwargs):
+    fake.journal = Journal(str(tmp_path), checkpoint_interval=3600, checkpoint_provider=fake.checkpoint, **kwargs)
+    return fake.journal
+
+
+def _messages(restored):
+    return [entry["message"] for entry in restored["logs"]]
+
+
+def test_restore_does_not_repeat_logs_in_the_checkpointed_batch(tmp_path):
+    fake = FakeState()
+    journal = _journal(tmp_path, fake)
+    fake.log("a")
+    fake.log("b")
+    fake.update({"battery_percent": 50})
+    journal.close()
+
+    restored = Journal(str(tmp_path)).restore()
+
+    assert _messages(restored) == ["a", "b"]
+    assert restored["status"] == {"battery_percent": 50}
+
+
+def test_restore_replays_clear_after_checkpoint(tmp_path):
+    fake = FakeState()
+    journal = _journal(tmp_path, fake)
+    fake.log("a")
+    fake.log("b")
+    journal.flush()
+    fake.clear()
+    fake.log("c")
+    journal.close()
+
+    assert _messages(Journal(str(tmp_path)).restore()) == ["c"]
+
+
+def test_restore_across_segment_rotation(tmp_path):
+    fake = FakeState()
+    journal = _journal(tmp_path, fake, segment_bytes=300)
+    for i in range(20):
+        fake.log(f"m{i}")
+        journal.flush()
+    journal.close()
+
+    reopened = Journal(str(tmp_path))
+    assert len(reopened.segments) > 1
+    assert _messages(reopened.restore()) == [f"m{i}" for i in range(20)]
+
+
+def test_concurrent_writers_restore_the_live_state(tmp_path, monkeypatch):
+    journal = Journal(
+        str(tmp_path),
+        checkpoint_interval=3600,
+        checkpoint_provider=lambda: (dict(state.get_status()), None, [], state.backend.log_seq()),
+    )
+
+    def slow_listener(kind, data):
+        time.sleep(0.0005)  # widen the window between the change and its record
+        journal.record_state(kind, data)
+
+    monkeypatch.setattr(state, "_listeners", [slow_listener])
+
+    def writer(offset):
+        for i in range(100):
+            state.update_status({"altitude": float(offset + i), "speed": float(offset)})
+
+    threads = [threading.Thread(target=writer, args=(n * 1000,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    journal.close()
+
+    restored = Journal(str(tmp_path)).restore()
+    live = state.get_status()
+    assert restored["status"]["altitude"] == live["altitude"]
+    assert restored["status"]["speed"] == live["speed"]
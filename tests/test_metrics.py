@@ -0,0 +1,32 @@
+import pytest
+
+import app as webapp
+import metrics
+
+
+def test_histogram_buckets_are_cumulative():
+    hist = metrics.Histogram("test_seconds", "test", ("kind",))
+    for value in (0.0001, 0.002, 0.5):
+        hist.observe(value, "a")
+
+    lines = "\n".join(hist.render())
+
+    assert 'test_seconds_count{kind="a"} 3' in lines
+    assert 'test_seconds_bucket{kind="a",le="+Inf"} 3' in lines
+
+
+def test_metrics_need_login_without_token(client):
+    anonymous = webapp.app.test_client()
+
+    assert anonymous.get("/metrics").status_code in (302, 401)
+    assert client.get("/metrics").status_code == 200
+
+
+def test_metrics_token_is_required_when_set(monkeypatch):
+    monkeypatch.setitem(webapp.app.config, "METRICS_TOKEN", "s3cret")
+    scraper = webapp.app.test_client()
+
+    assert scraper.get("/metrics").status_code == 401
+    response = scraper.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert b"dron_http_request_seconds" in response.data
@@ -0,0 +1,73 @@
+import pytest
+
+import state
+from mission import MissionStore
+
+ROUTE = {
+    "name": "line",
+    "waypoints": [
+        {"lat": 50.0, "lng": 19.0, "alt": 30},
+        {"lat": 50.0, "lng": 19.01, "alt": 30},
+        {"lat": 50.0, "lng": 19.02, "alt": 30},
+    ],
+}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MissionStore(str(tmp_path / "missions.json"))
+
+
+def test_progress_along_the_route(store):
+    plan = store.create(ROUTE)
+    store.activate(plan.id, "d1")
+
+    progress = store.progress("d1", {"gps_lat": 50.0, "gps_lon": 19.015})
+
+    assert progress["mission"] == plan.id
+    assert progress["leg"] == 1
+    assert progress["next_waypoint"] == 2
+    assert progress["distance_to_route_m"] < 1.0
+    assert progress["remaining_m"] == pytest.approx(plan.total_m / 4, rel=0.01)
+
+
+def test_progress_is_cached_until_the_position_changes(store):
+    plan = store.create(ROUTE)
+    store.activate(plan.id, "d1")
+
+    first = store.progress("d1", {"gps_lat": 50.0, "gps_lon": 19.005})
+
+    assert store.progress("d1", {"gps_lat": 50.0, "gps_lon": 19.005}) is first
+    assert store.progress("d1", {"gps_lat": 50.0, "gps_lon": 19.006}) is not first
+
+
+@pytest.mark.parametrize("status", [
+    None,
+    {},
+    {"gps_lat": None, "gps_lon": 19.0},
+    {"gps_lat": 0.0, "gps_lon": 0.0},
+])
+def test_no_progress_without_a_fix(store, status):
+    store.activate(store.create(ROUTE).id, "d1")
+
+    assert store.progress("d1", status) is None
+
+
+def test_no_progress_without_an_active_plan(store):
+    assert store.progress("d1", {"gps_lat": 50.0, "gps_lon": 19.0}) is None
+
+
+def test_activate_rejects_an_invalid_vehicle(client):
+    response = client.post("/api/mission/active", json={"vehicle": "bad id!", "mission": None})
+
+    assert response.status_code == 400
+
+
+def test_distance_is_null_without_a_fix(client):
+    mission = client.post("/api/mission", json=ROUTE).get_json()["mission"]
+    state.update_status({"gps_lat": 0.0, "gps_lon": 0.0})
+
+    response = client.get(f"/api/mission/{mission['id']}/distance")
+
+    assert response.status_code == 200
+    assert response.get_json() is None
@@ -0,0 +1,53 @@
+import json
+import struct
+
+import pytest
+
+from normalizer import DEFAULT_SCHEMA, TelemetryNormalizer, encoding_for_content_type, split_encoding
+
+
+def test_encoding_from_topic_suffix_and_content_type():
+    assert split_encoding("drone/pose/struct") == ("drone/pose", "struct")
+    assert split_encoding("drone/status") == ("drone/status", "json")
+    assert encoding_for_content_type("application/x-msgpack; charset=binary") == "msgpack"
+    assert encoding_for_content_type("text/plain") is None
+
+
+def test_ros2_string_payload_is_unwrapped():
+    inner = json.dumps({"alt": 12.5, "battery": "87"})
+    decoded = TelemetryNormalizer(DEFAULT_SCHEMA).decode(json.dumps({"data": inner}).encode())
+
+    assert decoded.structured == {"alt": 12.5, "battery": "87"}
+
+
+def test_aliases_types_and_gps_string():
+    normalizer = TelemetryNormalizer(DEFAULT_SCHEMA)
+
+    updates = normalizer.extract("drone/status", {"alt": 10, "battery": "55.5", "lat": "52.1", "lon": 21.0, "mode": 3})
+
+    assert updates == {
+        "altitude": 10,
+        "battery_percent": 55.5,
+        "gps_lat": 52.1,
+        "gps_lon": 21.0,
+        "gps_global": "52.1,21.0",
+        "flight_mode": "3",
+    }
+
+
+def test_struct_pose_layout():
+    raw = struct.pack("<dddfff", 1.0, 52.0, 21.0, 100.0, 5.0, 90.0)
+
+    decoded = TelemetryNormalizer(DEFAULT_SCHEMA).decode(raw, "struct", "drone/pose")
+
+    assert decoded.payload["lat"] == 52.0 and decoded.payload["heading"] == 90.0
+
+
+@pytest.mark.parametrize("encoding, module, dumps", [("msgpack", "msgpack", "packb"), ("cbor", "cbor2", "dumps")])
+def test_binary_encodings(encoding, module, dumps):
+    codec = pytest.importorskip(module)
+    raw = getattr(codec, dumps)({"alt": 7.0, "image": b"\xff\xd8"})
+
+    decoded = TelemetryNormalizer(DEFAULT_SCHEMA).decode(raw, encoding)
+
+    assert decoded.payload == {"alt": 7.0, "image": b"\xff\xd8"}
@@ -0,0 +1,54 @@
+import time
+import logging
+
+import pytest
+
+from journal import Journal
+from replay import ReplayManager, ReplaySession
+
+
+def _source(*topics):
+    return iter([(float(i), topic, b"{}") for i, topic in enumerate(topics)])
+
+
+def test_stage_errors_are_counted_and_logged(caplog):
+    def handle(topic, raw, ts):
+        if topic == "bad":
+            raise ValueError("broken payload")
+
+    session = ReplaySession(_source("ok", "bad", "ok"), [("handle", handle)], speed=0)
+
+    with caplog.at_level(logging.ERROR, logger="replay"):
+        stats = session.run()
+
+    assert stats["messages"] == 3 and stats["errors"] == 1
+    assert "stage handle failed on bad" in caplog.text
+    assert "broken payload" in caplog.text
+
+
+def test_replayed_state_changes_are_not_journaled(tmp_path):
+    journal = Journal(str(tmp_path))
+    journal.record_mqtt("drone/status", b'{"battery": 10}', 1.0)
+    journal.flush()
+
+    def handle(topic, raw, ts):
+        journal.record_state("status", {"battery_percent": 10})
+
+    manager = ReplayManager(lambda: journal, [("handle", handle)])
+    manager.start(speed=0)
+    deadline = time.monotonic() + 5
+    while manager.status()["running"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    journal.record_state("status", {"battery_percent": 99})  # live, other thread
+    journal.close()
+
+    records = list(Journal(str(tmp_path)).iter_records(kinds="s"))
+    assert [r["u"] for r in records] == [{"battery_percent": 99}]
+    assert journal.stats()["suppressed"] == 1
+
+
+@pytest.mark.parametrize("speed", [-1, "nan", "fast"])
+def test_replay_api_rejects_bad_speed(client, speed):
+    response = client.post("/api/replay", json={"speed": speed})
+
+    assert response.status_code == 400
@@ -0,0 +1,43 @@
+import os
+import time
+
+from image_store import ImageStore
+from retention import RetentionEngine
+
+
+def _fill(store, count, size=100):
+    names = []
+    for i in range(count):
+        meta = store.save(bytes([i]) * size, extra={"timestamp": f"2026-01-01T00:00:{i:02d}+00:00"})
+        names.append(meta["filename"])
+    deadline = time.monotonic() + 5.0
+    while store.stats()["pending"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return names
+
+
+def test_quota_evicts_oldest_down_to_the_low_water_mark(tmp_path):
+    store = ImageStore(str(tmp_path), workers=1)
+    retention = RetentionEngine(store, quota_bytes=1000, batch_size=1)
+    names = _fill(store, 12)
+
+    retention.sweep()
+
+    # 1200 bytes against a 1000 byte quota: down to 900, oldest first
+    assert store.stats()["bytes"] <= 900
+    assert {meta["filename"] for meta in store.list()} == set(names[3:])
+    assert not any(os.path.exists(tmp_path / name) for name in names[:3])
+    assert retention.counters["evicted_quota"] == 3
+    store.shutdown()
+
+
+def test_under_quota_nothing_is_evicted(tmp_path):
+    store = ImageStore(str(tmp_path), workers=1)
+    retention = RetentionEngine(store, quota_bytes=10_000)
+    _fill(store, 5)
+
+    retention.sweep()
+
+    assert store.stats()["images"] == 5
+    assert retention.counters["evicted_quota"] == 0
+    store.shutdown()
@@ -0,0 +1,69 @@
+from track import TrackStore, douglas_peucker
+
+
+def _zigzag(store, points=range(600), vehicle="v"):
+    # ~11 m steps north with a 2 m sideways wiggle every point and a 200 m jog every 100
+    for i in points:
+        lon = 21.0 + (0.000028 if i % 2 else 0.0) + (0.003 if (i // 100) % 2 else 0.0)
+        store.record(vehicle, 52.0 + i * 0.0001, lon, 100.0, 1000.0 + i)
+
+
+def test_douglas_peucker_drops_collinear_points_and_keeps_corners():
+    xs = [0, 1, 2, 3, 4, 4, 4]
+    ys = [0, 0, 0, 0, 0, 1, 2]
+
+    assert douglas_peucker(xs, ys, 0.1) == [0, 4, 6]
+
+
+def test_coarser_zoom_keeps_fewer_points_but_the_endpoints():
+    store = TrackStore(zoom_levels=(10, 14))
+    _zigzag(store)
+
+    full = store.query("v")
+    fine = store.query("v", zoom=14)
+    coarse = store.query("v", zoom=10)
+
+    assert full["points"] == 600
+    assert coarse["points"] < fine["points"] < full["points"]
+    assert coarse["segments"][0][0] == full["segments"][0][0]
+    assert coarse["segments"][0][-1] == full["segments"][0][-1]
+
+
+def test_incremental_fetch_matches_full_query():
+    store = TrackStore(zoom_levels=(14,))
+    _zigzag(store, range(300))
+    first = store.query("v", zoom=14)["segments"][0]
+    cursor = store.query("v", zoom=14)["next"]
+
+    _zigzag(store, range(300, 600))
+    update = store.query("v", zoom=14, since=cursor)
+
+    # the client keeps its points up to the anchor and replaces the old tail
+    rebuilt = first[:first.index(update["anchor"]) + 1] + update["committed"] + update["tail"]
+    assert rebuilt == store.query("v", zoom=14)["segments"][0]
+
+
+def test_no_fix_and_gaps_start_new_flights():
+    store = TrackStore(flight_gap=60)
+
+    assert not store.record("v", 0.0, 0.0, ts=1.0)
+    store.record("v", 52.0, 21.0, ts=1.0)
+    store.record("v", 52.001, 21.0, ts=2.0)
+    store.record("v", 52.002, 21.0, ts=500.0)
+
+    flights = store.flights("v")
+    assert len(flights) == 2 and [f["points"] for f in flights] == [2, 1]
+
+
+def test_track_api_rejects_since_below_minus_one(client):
+    assert client.get("/api/track?since=-5").status_code == 400
+
+
+def test_negative_since_is_clamped_in_the_store():
+    store = TrackStore()
+    for i in range(3):
+        store.record("v", 52.0 + i * 0.001, 21.0, ts=float(i))
+
+    result = store.query("v", since=-7)
+
+    assert [p[0] for p in result["committed"]] == [52.0, 52.001, 52.002]
@@ -0,0 +1,196 @@
+import os
+import time
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from startup import lazy_import
+
+__all__ = ["DerivativeCache", "SIZES", "DERIVED_DIR"]
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels per derivative size
+SIZES = {"thumb": 160, "medium": 640}
+
+# Lives inside the upload folder; the leading dot keeps ImageStore from indexing it
+DERIVED_DIR = ".derived"
+
+
+class DerivativeCache:
+    """Thumbnails and previews generated once per image, kept on disk and in an LRU.
+
+    Lookups go memory -> disk -> generate. Generation runs on a small pool;
+    concurrent requests for the same derivative share one future.
+    """
+
+    def __init__(
+        self,
+        store,
+        sizes: Optional[Dict[str, int]] = None,
+        max_bytes: int = 32 * 1024 * 1024,
+        workers: int = 2,
+        quality: int = 80,
+    ):
+        self.store = store
+        self.sizes = dict(sizes or SIZES)
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.folder = os.path.join(store.folder, DERIVED_DIR)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="image-derive")
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[Tuple[str, str], Future] = {}
+
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "generated": 0,
+            "evicted": 0,
+            "errors": 0,
+            "generate_ms": 0.0,
+        }
+
+        for size in self.sizes:
+            os.makedirs(os.path.join(self.folder, size), exist_ok=True)
+
+    def _path(self, filename: str, size: str) -> str:
+        return os.path.join(self.folder, size, os.path.splitext(filename)[0] + ".jpg")
+
+    # --------------------------------------------------
+    # LRU
+    # --------------------------------------------------
+    def _remember(self, key: Tuple[str, str], data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._lru.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._lru[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._lru.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.counters["evicted"] += 1
+
+    # --------------------------------------------------
+    # GENERATION
+    # --------------------------------------------------
+    def _generate(self, filename: str, size: str) -> bytes:
+        started = time.perf_counter()
+        key = (filename, size)
+        try:
+            path = self._path(filename, size)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                with self._lock:
+                    self.counters["disk_hits"] += 1
+            except FileNotFoundError:
+                source = self.store.read_bytes(filename)
+                if source is None:
+                    raise FileNotFoundError(filename)
+                edge = self.sizes[size]
+                with lazy_import("PIL.Image").open(BytesIO(source)) as img:
+                    img.draft("RGB", (edge, edge))  # cheap JPEG downscale while decoding
+                    img.thumbnail((edge, edge))
+                    if img.mode not in ("RGB", "L"):
+                        img = img.convert("RGB")
+                    out = BytesIO()
+                    img.save(out, "JPEG", quality=self.quality)
+                data = out.getvalue()
+                tmp = f"{path}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+                with self._lock:
+                    self.counters["generated"] += 1
+                    self.counters["generate_ms"] += (time.perf_counter() - started) * 1000
+            self._remember(key, data)
+            return data
+        except FileNotFoundError:
+            raise
+        except Exception:
+            with self._lock:
+                self.counters["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _submit(self, filename: str, size: str) -> Future:
+        key = (filename, size)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._executor.submit(self._generate, filename, size)
+                self._inflight[key] = future
+        return future
+
+    def prefetch(self, meta: Dict[str, Any]) -> None:
+        """ImageStore listener: build every size for a freshly written image."""
+        for size in self.sizes:
+            self._submit(meta["filename"], size).add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(future: Future) -> None:
+        if future.exception() is not None:
+            logger.warning(f"[THUMBS] eager generation failed: {future.exception()}")
+
+    # --------------------------------------------------
+    # READS
+    # --------------------------------------------------
+    def get(self, filename: str, size: str, timeout: float = 10.0) -> Optional[bytes]:
+        """Derivative bytes, generating on first use; None if the source image is missing."""
+        if size not in self.sizes:
+            raise ValueError(f"Unknown size: {size}")
+        key = (filename, size)
+        with self._lock:
+            data = self._lru.get(key)
+            if data is not None:
+                self._lru.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return data
+        try:
+            return self._submit(filename, size).result(timeout)
+        except FileNotFoundError:
+            return None
+
+    def forget(self, filenames: Iterable[str]) -> None:
+        """Drop the derivatives of deleted images from memory and disk."""
+        for filename in filenames:
+            for size in self.sizes:
+                with self._lock:
+                    data = self._lru.pop((filename, size), None)
+                    if data is not None:
+                        self._bytes -= len(data)
+                try:
+                    os.remove(self._path(filename, size))
+                except OSError:
+                    pass
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+            self._bytes = 0
+        for size in self.sizes:
+            shutil.rmtree(os.path.join(self.folder, size), ignore_errors=True)
+            os.makedirs(os.path.join(self.folder, size), exist_ok=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.counters,
+                "generate_ms": round(self.counters["generate_ms"], 3),
+                "cached": len(self._lru),
+                "cached_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "inflight": len(self._inflight),
+                "sizes": self.sizes,
+            }
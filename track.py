@@ -0,0 +1,400 @@
+import os
+import math
+import time
+import threading
+from array import array
+from bisect import bisect_right
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+__all__ = ["Flight", "TrackStore", "track_store", "douglas_peucker", "meters_per_pixel"]
+
+EARTH_RADIUS_M = 6371008.8
+# Web Mercator ground resolution at the equator for zoom 0 (256 px tiles)
+_EQUATOR_M_PER_PX = 156543.03392
+
+BBox = Tuple[float, float, float, float]  # min_lon, min_lat, max_lon, max_lat
+
+
+def meters_per_pixel(zoom: float, lat: float = 0.0) -> float:
+    return _EQUATOR_M_PER_PX * math.cos(math.radians(lat)) / (2 ** zoom)
+
+
+def douglas_peucker(xs: Sequence[float], ys: Sequence[float], tolerance: float) -> List[int]:
+    """Indices (into xs/ys) kept by Douglas-Peucker; iterative, endpoints always kept."""
+    n = len(xs)
+    if n <= 2:
+        return list(range(n))
+    keep = bytearray(n)
+    keep[0] = keep[n - 1] = 1
+    tol2 = tolerance * tolerance
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        x0, y0 = xs[first], ys[first]
+        dx, dy = xs[last] - x0, ys[last] - y0
+        seg2 = dx * dx + dy * dy
+        worst, worst_d2 = -1, tol2
+        for i in range(first + 1, last):
+            px, py = xs[i] - x0, ys[i] - y0
+            if seg2 > 0.0:
+                # squared distance to the segment (clamped to its endpoints)
+                t = (px * dx + py * dy) / seg2
+                t = 0.0 if t < 0.0 else 1.0 if t > 1.0 else t
+                ex, ey = px - t * dx, py - t * dy
+            else:
+                ex, ey = px, py
+            d2 = ex * ex + ey * ey
+            if d2 > worst_d2:
+                worst, worst_d2 = i, d2
+        if worst >= 0:
+            keep[worst] = 1
+            stack.append((first, worst))
+            stack.append((worst, last))
+    return [i for i in range(n) if keep[i]]
+
+
+class _Level:
+    """Streaming simplification of one flight for one zoom level.
+
+    New points pass a radial-distance filter into `pending`; every Flight.WINDOW
+    pending points are simplified with Douglas-Peucker against the last
+    committed point and appended to `kept`, which never changes afterwards.
+    """
+
+    __slots__ = ("zoom", "tolerance", "kept", "pending")
+
+    def __init__(self, zoom: int, tolerance: float):
+        self.zoom = zoom
+        self.tolerance = tolerance
+        self.kept = array("L")
+        self.pending = array("L")
+
+
+class Flight:
+    """One continuous track: packed float arrays plus per-zoom simplifications."""
+
+    WINDOW = 128
+
+    def __init__(self, flight_id: int, zoom_levels: Sequence[int], tolerance_px: float, capacity: int):
+        self.id = flight_id
+        self.capacity = capacity
+        self.ts = array("d")
+        self.lat = array("d")
+        self.lon = array("d")
+        self.alt = array("d")
+        # local equirectangular projection (metres), fixed by the first point
+        self._kx = 0.0
+        self._ky = math.radians(1.0) * EARTH_RADIUS_M
+        self._x = array("d")
+        self._y = array("d")
+        self._zoom_levels = sorted(zoom_levels)
+        self._tolerance_px = tolerance_px
+        self.levels: List[_Level] = []
+        self.min_lat = self.min_lon = math.inf
+        self.max_lat = self.max_lon = -math.inf
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    @property
+    def full(self) -> bool:
+        return len(self.ts) >= self.capacity
+
+    def append(self, ts: float, lat: float, lon: float, alt: float) -> None:
+        if not self.ts:
+            self._kx = math.radians(1.0) * EARTH_RADIUS_M * math.cos(math.radians(lat))
+            self.levels = [
+                _Level(z, meters_per_pixel(z, lat) * self._tolerance_px) for z in self._zoom_levels
+            ]
+        index = len(self.ts)
+        self.ts.append(ts)
+        self.lat.append(lat)
+        self.lon.append(lon)
+        self.alt.append(alt)
+        x, y = lon * self._kx, lat * self._ky
+        self._x.append(x)
+        self._y.append(y)
+        self.min_lat, self.max_lat = min(self.min_lat, lat), max(self.max_lat, lat)
+        self.min_lon, self.max_lon = min(self.min_lon, lon), max(self.max_lon, lon)
+
+        for level in self.levels:
+            if not level.kept:
+                level.kept.append(index)
+                continue
+            last = level.pending[-1] if level.pending else level.kept[-1]
+            dx, dy = x - self._x[last], y - self._y[last]
+            if dx * dx + dy * dy < level.tolerance * level.tolerance:
+                continue
+            level.pending.append(index)
+            if len(level.pending) >= self.WINDOW:
+                level.kept.extend(self._simplify(level))
+                level.pending = array("L")
+
+    def _simplify(self, level: _Level) -> List[int]:
+        """Douglas-Peucker over [last kept] + pending; returns new indices (anchor excluded)."""
+        indices = [level.kept[-1]] + level.pending.tolist()
+        xs = [self._x[i] for i in indices]
+        ys = [self._y[i] for i in indices]
+        return [indices[i] for i in douglas_peucker(xs, ys, level.tolerance)[1:]]
+
+    def level_for(self, zoom: Optional[float]) -> Optional[_Level]:
+        """Coarsest level at least as detailed as zoom; None means full resolution."""
+        if zoom is None:
+            return None
+        for level in self.levels:
+            if level.zoom >= zoom:
+                return level
+        return None
+
+    def indices(self, level: Optional[_Level], since: int = -1) -> Tuple[List[int], List[int]]:
+        """(committed, tail) point indices after `since` for a level.
+
+        Committed indices never change; the tail (simplified pending points
+        and the newest raw point) is recomputed on every call.
+        """
+        n = len(self.ts)
+        since = max(since, -1)  # a negative range start would wrap around
+        if level is None:
+            return list(range(since + 1, n)), []
+        kept = level.kept
+        start = bisect_right(kept, since)
+        committed = kept[start:].tolist()
+        tail = self._simplify(level) if level.pending else []
+        last_committed = kept[-1] if kept else -1
+        if n and n - 1 > max(last_committed, tail[-1] if tail else -1):
+            tail.append(n - 1)
+        return committed, tail
+
+    def cursor(self, level: Optional[_Level]) -> int:
+        """Index of the newest point that will not change at this level."""
+        if level is None:
+            return len(self.ts) - 1
+        return level.kept[-1] if level.kept else -1
+
+    def point(self, index: int) -> List[float]:
+        return [round(self.lat[index], 6), round(self.lon[index], 6)]
+
+    def summary(self) -> Dict[str, Any]:
+        n = len(self.ts)
+        return {
+            "id": self.id,
+            "points": n,
+            "start": self.ts[0] if n else None,
+            "end": self.ts[-1] if n else None,
+            "bbox": [self.min_lon, self.min_lat, self.max_lon, self.max_lat] if n else None,
+            "levels": {str(level.zoom): len(level.kept) + len(level.pending) for level in self.levels},
+        }
+
+
+def _timestamp(value: Any) -> Optional[float]:
+    """Epoch seconds of an ISO 8601 last_update, None if absent or unparsable."""
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+def _inside(lat: float, lon: float, bbox: BBox) -> bool:
+    return bbox[0] <= lon <= bbox[2] and bbox[1] <= lat <= bbox[3]
+
+
+class TrackStore:
+    """GPS tracks per vehicle, split into flights.
+
+    A new flight starts after `flight_gap` seconds without a position or when
+    the current one reaches `capacity` points; each vehicle keeps its newest
+    `max_flights` flights. A flight's id is its start time in milliseconds, so
+    workers fed the same positions agree on it.
+    """
+
+    def __init__(
+        self,
+        zoom_levels: Sequence[int] = (6, 10, 14, 17),
+        tolerance_px: float = 1.0,
+        flight_gap: float = 300.0,
+        capacity: int = 100_000,
+        max_flights: int = 20,
+    ):
+        self.zoom_levels = sorted(zoom_levels)
+        self.tolerance_px = tolerance_px
+        self.flight_gap = flight_gap
+        self.capacity = capacity
+        self.max_flights = max_flights
+        self._lock = threading.Lock()
+        self._flights: Dict[str, deque] = {}
+
+    def _current(self, vehicle: str, ts: float) -> Flight:
+        flights = self._flights.get(vehicle)
+        if flights is None:
+            flights = self._flights[vehicle] = deque(maxlen=self.max_flights)
+        flight = flights[-1] if flights else None
+        if flight is None or flight.full or (len(flight) and ts - flight.ts[-1] > self.flight_gap):
+            flight_id = int(ts * 1000)
+            if flights and flight_id <= flights[-1].id:
+                flight_id = flights[-1].id + 1
+            flight = Flight(flight_id, self.zoom_levels, self.tolerance_px, self.capacity)
+            flights.append(flight)
+        return flight
+
+    def record(self, vehicle: str, lat: float, lon: float, alt: float = 0.0, ts: Optional[float] = None) -> bool:
+        """Append a position; (0, 0) is treated as "no fix" and ignored."""
+        if lat == 0.0 and lon == 0.0:
+            return False
+        if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+            return False
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            flight = self._current(vehicle, ts)
+            if len(flight) and flight.lat[-1] == lat and flight.lon[-1] == lon:
+                return False
+            flight.append(ts, lat, lon, alt)
+        return True
+
+    def on_state_change(self, vehicle: str, kind: str, data: Any) -> None:
+        """state.subscribe_fleet listener: picks positions out of status updates."""
+        if kind != "status" or not data:
+            return
+        # normalized MQTT fields, else the raw keys HTTP clients post
+        lat, lon = data.get("gps_lat", data.get("lat")), data.get("gps_lon", data.get("lon"))
+        if lat is None or lon is None:
+            text = data.get("gps_global")
+            if not isinstance(text, str) or "," not in text:
+                return
+            lat, _, lon = text.partition(",")
+        try:
+            lat, lon = float(lat), float(lon)
+            alt = float(data.get("altitude") or 0.0)
+        except (TypeError, ValueError):
+            return
+        # the writer's timestamp, not ours: workers relaying shared state see it later
+        self.record(vehicle, lat, lon, alt, _timestamp(data.get("last_update")))
+
+    def import_file(self, path: str, vehicle: str, interval: float = 1.0) -> int:
+        """Load "lat,lon[,alt]" lines (e.g. data/gps_points.txt) as one flight."""
+        start = time.time() - self.flight_gap * 2
+        count = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.strip().split(",")
+                if len(parts) < 2:
+                    continue
+                try:
+                    values = [float(p) for p in parts[:3]]
+                except ValueError:
+                    continue
+                alt = values[2] if len(values) > 2 else 0.0
+                if self.record(vehicle, values[0], values[1], alt, start + count * interval):
+                    count += 1
+        return count
+
+    def flights(self, vehicle: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [flight.summary() for flight in self._flights.get(vehicle, ())]
+
+    def vehicles(self) -> List[str]:
+        with self._lock:
+            return sorted(self._flights)
+
+    def flight_key(self, vehicle: str) -> Optional[str]:
+        """"<vehicle>-<start epoch>" of the flight in progress (stable across restarts), or None."""
+        with self._lock:
+            flights = self._flights.get(vehicle)
+            flight = flights[-1] if flights else None
+            if flight is None or not len(flight) or time.time() - flight.ts[-1] > self.flight_gap:
+                return None
+            return f"{vehicle}-{int(flight.ts[0])}"
+
+    def _find(self, vehicle: str, flight_id: Optional[int]) -> Optional[Flight]:
+        flights = self._flights.get(vehicle)
+        if not flights:
+            return None
+        if flight_id is None:
+            return flights[-1]
+        for flight in flights:
+            if flight.id == flight_id:
+                return flight
+        return None
+
+    def query(
+        self,
+        vehicle: str,
+        flight_id: Optional[int] = None,
+        zoom: Optional[float] = None,
+        bbox: Optional[BBox] = None,
+        since: Optional[int] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Simplified track for the map.
+
+        Without `since`: "segments" (polylines clipped to bbox, each keeping one
+        point beyond the box on either side). With `since` (a previous "next"):
+        only "committed" points after it plus the provisional "tail" that
+        replaces the previous one, starting from the "anchor" point at `since`.
+        """
+        with self._lock:
+            flight = self._find(vehicle, flight_id)
+            if flight is None:
+                return None
+            level = flight.level_for(zoom)
+            committed, tail = flight.indices(level, -1 if since is None else since)
+            result: Dict[str, Any] = {
+                "vehicle": vehicle,
+                "flight": flight.id,
+                "count": len(flight),
+                "zoom": level.zoom if level is not None else None,
+                "tolerance_m": round(level.tolerance, 3) if level is not None else 0.0,
+                "next": flight.cursor(level),
+            }
+            if since is not None:
+                result["anchor"] = flight.point(since) if 0 <= since < len(flight) else None
+                result["committed"] = [flight.point(i) for i in committed]
+                result["tail"] = [flight.point(i) for i in tail]
+                return result
+
+            indices = committed + tail
+            if bbox is None:
+                segments = [[flight.point(i) for i in indices]] if indices else []
+            else:
+                segments = self._clip(flight, indices, bbox)
+        result["segments"] = segments
+        result["points"] = sum(len(s) for s in segments)
+        return result
+
+    @staticmethod
+    def _clip(flight: Flight, indices: List[int], bbox: BBox) -> List[List[List[float]]]:
+        inside = [_inside(flight.lat[i], flight.lon[i], bbox) for i in indices]
+        segments: List[List[List[float]]] = []
+        current: List[List[float]] = []
+        n = len(indices)
+        for k in range(n):
+            # keep points in the box and their direct neighbours, so lines leave the view
+            near = inside[k] or (k > 0 and inside[k - 1]) or (k + 1 < n and inside[k + 1])
+            if near:
+                current.append(flight.point(indices[k]))
+            elif current:
+                segments.append(current)
+                current = []
+        if current:
+            segments.append(current)
+        return segments
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "vehicles": len(self._flights),
+                "flights": sum(len(f) for f in self._flights.values()),
+                "points": sum(len(flight) for flights in self._flights.values() for flight in flights),
+                "zoom_levels": self.zoom_levels,
+            }
+
+
+track_store = TrackStore(
+    zoom_levels=[int(z) for z in os.getenv("TRACK_ZOOM_LEVELS", "6,10,14,17").split(",") if z.strip()],
+    tolerance_px=float(os.getenv("TRACK_TOLERANCE_PX", "1.0")),
+    flight_gap=float(os.getenv("TRACK_FLIGHT_GAP", "300")),
+    capacity=int(os.getenv("TRACK_MAX_POINTS", "100000")),
+    max_flights=int(os.getenv("TRACK_MAX_FLIGHTS", "20")),
+)
@@ -0,0 +1,109 @@
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Any, Dict, Optional, Tuple
+
+from startup import lazy_import
+
+__all__ = ["sniff_format", "ImageTranscoder", "POLICIES"]
+
+# Transcoding policies:
+#   passthrough - store JPEG/PNG/WebP bytes as received, re-encode anything else
+#   recompress  - always re-encode to JPEG at the configured quality
+#   downscale   - pass through unless larger than max_dimension, then resize + JPEG
+POLICIES = ("passthrough", "recompress", "downscale")
+
+# Formats stored as-is and the extension they get
+PASSTHROUGH_FORMATS = {"jpeg": ".jpg", "png": ".png", "webp": ".webp"}
+
+
+def sniff_format(data: bytes) -> Optional[str]:
+    """Identify an image container from its magic bytes (no decoding)."""
+    if data[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if data[:2] == b"BM":
+        return "bmp"
+    if data[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    return None
+
+
+class ImageTranscoder:
+    """Decides per frame whether to keep the bytes or re-encode them.
+
+    Pass-through frames complete inline on the caller's thread; anything that
+    needs Pillow runs on a small worker pool. Both paths are timed.
+    """
+
+    def __init__(self, policy: str = "passthrough", quality: int = 85, max_dimension: int = 0, workers: int = 2):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown transcode policy: {policy}")
+        self.policy = policy
+        self.quality = quality
+        self.max_dimension = max_dimension
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="image-transcode")
+        self._lock = threading.Lock()
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    def _record(self, path: str, seconds: float) -> None:
+        with self._lock:
+            t = self.timings.setdefault(path, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            ms = seconds * 1000
+            t["count"] += 1
+            t["total_ms"] += ms
+            t["max_ms"] = max(t["max_ms"], ms)
+
+    def _needs_transcode(self, data: bytes, fmt: Optional[str]) -> bool:
+        if self.policy == "recompress" or fmt not in PASSTHROUGH_FORMATS:
+            return True
+        if self.policy == "downscale" and self.max_dimension > 0:
+            # Image.open only parses the header here
+            with lazy_import("PIL.Image").open(BytesIO(data)) as img:
+                return max(img.size) > self.max_dimension
+        return False
+
+    def _transcode(self, data: bytes) -> Tuple[bytes, str]:
+        started = time.perf_counter()
+        with lazy_import("PIL.Image").open(BytesIO(data)) as img:
+            if self.max_dimension > 0 and max(img.size) > self.max_dimension:
+                img.thumbnail((self.max_dimension, self.max_dimension))
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            out = BytesIO()
+            img.save(out, "JPEG", quality=self.quality)
+        self._record("transcode", time.perf_counter() - started)
+        return out.getvalue(), ".jpg"
+
+    def submit(self, data: bytes) -> "Future[Tuple[bytes, str]]":
+        """Return a future of (bytes, extension) ready for the image store."""
+        started = time.perf_counter()
+        fmt = sniff_format(data)
+        try:
+            needs_transcode = self._needs_transcode(data, fmt)
+        except Exception as exc:
+            future: Future = Future()
+            future.set_exception(exc)
+            return future
+
+        if needs_transcode:
+            return self._executor.submit(self._transcode, data)
+
+        future = Future()
+        future.set_result((data, PASSTHROUGH_FORMATS[fmt]))
+        self._record("passthrough", time.perf_counter() - started)
+        return future
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            timings = {
+                path: {**t, "avg_ms": round(t["total_ms"] / t["count"], 4) if t["count"] else 0.0}
+                for path, t in self.timings.items()
+            }
+        return {"policy": self.policy, "max_dimension": self.max_dimension, "timings": timings}